@@ -0,0 +1,596 @@
+"""
+Load generator and benchmark for the echo servers and the chat server.
+
+Like multiconn_client.py it drives many non-blocking connections with a
+selector, but the number of connections, the message size, the send rate
+and the duration are configurable, and the result is printed as JSON:
+
+    python benchmark.py --target=echo --port=65432 --connections=1
+    python benchmark.py --target=multiconn --port=65432 --connections=100
+    python benchmark.py --target=chat --port=8800 --connections=50 --rate=20
+    python benchmark.py --compare-tuning --connections=100 --rate=0
+
+Echo targets send every message back, its round-trip time is measured from
+a timestamp carried by the message. The chat server sends a message to the
+other members of the lobby, so its latency is measured for every delivery.
+With --rate=0 an echo connection sends its next message as soon as the
+previous one is back (closed loop).
+
+--tuning applies a socket tuning profile (socket_tuning.py) to the client
+sockets. --compare-tuning runs a multiconn server in this process, in a
+thread, once per profile, and reports every profile applied to both ends.
+"""
+import argparse  # Parse arguments
+import heapq  # Schedule of the next messages to send
+import json  # Report format
+import selectors  # High-level I/O multiplexing
+import socket  # Provide socket operations and some related functions
+import struct  # Interpret bytes as packed binary data
+import sys  # Report output
+import threading  # Server of the tuning comparison
+import time  # Timestamps
+import types  # Per-connection state
+
+from chat_protocol import BINARY_CODEC, FrameDecoder, MessageType
+from multiconn_server import MultiConnServer
+from socket_tuning import PROFILES, apply_profile, get_profile
+
+TARGETS = ("echo", "multiconn", "chat")
+
+# Sequence number and send time carried by an echo message
+ECHO_HEADER = struct.Struct("!Qd")
+
+# Marks the start of the client text in a chat message
+CHAT_PREFIX_END = "]>>"
+
+
+def percentiles(samples: list, scale: float = 1.0) -> dict:
+    """Return the percentiles of the samples, multiplied by scale"""
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+
+        return round(ordered[index] * scale, 3)
+
+    return {
+        "p50": at(0.5),
+        "p99": at(0.99),
+        "p999": at(0.999),
+        "max": round(ordered[-1] * scale, 3),
+        "mean": round(sum(ordered) / len(ordered) * scale, 3),
+    }
+
+
+class Benchmark:
+    """Run a load test against a server and collect the measurements"""
+
+    def __init__(
+        self,
+        target: str,
+        host: str,
+        port: int,
+        connections: int,
+        message_size: int,
+        rate: float,
+        duration: float,
+        connect_timeout: float = 10.0,
+        drain: float = 2.0,
+        tuning: str = "default",
+    ):
+        if target == "chat" and rate <= 0:
+            raise ValueError("The chat target needs a send rate (--rate)")
+
+        self.target = target
+        self.server_addr = (host, port)
+        self.connections = connections
+        self.message_size = max(message_size, ECHO_HEADER.size)
+        self.rate = rate  # Messages per second and per connection
+        self.duration = duration  # Seconds of sending
+        self.connect_timeout = connect_timeout  # Seconds to connect all
+        self.drain = drain  # Seconds to wait for late replies
+        self.tuning = get_profile(tuning)  # Socket options of the clients
+        self.selector = selectors.DefaultSelector()
+        self.states = []  # Per-connection state
+        self.schedule = []  # Heap of (time of next message, connection id)
+        self.sending = False  # Messages are sent during the send phase only
+        self.started = float("inf")  # Start of the send phase
+        self.connect_times = []  # Seconds to connect and log in
+        self.latencies = []  # Round-trip or delivery times, in seconds
+        self.sent = 0  # Messages sent
+        self.received = 0  # Replies or deliveries received
+        self.bytes_received = 0
+        self.errors = 0  # Connections lost
+        self.ready = 0  # Connections ready to send
+
+    def open_connections(self) -> None:
+        """Start all the connections"""
+        for connid in range(self.connections):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+            apply_profile(sock, self.tuning)
+
+            sock.setblocking(False)
+
+            data = types.SimpleNamespace(
+                connid=connid,
+                sock=sock,
+                started=time.perf_counter(),
+                connected=False,
+                ready=False,
+                seq=0,
+                outb=bytearray(),
+                inb=bytearray(),
+                decoder=FrameDecoder(BINARY_CODEC),
+                in_flight=0,
+            )
+
+            sock.connect_ex(self.server_addr)
+
+            self.selector.register(sock, selectors.EVENT_WRITE, data=data)
+
+            self.states.append(data)
+
+    def close(self, data, error=False) -> None:
+        """Close a connection"""
+        if error:
+            self.errors += 1
+
+        if data.ready:
+            self.ready -= 1
+
+        data.ready = False
+
+        self.selector.unregister(data.sock)
+
+        data.sock.close()
+
+    def set_ready(self, data) -> None:
+        """Record the setup time of a connection"""
+        data.ready = True
+
+        self.ready += 1
+
+        self.connect_times.append(time.perf_counter() - data.started)
+
+    def on_connected(self, data) -> None:
+        """Finish the non-blocking connect"""
+        error = data.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+        if error:
+            self.close(data, error=True)
+
+            return
+
+        data.connected = True
+
+        self.selector.modify(data.sock, selectors.EVENT_READ, data=data)
+
+        if self.target == "chat":
+            # The connection is ready once the server replied to the login
+            self.write(
+                data,
+                BINARY_CODEC.encode(
+                    f"NAME: bench{data.connid}", MessageType.NAME
+                ),
+            )
+
+        else:
+            self.set_ready(data)
+
+    def write(self, data, payload) -> None:
+        """Send data now, keep what the socket does not accept"""
+        data.outb += payload
+
+        self.flush(data)
+
+    def flush(self, data) -> None:
+        """Send pending data, wait for writability if some is left"""
+        try:
+            sent = data.sock.send(data.outb)
+
+        except BlockingIOError:
+            sent = 0
+
+        except OSError:
+            self.close(data, error=True)
+
+            return
+
+        del data.outb[:sent]
+
+        events = selectors.EVENT_READ
+
+        if data.outb:
+            events |= selectors.EVENT_WRITE
+
+        self.selector.modify(data.sock, events, data=data)
+
+    def make_message(self, data) -> bytes:
+        """Build the next message of a connection"""
+        data.seq += 1
+
+        now = time.perf_counter()
+
+        if self.target == "chat":
+            text = f"{data.connid}:{data.seq}:{now!r}:"
+
+            text += "x" * max(0, self.message_size - len(text))
+
+            return BINARY_CODEC.encode(text)
+
+        header = ECHO_HEADER.pack(data.seq, now)
+
+        return header + b"x" * (self.message_size - len(header))
+
+    def send_message(self, data) -> None:
+        """Send the next message of a connection"""
+        data.in_flight += 1
+
+        self.sent += 1
+
+        self.write(data, self.make_message(data))
+
+    def on_readable(self, data) -> None:
+        """Receive replies and measure their latency"""
+        try:
+            recv_data = data.sock.recv(64 * 1024)
+
+        except BlockingIOError:
+            return
+
+        except OSError:
+            recv_data = b""
+
+        if not recv_data:
+            self.close(data, error=self.sending or not data.ready)
+
+            return
+
+        now = time.perf_counter()
+
+        self.bytes_received += len(recv_data)
+
+        if self.target == "chat":
+            self.on_chat_data(data, recv_data, now)
+
+        else:
+            self.on_echo_data(data, recv_data, now)
+
+    def on_echo_data(self, data, recv_data: bytes, now: float) -> None:
+        """Split echoed data into messages"""
+        data.inb += recv_data
+
+        while len(data.inb) >= self.message_size:
+            seq, sent_at = ECHO_HEADER.unpack_from(data.inb)
+
+            del data.inb[: self.message_size]
+
+            self.latencies.append(now - sent_at)
+
+            self.received += 1
+
+            data.in_flight -= 1
+
+            # Closed loop: the next message leaves when the reply is back
+            if self.rate <= 0 and self.sending:
+                self.send_message(data)
+
+    def on_chat_data(self, data, recv_data: bytes, now: float) -> None:
+        """Decode chat frames and measure the delivery of messages"""
+        for msg_type, text in data.decoder.feed(recv_data):
+            if msg_type == MessageType.CLIENT and not data.ready:
+                self.set_ready(data)
+
+                continue
+
+            # Answer the heartbeat of the server
+            if msg_type == MessageType.PING:
+                self.write(data, BINARY_CODEC.encode(text, MessageType.PONG))
+
+                continue
+
+            # Server notifications have no client text
+            _, separator, body = text.partition(CHAT_PREFIX_END)
+
+            if not separator:
+                continue
+
+            try:
+                connid, seq, sent_at, _ = body.split(":", 3)
+
+                sent_at = float(sent_at)
+
+            # Messages of other clients, from the history of the room
+            except ValueError:
+                continue
+
+            # History replayed at login, from before this run
+            if sent_at < self.started:
+                continue
+
+            self.latencies.append(now - sent_at)
+
+            self.received += 1
+
+    def poll(self, timeout: float) -> None:
+        """Wait for events and serve them"""
+        for key, mask in self.selector.select(timeout=timeout):
+            data = key.data
+
+            if not data.connected:
+                self.on_connected(data)
+
+                continue
+
+            if mask & selectors.EVENT_READ:
+                self.on_readable(data)
+
+            if mask & selectors.EVENT_WRITE and data.sock.fileno() != -1:
+                self.flush(data)
+
+    def connect_phase(self) -> None:
+        """Open the connections and wait until they are all ready"""
+        self.open_connections()
+
+        deadline = time.perf_counter() + self.connect_timeout
+
+        while (
+            self.ready + self.errors < self.connections
+            and time.perf_counter() < deadline
+        ):
+            self.poll(timeout=0.05)
+
+    def send_phase(self) -> float:
+        """Send messages for the configured duration, return the end time"""
+        self.sending = True
+
+        start = self.started = time.perf_counter()
+
+        end = start + self.duration
+
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+
+        for data in self.states:
+            if not data.ready:
+                continue
+
+            if interval:
+                # Spread the first messages over one interval
+                offset = interval * data.connid / self.connections
+
+                heapq.heappush(self.schedule, (start + offset, data.connid))
+
+            else:
+                self.send_message(data)
+
+        while True:
+            now = time.perf_counter()
+
+            if now >= end:
+                break
+
+            # Send the messages due by now
+            while self.schedule and self.schedule[0][0] <= now:
+                due, connid = heapq.heappop(self.schedule)
+
+                data = self.states[connid]
+
+                if data.ready:
+                    self.send_message(data)
+
+                    heapq.heappush(self.schedule, (due + interval, connid))
+
+            timeout = self.schedule[0][0] - now if self.schedule else end - now
+
+            self.poll(timeout=max(0.0, min(timeout, end - now)))
+
+        self.sending = False
+
+        return end
+
+    def drain_phase(self) -> None:
+        """Wait for the replies of the messages still in flight"""
+        deadline = time.perf_counter() + self.drain
+
+        expected = self.sent
+
+        if self.target == "chat":
+            # Every message is delivered to the other connections
+            expected = self.sent * max(0, self.ready - 1)
+
+        while self.received < expected and time.perf_counter() < deadline:
+            self.poll(timeout=0.05)
+
+    def run(self) -> dict:
+        """Run the benchmark and return the report"""
+        self.connect_phase()
+
+        start = time.perf_counter()
+
+        self.send_phase()
+
+        self.drain_phase()
+
+        elapsed = time.perf_counter() - start
+
+        report = self.report(elapsed)
+
+        for data in self.states:
+            if data.sock.fileno() != -1:
+                self.close(data)
+
+        self.selector.close()
+
+        return report
+
+    def report(self, elapsed: float) -> dict:
+        """Return the measurements"""
+        return {
+            "target": self.target,
+            "server": "%s:%d" % self.server_addr,
+            "connections": self.connections,
+            "connected": len(self.connect_times),
+            "message_size": self.message_size,
+            "rate": self.rate,
+            "tuning": self.tuning.name,
+            "duration": self.duration,
+            "elapsed": round(elapsed, 3),
+            "messages_sent": self.sent,
+            "messages_received": self.received,
+            "errors": self.errors,
+            "throughput_msgs": round(self.received / elapsed, 1),
+            "throughput_bytes": round(self.bytes_received / elapsed, 1),
+            "connect_ms": percentiles(self.connect_times, 1000),
+            "latency_ms": percentiles(self.latencies, 1000),
+        }
+
+
+def compare_tuning(
+    host: str, connections: int, message_size: int, rate: float, duration: float
+) -> dict:
+    """Benchmark an in-process multiconn server with every tuning profile"""
+    reports = {}
+
+    for name in PROFILES:
+        with MultiConnServer(host=host, port=0, tuning=name) as server:
+            thread = threading.Thread(
+                target=server.serve_forever, kwargs={"poll_interval": 0.1}
+            )
+
+            thread.start()
+
+            try:
+                reports[name] = Benchmark(
+                    target="multiconn",
+                    host=host,
+                    port=server.address[1],
+                    connections=connections,
+                    message_size=message_size,
+                    rate=rate,
+                    duration=duration,
+                    tuning=name,
+                ).run()
+
+            finally:
+                server.shutdown()
+
+                thread.join()
+
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the echo servers and the chat server"
+    )
+    parser.add_argument(
+        "--target",
+        action="store",
+        dest="target",
+        choices=TARGETS,
+        default="echo",
+        help="echo_server.py, multiconn_server.py or chat_server.py",
+    )
+
+    parser.add_argument(
+        "--host", action="store", dest="host", default="127.0.0.1"
+    )
+
+    parser.add_argument(
+        "--port", action="store", dest="port", type=int, default=65432
+    )
+
+    parser.add_argument(
+        "--connections",
+        action="store",
+        dest="connections",
+        type=int,
+        default=10,
+    )
+
+    parser.add_argument(
+        "--message-size",
+        action="store",
+        dest="message_size",
+        type=int,
+        default=64,
+        help="Bytes per message",
+    )
+
+    parser.add_argument(
+        "--rate",
+        action="store",
+        dest="rate",
+        type=float,
+        default=10.0,
+        help="Messages per second per connection, 0 for closed loop (echo)",
+    )
+
+    parser.add_argument(
+        "--duration",
+        action="store",
+        dest="duration",
+        type=float,
+        default=10.0,
+        help="Seconds of sending",
+    )
+
+    parser.add_argument(
+        "--output",
+        action="store",
+        dest="output",
+        default=None,
+        help="Write the JSON report to a file instead of stdout",
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile of the client connections",
+    )
+
+    parser.add_argument(
+        "--compare-tuning",
+        action="store_true",
+        dest="compare_tuning",
+        help="Benchmark an in-process multiconn server with every profile",
+    )
+
+    given_args = parser.parse_args()
+
+    if given_args.compare_tuning:
+        report = compare_tuning(
+            host=given_args.host,
+            connections=given_args.connections,
+            message_size=given_args.message_size,
+            rate=given_args.rate,
+            duration=given_args.duration,
+        )
+
+    else:
+        report = Benchmark(
+            target=given_args.target,
+            host=given_args.host,
+            port=given_args.port,
+            connections=given_args.connections,
+            message_size=given_args.message_size,
+            rate=given_args.rate,
+            duration=given_args.duration,
+            tuning=given_args.tuning,
+        ).run()
+
+    result = json.dumps(report, indent=2)
+
+    if given_args.output:
+        with open(given_args.output, "w") as output:
+            output.write(result + "\n")
+
+    else:
+        sys.stdout.write(result + "\n")
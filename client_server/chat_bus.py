@@ -0,0 +1,118 @@
+"""
+Message bus between the worker processes of a chat server.
+
+Every worker owns a Unix datagram socket bound in a private directory and
+publishes events by sending a datagram to the socket of every other
+worker. A datagram is never split, so an event is delivered whole:
+
+    +----------+------------+-------------------+----------------------+
+    | kind (B) | worker (B) | local clients (I) | room NUL UTF-8 text  |
+    +----------+------------+-------------------+----------------------+
+
+Each event carries the number of clients connected to the sending worker,
+so all workers agree on the total number of clients.
+
+Sockets are non-blocking: a worker never waits for a busy peer, an event
+that does not fit in the peer queue is dropped and counted instead.
+"""
+import os  # Paths of the bus sockets
+import shutil  # Remove the bus directory
+import socket  # Provide socket operations and some related functions
+import struct  # Interpret bytes as packed binary data
+import tempfile  # Private directory for the bus sockets
+from enum import IntEnum
+
+from chat_protocol import pack_room_message, unpack_room_message
+
+# Kind, origin worker and number of its clients
+BUS_HEADER = struct.Struct("!BBI")
+
+# Socket buffer size requested for the bus, it also bounds the event size
+BUS_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class BusEvent(IntEnum):
+    """Kind of event published on the bus"""
+
+    MESSAGE = 1  # Chat message to deliver to every client
+    JOIN = 2  # A client connected, the text is the notification
+    LEAVE = 3  # A client left, the text is the notification
+    NOTICE = 4  # Notification to the members of a room, not kept in history
+
+
+class WorkerBus:
+    """Endpoint of one worker on the bus"""
+
+    def __init__(self, directory: str, worker_id: int, workers: int):
+        self.worker_id = worker_id
+        self.paths = [
+            os.path.join(directory, f"worker-{i}.sock") for i in range(workers)
+        ]
+        self.peers = [
+            path for i, path in enumerate(self.paths) if i != worker_id
+        ]
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, BUS_BUFFER_SIZE
+        )
+        self.sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, BUS_BUFFER_SIZE
+        )
+        self.sock.bind(self.paths[worker_id])
+        self.sock.setblocking(False)
+        self.buffer = bytearray(
+            self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        )  # Preallocated receive buffer
+        self.dropped = 0  # Events a peer could not take
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def publish(self, kind: BusEvent, clients: int, room: str, text: str):
+        """Send an event for the members of a room to all the other workers"""
+        datagram = BUS_HEADER.pack(
+            kind, self.worker_id, clients
+        ) + pack_room_message(room, text).encode("utf-8")
+
+        for path in self.peers:
+            try:
+                self.sock.sendto(datagram, path)
+
+            # The peer queue is full, the peer is gone or the event is too big
+            except OSError:
+                self.dropped += 1
+
+    def receive(self) -> list:
+        """Return the pending events as (kind, worker, clients, room, text)"""
+        events = []
+
+        with memoryview(self.buffer) as view:
+            while True:
+                try:
+                    size = self.sock.recv_into(view)
+
+                except BlockingIOError:
+                    break
+
+                kind, worker_id, clients = BUS_HEADER.unpack_from(view)
+
+                room, text = unpack_room_message(
+                    str(view[BUS_HEADER.size : size], "utf-8")
+                )
+
+                events.append((BusEvent(kind), worker_id, clients, room, text))
+
+        return events
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def create_bus_directory() -> str:
+    """Create the private directory holding the bus sockets"""
+    return tempfile.mkdtemp(prefix="chat-bus-")
+
+
+def remove_bus_directory(directory: str) -> None:
+    """Remove the bus sockets once all the workers are gone"""
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,247 @@
+"""
+Scrollback of the chat rooms.
+
+The last messages of every room are kept as the binary frames that were
+broadcast, so a client joining a room is sent the history as is: the
+frames are queued behind each other and leave in a single vectored write,
+nothing is encoded again (except for legacy pickle clients).
+
+The history of a room is bounded by a number of frames and a number of
+bytes, the oldest frames are forgotten first. It is kept either in memory,
+in a preallocated ring, or for larger windows in an append-only segment
+file per room that is read through mmap, so the frames stay in the page
+cache instead of the heap.
+
+Clients can create any number of rooms, so the history of at most
+HISTORY_ROOMS rooms is kept: the room least recently written to or
+replayed is forgotten first, with its segment file.
+"""
+import mmap  # Read the segment files without copying
+import os  # Segment files
+from collections import OrderedDict, deque
+from urllib.parse import quote
+
+# Default depth of the history of a room
+HISTORY_FRAMES = 50
+HISTORY_BYTES = 64 * 1024
+
+# Rooms whose history is kept, the least recently used is forgotten first
+HISTORY_ROOMS = 1024
+
+
+class HistoryRing:
+    """Last frames of a room, in a preallocated ring"""
+
+    __slots__ = (
+        "frames",
+        "start",
+        "count",
+        "nbytes",
+        "max_frames",
+        "max_bytes",
+    )
+
+    def __init__(self, max_frames=HISTORY_FRAMES, max_bytes=HISTORY_BYTES):
+        self.frames = [None] * max_frames  # Ring of frames
+        self.start = 0  # Slot of the oldest frame
+        self.count = 0  # Number of frames kept
+        self.nbytes = 0  # Size of the frames kept
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, frame: memoryview) -> None:
+        """Keep a frame, forget the oldest ones beyond the bounds"""
+        size = len(frame)
+
+        if size > self.max_bytes:
+            return
+
+        while self.count and (
+            self.count == self.max_frames or self.nbytes + size > self.max_bytes
+        ):
+            self.nbytes -= len(self.frames[self.start])
+
+            self.frames[self.start] = None
+
+            self.start = (self.start + 1) % self.max_frames
+
+            self.count -= 1
+
+        self.frames[(self.start + self.count) % self.max_frames] = frame
+
+        self.count += 1
+
+        self.nbytes += size
+
+    def replay(self) -> list:
+        """Return the frames kept, oldest first"""
+        return [
+            self.frames[(self.start + i) % self.max_frames]
+            for i in range(self.count)
+        ]
+
+    def close(self) -> None:
+        pass
+
+
+class SegmentHistory:
+    """Last frames of a room, in an append-only file read through mmap.
+
+    Frames are appended to the file, the window of the history is an index
+    of (offset, length). Once the frames left out of the window take more
+    room than the window itself, the window is copied to a new file.
+    """
+
+    def __init__(
+        self, path: str, max_frames=HISTORY_FRAMES, max_bytes=HISTORY_BYTES
+    ):
+        self.path = path
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.index = deque()  # (offset, length) of the frames of the window
+        self.nbytes = 0  # Size of the window
+        self.size = 0  # Size of the file
+        self.map = None  # Read-only mapping of the file
+        self.fd = self.open(path)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @staticmethod
+    def open(path: str) -> int:
+        return os.open(
+            path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600
+        )
+
+    def append(self, frame: memoryview) -> None:
+        """Keep a frame, forget the oldest ones beyond the bounds"""
+        size = len(frame)
+
+        if size > self.max_bytes:
+            return
+
+        os.write(self.fd, frame)
+
+        self.index.append((self.size, size))
+
+        self.size += size
+
+        self.nbytes += size
+
+        while len(self.index) > self.max_frames or self.nbytes > self.max_bytes:
+            self.nbytes -= self.index.popleft()[1]
+
+        # Reclaim the space of the forgotten frames
+        if self.index[0][0] > max(self.nbytes, mmap.PAGESIZE):
+            self.compact()
+
+    def compact(self) -> None:
+        """Copy the window to a new file"""
+        start = self.index[0][0]
+
+        window = os.pread(self.fd, self.size - start, start)
+
+        temporary = self.path + ".new"
+
+        fd = self.open(temporary)
+
+        os.write(fd, window)
+
+        os.replace(temporary, self.path)
+
+        os.close(self.fd)
+
+        self.fd = fd
+
+        self.index = deque(
+            (offset - start, size) for offset, size in self.index
+        )
+
+        self.size -= start
+
+        # Frames still queued keep the old mapping alive
+        self.map = None
+
+    def replay(self) -> list:
+        """Return the frames kept, oldest first"""
+        if not self.index:
+            return []
+
+        # Map the file again once it has grown
+        if self.map is None or len(self.map) < self.size:
+            self.map = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+
+        view = memoryview(self.map)
+
+        return [view[offset : offset + size] for offset, size in self.index]
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+        os.unlink(self.path)
+
+
+class RoomHistory:
+    """History of every room"""
+
+    def __init__(
+        self,
+        max_frames=HISTORY_FRAMES,
+        max_bytes=HISTORY_BYTES,
+        directory=None,
+        max_rooms=HISTORY_ROOMS,
+    ):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.directory = directory  # Segment files directory, None in memory
+        self.max_rooms = max_rooms  # Rooms kept, least recently used first out
+        self.rooms = OrderedDict()  # Room names to history, oldest use first
+
+    def append(self, room: str, frame: memoryview) -> None:
+        """Keep a frame broadcast to a room"""
+        history = self.rooms.get(room)
+
+        if history is not None:
+            self.rooms.move_to_end(room)
+
+        else:
+            # Make room for the new one
+            while len(self.rooms) >= self.max_rooms:
+                self.rooms.popitem(last=False)[1].close()
+
+            if self.directory is None:
+                history = HistoryRing(self.max_frames, self.max_bytes)
+
+            else:
+                history = SegmentHistory(
+                    # Room names may hold any character but whitespace
+                    os.path.join(
+                        self.directory, quote(room, safe="") + ".history"
+                    ),
+                    self.max_frames,
+                    self.max_bytes,
+                )
+
+            self.rooms[room] = history
+
+        history.append(frame)
+
+    def replay(self, room: str) -> list:
+        """Return the frames kept for a room, oldest first"""
+        history = self.rooms.get(room)
+
+        if history is None:
+            return []
+
+        self.rooms.move_to_end(room)
+
+        return history.replay()
+
+    def close(self) -> None:
+        for history in self.rooms.values():
+            history.close()
+
+        self.rooms.clear()
@@ -0,0 +1,637 @@
+"""
+Durable log of the chat messages.
+
+The server hands every message to ChatLog.append(), which only puts it on
+a queue. A background thread takes all the queued messages at once,
+writes them with a single writev() and syncs the file to disk at most
+once per fsync interval (group commit), so logging costs the event loop
+no system call.
+
+The log is a directory of segments. Each segment is an append-only file
+of records named after the log position of its first record:
+
+    +-------------+---------------+---------------------------------+
+    | length (!I) | timestamp (d) | room NUL sender NUL UTF-8 text  |
+    +-------------+---------------+---------------------------------+
+
+and a sparse index of (timestamp, position) entries, one every
+INDEX_INTERVAL bytes of records and one for the first record, so a time
+range is found with a binary search instead of reading every segment.
+Timestamps never decrease within a log.
+
+Run as a script to query a log:
+
+    python chat_log.py LOG_DIR --since=2026-10-18T09:00 --room=lobby
+    python chat_log.py LOG_DIR --tail=20 --follow
+"""
+import argparse  # Parse arguments
+import bisect  # Seek by timestamp
+import heapq  # Merge the logs of the worker processes
+import os  # Segment files
+import queue  # Messages waiting for the writer thread
+import struct  # Interpret bytes as packed binary data
+import sys  # Query output
+import threading  # Write off the event loop
+import time  # Timestamps
+from collections import deque
+from datetime import datetime
+
+from chat_outbound import IOV_MAX
+
+# Payload length and timestamp of a record
+RECORD = struct.Struct("!Id")
+
+# Timestamp and segment position of an index entry
+INDEX_ENTRY = struct.Struct("!dQ")
+
+# Separates the room, the sender and the text of a record
+FIELD_SEPARATOR = "\x00"
+
+LOG_SUFFIX = ".log"
+INDEX_SUFFIX = ".index"
+
+# A new segment is started beyond this size
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Bytes of records between two index entries
+INDEX_INTERVAL = 4096
+
+# Seconds between two syncs to disk, 0 to sync every batch
+FSYNC_INTERVAL = 1.0
+
+# Largest number of messages written at once
+MAX_BATCH = 4096
+
+
+def segment_path(directory: str, base: int, suffix: str) -> str:
+    """Return the path of a segment file"""
+    return os.path.join(directory, "%020d%s" % (base, suffix))
+
+
+def list_segments(directory: str) -> list:
+    """Return the base positions of the segments of a log, oldest first"""
+    return sorted(
+        int(name[: -len(LOG_SUFFIX)])
+        for name in os.listdir(directory)
+        if name.endswith(LOG_SUFFIX) and name[: -len(LOG_SUFFIX)].isdigit()
+    )
+
+
+def load_index(directory: str, base: int) -> list:
+    """Return the (timestamp, position) entries of a segment index"""
+    try:
+        with open(segment_path(directory, base, INDEX_SUFFIX), "rb") as index:
+            data = index.read()
+
+    except FileNotFoundError:
+        return []
+
+    # Ignore an entry torn by a crash
+    data = data[: len(data) - len(data) % INDEX_ENTRY.size]
+
+    return list(INDEX_ENTRY.iter_unpack(data))
+
+
+def scan_segment(path: str, start=0) -> iter:
+    """Yield the (timestamp, position, payload) records of a segment.
+
+    The scan stops at the first incomplete record.
+    """
+    with open(path, "rb") as segment:
+        segment.seek(start)
+
+        position = start
+
+        while True:
+            header = segment.read(RECORD.size)
+
+            if len(header) < RECORD.size:
+                return
+
+            length, timestamp = RECORD.unpack(header)
+
+            payload = segment.read(length)
+
+            if len(payload) < length:
+                return
+
+            yield timestamp, position, payload
+
+            position += RECORD.size + length
+
+
+def write_all(fd: int, buffers: list) -> None:
+    """Write buffers to a file with as few writev() calls as possible"""
+    while buffers:
+        chunk = buffers[:IOV_MAX]
+
+        written = os.writev(fd, chunk)
+
+        total = sum(map(len, chunk))
+
+        # Short write, finish it the plain way
+        if written < total:
+            rest = memoryview(b"".join(chunk))[written:]
+
+            while rest:
+                rest = rest[os.write(fd, rest) :]
+
+        buffers = buffers[IOV_MAX:]
+
+
+class ChatLog:
+    """Writer of a segmented chat log, running in a background thread"""
+
+    def __init__(
+        self,
+        directory: str,
+        fsync_interval=FSYNC_INTERVAL,
+        segment_bytes=SEGMENT_BYTES,
+        index_interval=INDEX_INTERVAL,
+    ):
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.fsync_interval = fsync_interval  # Seconds between two syncs
+        self.segment_bytes = segment_bytes  # Size of a segment
+        self.index_interval = index_interval  # Bytes between index entries
+        self.queue = queue.SimpleQueue()  # Messages waiting to be written
+        self.thread = threading.Thread(
+            target=self.run, name="chat-log", daemon=True
+        )
+        self.records = 0  # Records written
+        self.batches = 0  # writev() batches
+        self.fsyncs = 0  # Syncs to disk
+        self.dirty = False  # Data written since the last sync
+        self.last_sync = time.monotonic()
+
+        self.open_last_segment()
+
+    def open_last_segment(self) -> None:
+        """Open the newest segment, cutting a record torn by a crash"""
+        segments = list_segments(self.directory)
+
+        self.base = segments[-1] if segments else 0  # Position of the segment
+
+        path = segment_path(self.directory, self.base, LOG_SUFFIX)
+
+        entries = load_index(self.directory, self.base)
+
+        start, self.last_time = 0, 0.0
+
+        if entries:
+            self.last_time, start = entries[-1]
+
+        self.position = start  # Size of the segment
+
+        if os.path.exists(path):
+            for timestamp, position, payload in scan_segment(path, start):
+                self.last_time = timestamp
+
+                self.position = position + RECORD.size + len(payload)
+
+        # Drop the index entries of the records cut
+        entries = [entry for entry in entries if entry[1] < self.position]
+
+        self.indexed = entries[-1][1] if entries else None  # Last entry
+
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+        os.truncate(self.fd, self.position)
+
+        self.index_fd = os.open(
+            segment_path(self.directory, self.base, INDEX_SUFFIX),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+
+        os.truncate(self.index_fd, len(entries) * INDEX_ENTRY.size)
+
+    def roll(self) -> None:
+        """Close the current segment and start a new one"""
+        self.sync(force=True)
+
+        os.close(self.fd)
+
+        os.close(self.index_fd)
+
+        self.base += self.position
+
+        self.position = 0
+
+        self.indexed = None
+
+        self.fd = os.open(
+            segment_path(self.directory, self.base, LOG_SUFFIX),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+
+        self.index_fd = os.open(
+            segment_path(self.directory, self.base, INDEX_SUFFIX),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def append(self, room: str, sender: str, text: str) -> None:
+        """Log a message, called from the event loop"""
+        self.queue.put((time.time(), room, sender, text))
+
+    def close(self) -> None:
+        """Write the queued messages, sync and stop the writer thread"""
+        self.queue.put(None)
+
+        self.thread.join()
+
+        os.close(self.fd)
+
+        os.close(self.index_fd)
+
+    def take_batch(self, timeout) -> tuple:
+        """Wait for messages, return them and False once the log is closed"""
+        batch = []
+
+        try:
+            item = self.queue.get(timeout=timeout)
+
+            # Take everything queued meanwhile
+            while item is not None:
+                batch.append(item)
+
+                if len(batch) >= MAX_BATCH:
+                    break
+
+                item = self.queue.get_nowait()
+
+            else:
+                return batch, False
+
+        except queue.Empty:
+            pass
+
+        return batch, True
+
+    def write(self, batch: list) -> None:
+        """Write a batch of messages to the log"""
+        buffers = []
+
+        entries = []
+
+        for timestamp, room, sender, text in batch:
+            # Keep the log sorted even if the clock steps back
+            timestamp = self.last_time = max(timestamp, self.last_time)
+
+            payload = FIELD_SEPARATOR.join((room, sender, text)).encode("utf-8")
+
+            size = RECORD.size + len(payload)
+
+            if self.position and self.position + size > self.segment_bytes:
+                self.flush(buffers, entries)
+
+                buffers, entries = [], []
+
+                self.roll()
+
+            if (
+                self.indexed is None
+                or self.position - self.indexed >= self.index_interval
+            ):
+                entries.append(INDEX_ENTRY.pack(timestamp, self.position))
+
+                self.indexed = self.position
+
+            buffers.append(RECORD.pack(len(payload), timestamp))
+
+            buffers.append(payload)
+
+            self.position += size
+
+        self.flush(buffers, entries)
+
+        self.records += len(batch)
+
+    def flush(self, buffers: list, entries: list) -> None:
+        """Write records and their index entries"""
+        if not buffers:
+            return
+
+        write_all(self.fd, buffers)
+
+        if entries:
+            os.write(self.index_fd, b"".join(entries))
+
+        self.batches += 1
+
+        self.dirty = True
+
+    def sync(self, force=False) -> None:
+        """Sync the written data to disk if the interval is over"""
+        if not self.dirty:
+            return
+
+        if (
+            not force
+            and time.monotonic() - self.last_sync < self.fsync_interval
+        ):
+            return
+
+        os.fsync(self.fd)
+
+        os.fsync(self.index_fd)
+
+        self.fsyncs += 1
+
+        self.dirty = False
+
+        self.last_sync = time.monotonic()
+
+    def sync_timeout(self):
+        """Return how long to wait for messages before syncing"""
+        if not self.dirty:
+            return None
+
+        return max(0.0, self.last_sync + self.fsync_interval - time.monotonic())
+
+    def run(self) -> None:
+        running = True
+
+        while running:
+            batch, running = self.take_batch(self.sync_timeout())
+
+            if batch:
+                self.write(batch)
+
+            self.sync(force=not running)
+
+
+def log_directories(directory: str) -> list:
+    """Return the logs of a directory, one per worker process if any"""
+    workers = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith("worker-")
+    )
+
+    return workers or [directory]
+
+
+def decode_record(timestamp: float, payload: bytes) -> tuple:
+    """Return the (timestamp, room, sender, text) of a record"""
+    room, sender, text = str(payload, "utf-8").split(FIELD_SEPARATOR, 2)
+
+    return timestamp, room, sender, text
+
+
+def read_log(directory: str, since=None, until=None, room=None) -> iter:
+    """Yield the (timestamp, room, sender, text) messages of a time range"""
+    segments = list_segments(directory)
+
+    indexes = [load_index(directory, base) for base in segments]
+
+    first = 0
+
+    if since is not None:
+        # Last segment starting before 'since'
+        starts = [entries[0][0] if entries else 0.0 for entries in indexes]
+
+        first = max(0, bisect.bisect_left(starts, since) - 1)
+
+    for base, entries in zip(segments[first:], indexes[first:]):
+        start = 0
+
+        if since is not None and entries:
+            # Last index entry before 'since'
+            times = [timestamp for timestamp, position in entries]
+
+            entry = bisect.bisect_left(times, since) - 1
+
+            if entry >= 0:
+                start = entries[entry][1]
+
+        path = segment_path(directory, base, LOG_SUFFIX)
+
+        for timestamp, position, payload in scan_segment(path, start):
+            if since is not None and timestamp < since:
+                continue
+
+            if until is not None and timestamp > until:
+                return
+
+            record = decode_record(timestamp, payload)
+
+            if room is None or record[1] == room:
+                yield record
+
+
+def tail_log(directory: str, count: int, room=None) -> list:
+    """Return the last messages of a log, oldest first"""
+    messages = deque(maxlen=count)
+
+    segments = list_segments(directory)
+
+    # Scan back from the newest segment until enough messages are found
+    for first in range(len(segments) - 1, -1, -1):
+        messages.clear()
+
+        for base in segments[first:]:
+            path = segment_path(directory, base, LOG_SUFFIX)
+
+            for timestamp, position, payload in scan_segment(path):
+                record = decode_record(timestamp, payload)
+
+                if room is None or record[1] == room:
+                    messages.append(record)
+
+        if len(messages) == count:
+            break
+
+    return list(messages)
+
+
+class LogFollower:
+    """Reader of the messages appended to a log from its creation on"""
+
+    def __init__(self, directory: str, room=None):
+        self.directory = directory
+        self.room = room  # Only messages of this room, all if None
+
+        segments = list_segments(directory)
+
+        self.base = segments[-1] if segments else 0  # Segment being read
+
+        path = self.path
+
+        # Position of the next record in the segment
+        self.position = os.path.getsize(path) if os.path.exists(path) else 0
+
+    @property
+    def path(self) -> str:
+        return segment_path(self.directory, self.base, LOG_SUFFIX)
+
+    def poll(self) -> list:
+        """Return the messages appended since the last call"""
+        messages = []
+
+        while True:
+            self.read_segment(messages)
+
+            # Move on to the next segment once the writer has started it
+            newer = [
+                other
+                for other in list_segments(self.directory)
+                if other > self.base
+            ]
+
+            if not newer:
+                return messages
+
+            # Records may have been written to this segment since the read
+            # above, the writer is done with it once the next one exists
+            self.read_segment(messages)
+
+            self.base, self.position = newer[0], 0
+
+    def read_segment(self, messages: list) -> None:
+        """Append the messages of the current segment up to its end"""
+        if not os.path.exists(self.path):
+            return
+
+        for timestamp, position, payload in scan_segment(
+            self.path, self.position
+        ):
+            self.position = position + RECORD.size + len(payload)
+
+            record = decode_record(timestamp, payload)
+
+            if self.room is None or record[1] == self.room:
+                messages.append(record)
+
+
+def follow_logs(directories, room=None, interval=0.5) -> iter:
+    """Yield the messages appended to logs from now on.
+
+    The messages found in the logs of all the workers at each poll are
+    merged by timestamp.
+    """
+    followers = [LogFollower(directory, room) for directory in directories]
+
+    while True:
+        messages = sorted(
+            message for follower in followers for message in follower.poll()
+        )
+
+        if not messages:
+            time.sleep(interval)
+
+        yield from messages
+
+
+def follow_log(directory: str, room=None, interval=0.5) -> iter:
+    """Yield the messages appended to a log from now on"""
+    return follow_logs([directory], room, interval)
+
+
+def parse_time(value: str) -> float:
+    """Return the timestamp of a Unix time or an ISO 8601 date"""
+    try:
+        return float(value)
+
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def format_record(record: tuple) -> str:
+    timestamp, room, sender, text = record
+
+    when = datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds")
+
+    return f"{when} #{room} [{sender}] {text}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query a chat log")
+    parser.add_argument("directory", help="Log directory of the chat server")
+
+    parser.add_argument(
+        "--since",
+        action="store",
+        dest="since",
+        type=parse_time,
+        default=None,
+        help="Unix time or ISO 8601 date of the first message",
+    )
+
+    parser.add_argument(
+        "--until",
+        action="store",
+        dest="until",
+        type=parse_time,
+        default=None,
+        help="Unix time or ISO 8601 date of the last message",
+    )
+
+    parser.add_argument("--room", action="store", dest="room", default=None)
+
+    parser.add_argument(
+        "--tail",
+        action="store",
+        dest="tail",
+        type=int,
+        default=None,
+        help="Print the last N messages",
+    )
+
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        dest="follow",
+        help="Keep printing new messages",
+    )
+
+    given_args = parser.parse_args()
+
+    directories = log_directories(given_args.directory)
+
+    if given_args.tail is not None:
+        messages = heapq.merge(
+            *(
+                tail_log(directory, given_args.tail, given_args.room)
+                for directory in directories
+            )
+        )
+
+        messages = list(messages)[-given_args.tail :] if given_args.tail else []
+
+    elif given_args.follow:
+        messages = []
+
+    else:
+        messages = heapq.merge(
+            *(
+                read_log(
+                    directory,
+                    given_args.since,
+                    given_args.until,
+                    given_args.room,
+                )
+                for directory in directories
+            )
+        )
+
+    try:
+        for message in messages:
+            sys.stdout.write(format_record(message) + "\n")
+
+        if given_args.follow:
+            sys.stdout.flush()
+
+            for message in follow_logs(directories, given_args.room):
+                sys.stdout.write(format_record(message) + "\n")
+
+                sys.stdout.flush()
+
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
@@ -0,0 +1,237 @@
+"""
+Telemetry of the chat server.
+
+The event loop only bumps counters and records durations in fixed-bucket
+histograms, which costs a clock read and a bisect. Everything else happens
+outside the loop, in daemon threads:
+
+- MetricsEndpoint serves the counters in the Prometheus text format on a
+  local port (GET /metrics), rates are computed by the scraper;
+- StatsReporter writes a summary line with per-second rates to stderr.
+
+Both read server.stats(), a dict of counters and gauges, and the
+server.histograms dict of Histogram objects.
+"""
+import bisect  # Find the bucket of a value
+import sys  # Stats line output
+import threading  # Serve metrics outside the event loop
+import time  # Rates of the stats line
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The endpoint is only reachable from the local host
+METRICS_HOST = "127.0.0.1"
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the duration buckets, in seconds
+DURATION_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+# Type and help of the values returned by server.stats()
+STATS_METRICS = {
+    "clients": ("gauge", "Clients connected to this process"),
+    "total_clients": ("gauge", "Clients connected to all the workers"),
+    "connections": ("counter", "Clients logged in since the start"),
+    "messages_in": ("counter", "Messages received from clients"),
+    "messages_out": ("counter", "Messages queued for clients"),
+    "bytes_in": ("counter", "Bytes received from clients"),
+    "bytes_out": ("counter", "Bytes sent to clients"),
+    "queued_bytes": ("gauge", "Outbound bytes waiting to be sent"),
+    "max_queue_bytes": ("gauge", "Outbound bytes of the fullest queue"),
+    "pending_clients": ("gauge", "Clients with outbound data waiting"),
+    "flushes": ("counter", "Vectored writes to client sockets"),
+    "pending_logins": ("gauge", "Connections waiting for their login name"),
+    "logins_rejected": ("counter", "Connections that failed to log in"),
+    "frames_dropped": ("counter", "Frames refused by full queues"),
+    "clients_evicted": ("counter", "Clients disconnected for being slow"),
+    "clients_timed_out": ("counter", "Clients disconnected for being silent"),
+    "bus_dropped": ("counter", "Bus events the other workers missed"),
+    "log_records": ("counter", "Messages written to the durable log"),
+    "log_fsyncs": ("counter", "Syncs of the durable log to disk"),
+}
+
+# Help of the histograms of server.histograms
+HISTOGRAM_HELP = {
+    "fanout_seconds": "Time to queue a message for the members of a room",
+    "loop_seconds": "Time spent on the events of one event loop iteration",
+}
+
+
+class Histogram:
+    """Count of observed values per bucket, Prometheus style"""
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds=DURATION_BUCKETS):
+        self.bounds = bounds  # Sorted upper bounds of the buckets
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.count = 0  # Number of observations
+        self.total = 0.0  # Sum of the observations
+
+    def observe(self, value: float) -> None:
+        """Record a value"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, fraction: float) -> float:
+        """Return the upper bound of the bucket holding a quantile"""
+        if not self.count:
+            return 0.0
+
+        rank = fraction * self.count
+        seen = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+    def render(self, name: str, help_text: str) -> list:
+        """Return the lines of the histogram in the Prometheus text format"""
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        cumulative = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.total}")
+        lines.append(f"{name}_count {self.count}")
+
+        return lines
+
+
+def render_metrics(server, prefix="chat_") -> str:
+    """Return the metrics of a chat server in the Prometheus text format"""
+    lines = []
+
+    for key, value in server.stats().items():
+        kind, help_text = STATS_METRICS.get(key, ("gauge", key))
+        name = prefix + key
+
+        # Counters are named after their unit, with a _total suffix
+        if kind == "counter":
+            name += "_total"
+
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+
+    for key, histogram in server.histograms.items():
+        lines += histogram.render(prefix + key, HISTOGRAM_HELP.get(key, key))
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsEndpoint:
+    """HTTP endpoint serving the metrics of a server from a thread"""
+
+    def __init__(self, server, port: int, host=METRICS_HOST):
+        chat_server = server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+
+                    return
+
+                body = render_metrics(chat_server).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth a line on the server output
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="metrics", daemon=True
+        )
+
+    @property
+    def address(self) -> tuple:
+        return self.httpd.server_address
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StatsReporter:
+    """Thread writing a stats line of a server to stderr periodically"""
+
+    RATES = ("messages_in", "messages_out", "bytes_in", "bytes_out")
+
+    def __init__(self, server, interval: float, output=sys.stderr):
+        self.server = server
+        self.interval = interval  # Seconds between two lines
+        self.output = output
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="stats", daemon=True
+        )
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def close(self) -> None:
+        self.stopped.set()
+
+    def line(self, stats: dict, previous: dict, elapsed: float) -> str:
+        """Format the stats line of one interval"""
+        fields = [f"clients={stats['clients']}"]
+
+        for key in self.RATES:
+            rate = (stats[key] - previous[key]) / elapsed
+            fields.append(f"{key}={rate:.0f}/s")
+
+        fields.append(f"queued_bytes={stats['queued_bytes']}")
+
+        for key, histogram in self.server.histograms.items():
+            p99 = histogram.quantile(0.99) * 1000
+            fields.append(f"{key.replace('_seconds', '')}_p99<={p99:g}ms")
+
+        return "Chat stats: " + " ".join(fields)
+
+    def run(self) -> None:
+        previous = self.server.stats()
+        last = time.monotonic()
+
+        while not self.stopped.wait(self.interval):
+            stats = self.server.stats()
+            now = time.monotonic()
+
+            self.output.write(self.line(stats, previous, now - last) + "\n")
+            self.output.flush()
+
+            previous, last = stats, now
@@ -0,0 +1,144 @@
+"""
+Outbound queues of the chat server.
+
+A broadcast encodes a frame once and pushes the same read-only buffer on
+the queue of every recipient. Queues are drained when select() reports
+the client socket as writable, so a slow client never stalls the loop.
+
+All the frames queued for a client are written with a single scatter-gather
+sendmsg() call, so a burst of messages costs one system call per client
+instead of one per message. The server can also hold a queue for a short
+latency budget (flush delay) to gather more frames, unless the queue
+already holds the flush threshold.
+
+Every queue is bounded by a number of frames and a number of bytes. When a
+client does not read fast enough its queue reaches the high-water mark and
+the server either drops the new frames or disconnects the client.
+"""
+import os  # System limits
+import socket  # Provide socket operations and some related functions
+import time  # Age of the queued frames
+from collections import deque
+from itertools import islice
+
+# What to do with a client whose queue is full
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+
+# Default high-water marks of a client queue
+MAX_QUEUE_BYTES = 4 * 1024 * 1024
+MAX_QUEUE_FRAMES = 1024
+
+# Queued bytes sent without waiting for the flush delay
+FLUSH_BYTES = 64 * 1024
+
+# Largest number of buffers of a sendmsg() call
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+except (ValueError, OSError):
+    IOV_MAX = 1024
+
+
+class OutboundQueue:
+    """Frames waiting to be written to a single client socket"""
+
+    __slots__ = (
+        "frames",
+        "offset",
+        "nbytes",
+        "max_bytes",
+        "max_frames",
+        "dropped",
+        "peak_bytes",
+        "queued_at",
+    )
+
+    def __init__(self, max_bytes=MAX_QUEUE_BYTES, max_frames=MAX_QUEUE_FRAMES):
+        self.frames = deque()  # Shared read-only frames, oldest first
+        self.offset = 0  # Bytes of the first frame already sent
+        self.nbytes = 0  # Bytes waiting to be sent
+        self.max_bytes = max_bytes  # High-water mark in bytes
+        self.max_frames = max_frames  # High-water mark in frames
+        self.dropped = 0  # Frames refused because the queue was full
+        self.peak_bytes = 0  # Largest amount of bytes ever queued
+        self.queued_at = 0.0  # When the oldest frame was queued
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def is_full(self, size: int) -> bool:
+        """Check if queuing size more bytes crosses a high-water mark"""
+        # An empty queue always accepts a frame, however large it is
+        if not self.frames:
+            return False
+
+        return (
+            len(self.frames) >= self.max_frames
+            or self.nbytes + size > self.max_bytes
+        )
+
+    def push(self, frame: memoryview) -> bool:
+        """Queue a frame to be sent, return False if the queue is full"""
+        if self.is_full(len(frame)):
+            self.dropped += 1
+
+            return False
+
+        if not self.frames:
+            self.queued_at = time.perf_counter()
+
+        self.frames.append(frame)
+
+        self.nbytes += len(frame)
+
+        if self.nbytes > self.peak_bytes:
+            self.peak_bytes = self.nbytes
+
+        return True
+
+    def wait_time(self, now: float, delay: float, threshold: int) -> float:
+        """Return how long the queue may still wait, 0 if it must be sent"""
+        if self.nbytes >= threshold:
+            return 0.0
+
+        return max(0.0, self.queued_at + delay - now)
+
+    def flush(self, channel: socket.socket) -> int:
+        """Send as much queued data as the socket accepts without blocking.
+
+        Return the number of bytes sent. OSError is raised if the peer is
+        gone.
+        """
+        sent_total = 0
+
+        while self.frames:
+            buffers = list(islice(self.frames, IOV_MAX))
+
+            # Slicing a memoryview does not copy the frame
+            if self.offset:
+                buffers[0] = buffers[0][self.offset :]
+
+            try:
+                sent = channel.sendmsg(buffers, (), socket.MSG_DONTWAIT)
+
+            # The socket send buffer is full, wait for the next writability
+            except BlockingIOError:
+                break
+
+            sent_total += sent
+
+            self.nbytes -= sent
+
+            # Drop the frames sent completely
+            remaining = self.offset + sent
+
+            while self.frames and remaining >= len(self.frames[0]):
+                remaining -= len(self.frames.popleft())
+
+            self.offset = remaining
+
+            # Partial send, the rest is sent next time
+            if self.offset or sent < sum(map(len, buffers)):
+                break
+
+        return sent_total
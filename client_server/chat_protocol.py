@@ -0,0 +1,277 @@
+"""
+Wire format of the chat service.
+
+Every message is sent as a single binary frame:
+
+    +---------------+-------------+----------+-------------------+
+    | length (!I)   | version (B) | type (B) | UTF-8 payload ... |
+    +---------------+-------------+----------+-------------------+
+
+'length' is the size of the payload in bytes, so the header always takes
+HEADER.size bytes whatever the platform is.
+
+Old clients pickle every message and prefix it with a native "L" size.
+The pickle codec is kept for them and is only accepted when the server
+allows it: the codec of a connection is detected from its first bytes,
+where the byte at offset 4 is PROTOCOL_VERSION for binary frames only.
+
+Clients talk in named rooms. JOIN and LEAVE frames carry a room name, MSG
+frames carry the room name and the text separated by ROOM_SEPARATOR. Plain
+TEXT frames go to DEFAULT_ROOM, which every client joins at login, so old
+clients keep working.
+
+Either side can send PING, the other answers PONG. The server pings quiet
+clients and disconnects the ones that stay silent, the legacy codec cannot
+carry these frames so its clients are only watched by TCP keepalive.
+
+FrameDecoder parses the byte stream of a non-blocking connection: it is fed
+whatever recv_into() returned and yields every frame completed so far,
+keeping the incomplete tail for the next read.
+"""
+import pickle  # Serialization (legacy codec)
+import socket  # Byte order conversion
+import struct  # Interpret bytes as packed binary data
+from enum import IntEnum
+
+PROTOCOL_VERSION = 1
+
+# Length, version and message type
+HEADER = struct.Struct("!IBB")
+
+# Native size header of the legacy pickle codec (8 bytes on 64-bit Linux)
+LEGACY_HEADER = struct.Struct("L")
+
+# Number of bytes needed to detect the codec of a connection
+SNIFF_SIZE = HEADER.size
+
+# Size of the buffer a connection is read into
+READ_SIZE = 64 * 1024
+
+# Largest payload accepted from a peer
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+# Room joined by every client at login
+DEFAULT_ROOM = "lobby"
+
+# Separates the room name from the text in MSG frames
+ROOM_SEPARATOR = "\x00"
+
+# Longest room name accepted
+MAX_ROOM_NAME = 64
+
+
+class MessageType(IntEnum):
+    """Kind of message carried by a frame"""
+
+    TEXT = 1  # Chat message or server notification
+    NAME = 2  # Login name sent by a client
+    CLIENT = 3  # Login reply with the client address
+    JOIN = 4  # Join the room named by the payload
+    LEAVE = 5  # Leave the room named by the payload
+    MSG = 6  # Message to a room: room name, ROOM_SEPARATOR, text
+    PING = 7  # Heartbeat request, the payload is echoed back
+    PONG = 8  # Heartbeat reply
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends data that is not a valid frame"""
+
+
+class BinaryCodec:
+    """Length-prefixed binary frames with a UTF-8 payload"""
+
+    name = "binary"
+    header = HEADER
+
+    @staticmethod
+    def encode(text: str, msg_type=MessageType.TEXT) -> memoryview:
+        """Return a read-only frame ready to be sent"""
+        payload = text.encode("utf-8")
+
+        # Allocate the whole frame once and write the header in place
+        frame = bytearray(HEADER.size + len(payload))
+
+        HEADER.pack_into(frame, 0, len(payload), PROTOCOL_VERSION, msg_type)
+
+        frame[HEADER.size :] = payload
+
+        return memoryview(frame).toreadonly()
+
+    @staticmethod
+    def decode_header(header) -> tuple[int, MessageType]:
+        """Return the payload length and the message type of a frame"""
+        length, version, msg_type = HEADER.unpack(header)
+
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported protocol version {version}")
+
+        try:
+            return length, MessageType(msg_type)
+
+        except ValueError:
+            raise ProtocolError(f"Unknown message type {msg_type}") from None
+
+    @staticmethod
+    def decode_payload(payload) -> str:
+        """Return the text carried by a frame"""
+        try:
+            return str(payload, "utf-8")
+
+        except UnicodeDecodeError as error:
+            raise ProtocolError(f"Invalid payload: {error}") from None
+
+
+class PickleCodec:
+    """Legacy pickled tuples behind a native size header.
+
+    Unpickling data from the network can execute arbitrary code, so this
+    codec is only meant for trusted old clients.
+    """
+
+    name = "pickle"
+    header = LEGACY_HEADER
+
+    @staticmethod
+    def encode(text: str, msg_type=MessageType.TEXT) -> memoryview:
+        """Return a read-only frame ready to be sent"""
+        # The legacy format does not carry the message type
+        payload = pickle.dumps((text,))
+
+        frame = bytearray(LEGACY_HEADER.size + len(payload))
+
+        LEGACY_HEADER.pack_into(frame, 0, socket.htonl(len(payload)))
+
+        frame[LEGACY_HEADER.size :] = payload
+
+        return memoryview(frame).toreadonly()
+
+    @staticmethod
+    def decode_header(header) -> tuple[int, MessageType]:
+        """Return the payload length and the message type of a frame"""
+        return socket.ntohl(LEGACY_HEADER.unpack(header)[0]), MessageType.TEXT
+
+    @staticmethod
+    def decode_payload(payload) -> str:
+        """Return the text carried by a frame"""
+        try:
+            return pickle.loads(payload)[0]
+
+        except Exception as error:
+            raise ProtocolError(f"Invalid pickle payload: {error}") from None
+
+
+BINARY_CODEC = BinaryCodec()
+PICKLE_CODEC = PickleCodec()
+
+CODECS = {codec.name: codec for codec in (BINARY_CODEC, PICKLE_CODEC)}
+
+
+def sniff_codec(preamble, allow_pickle: bool = False):
+    """Detect the codec of a connection from its first SNIFF_SIZE bytes"""
+    if preamble[4] == PROTOCOL_VERSION:
+        return BINARY_CODEC
+
+    if allow_pickle:
+        return PICKLE_CODEC
+
+    raise ProtocolError("Legacy pickle clients are not allowed")
+
+
+def is_valid_room(room: str) -> bool:
+    """Check that a room name can be used"""
+    return (
+        0 < len(room) <= MAX_ROOM_NAME
+        and ROOM_SEPARATOR not in room
+        and not any(char.isspace() for char in room)
+    )
+
+
+def pack_room_message(room: str, text: str) -> str:
+    """Return the payload of a MSG frame"""
+    return room + ROOM_SEPARATOR + text
+
+
+def unpack_room_message(payload: str) -> tuple[str, str]:
+    """Return the room name and the text of a MSG frame payload"""
+    room, separator, text = payload.partition(ROOM_SEPARATOR)
+
+    if not separator:
+        raise ProtocolError("Room message without a room name")
+
+    return room, text
+
+
+class FrameDecoder:
+    """Incremental decoder of the frames received on one connection"""
+
+    __slots__ = ("codec", "allow_pickle", "max_payload", "buffer")
+
+    def __init__(self, codec=None, allow_pickle=False, max_payload=MAX_PAYLOAD):
+        self.codec = codec  # Detected from the first bytes when None
+        self.allow_pickle = allow_pickle  # Accept the legacy pickle codec
+        self.max_payload = max_payload  # Largest payload accepted
+        self.buffer = bytearray()  # Incomplete frame kept between reads
+
+    def feed(self, data) -> list:
+        """Add received bytes and return the list of (type, text) frames"""
+        frames = []
+
+        if self.buffer:
+            self.buffer += data
+
+            consumed = self.parse(self.buffer, frames)
+
+            del self.buffer[:consumed]
+
+        else:
+            # Parse straight from the received data and keep only the tail
+            consumed = self.parse(data, frames)
+
+            self.buffer += data[consumed:]
+
+        return frames
+
+    def parse(self, data, frames: list) -> int:
+        """Decode the complete frames of data, return the bytes consumed"""
+        consumed = 0
+
+        with memoryview(data) as view:
+            while True:
+                if self.codec is None:
+                    if len(view) - consumed < SNIFF_SIZE:
+                        break
+
+                    self.codec = sniff_codec(
+                        view[consumed : consumed + SNIFF_SIZE],
+                        self.allow_pickle,
+                    )
+
+                header_size = self.codec.header.size
+
+                if len(view) - consumed < header_size:
+                    break
+
+                length, msg_type = self.codec.decode_header(
+                    view[consumed : consumed + header_size]
+                )
+
+                if length > self.max_payload:
+                    raise ProtocolError(f"Frame of {length} bytes is too large")
+
+                end = consumed + header_size + length
+
+                if len(view) < end:
+                    break
+
+                frames.append(
+                    (
+                        msg_type,
+                        self.codec.decode_payload(
+                            view[consumed + header_size : end]
+                        ),
+                    )
+                )
+
+                consumed = end
+
+        return consumed
@@ -0,0 +1,67 @@
+"""
+Room subscriptions of the chat server.
+
+The index maps every room to the set of its member sessions, and every
+session keeps the rooms it belongs to (session.rooms), so a message is
+only fanned out to the members of its room and a client leaving the
+server is removed from its rooms without scanning them all.
+"""
+from chat_protocol import DEFAULT_ROOM
+
+
+def room_prefix(display_name: str, room: str) -> str:
+    """Return the prefix of the messages of a client in a room"""
+    if room == DEFAULT_ROOM:
+        return "\n#[" + display_name + "]>>"
+
+    return "\n#[" + display_name + " #" + room + "]>>"
+
+
+class RoomIndex:
+    """Room to members index, with the member to rooms reverse index"""
+
+    def __init__(self):
+        self.rooms = {}  # Dict, mapping of room names to sets of sessions
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def members(self, room: str) -> set:
+        """Return the sessions subscribed to a room"""
+        return self.rooms.get(room, ())
+
+    def join(self, session, room: str) -> bool:
+        """Subscribe a session to a room, return False if already a member"""
+        if room in session.rooms:
+            return False
+
+        self.rooms.setdefault(room, set()).add(session)
+
+        # Cache the prefix of the messages of the session in this room
+        session.rooms[room] = room_prefix(session.display_name, room)
+
+        return True
+
+    def leave(self, session, room: str) -> bool:
+        """Unsubscribe a session from a room, return False if not a member"""
+        if session.rooms.pop(room, None) is None:
+            return False
+
+        members = self.rooms[room]
+
+        members.discard(session)
+
+        # Forget empty rooms
+        if not members:
+            del self.rooms[room]
+
+        return True
+
+    def leave_all(self, session) -> list:
+        """Unsubscribe a session from all its rooms and return them"""
+        rooms = list(session.rooms)
+
+        for room in rooms:
+            self.leave(session, room)
+
+        return rooms
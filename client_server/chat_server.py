@@ -1,77 +1,722 @@
 """Chat server that can handle several hundred or a large number
 of client connections."""
+import abc  # Methods each engine implements
+import asyncio  # Event loop and stream based networking
+import os  # Fork worker processes
+import resource  # Query and raise process resource limits
 import select  # Support asynchronous I/O on multiple file descriptors
+import selectors  # Event masks of the event loop backends
 import socket  # Provide socket operations and some related functions
 import sys  # Key sensitivity
 import signal  # Set handlers for asynchronous events
-import pickle  # Serialization
-import struct  # Interpret bytes as packed binary data
 import argparse  # Parse arguments
-from typing import Any
+import time  # Measure the event loop
+import traceback  # Report errors of worker processes
+
+from chat_bus import (
+    BusEvent,
+    WorkerBus,
+    create_bus_directory,
+    remove_bus_directory,
+)
+from chat_history import (
+    HISTORY_BYTES,
+    HISTORY_FRAMES,
+    HISTORY_ROOMS,
+    RoomHistory,
+)
+from chat_log import FSYNC_INTERVAL, ChatLog
+from chat_metrics import Histogram, MetricsEndpoint, StatsReporter
+from chat_outbound import (
+    FLUSH_BYTES,
+    MAX_QUEUE_BYTES,
+    MAX_QUEUE_FRAMES,
+    SLOW_CONSUMER_POLICIES,
+    OutboundQueue,
+)
+from chat_protocol import (
+    BINARY_CODEC,
+    CODECS,
+    DEFAULT_ROOM,
+    HEADER,
+    MAX_PAYLOAD,
+    PICKLE_CODEC,
+    READ_SIZE,
+    SNIFF_SIZE,
+    FrameDecoder,
+    MessageType,
+    ProtocolError,
+    is_valid_room,
+    pack_room_message,
+    sniff_codec,
+    unpack_room_message,
+)
+from chat_rooms import RoomIndex
+from chat_session import ChatSession
+from chat_timers import TimerWheel
+from event_loops import (
+    ASYNCIO_BACKENDS,
+    BACKENDS,
+    is_edge_triggered,
+    make_event_loop,
+    make_selector,
+)
+from socket_tuning import (
+    PROFILES,
+    apply_listener,
+    apply_profile,
+    describe,
+    get_profile,
+)
 
 SERVER_HOST = "localhost"
 CHAT_SERVER_NAME = "server"
+ENGINES = ("select", "asyncio")
+
+# Traffic counters of the sessions, kept for the server once they are gone
+TRAFFIC_COUNTERS = ("messages_in", "messages_out", "bytes_in", "bytes_out")
+
+# Period of the asyncio event loop lag probe, in seconds
+LAG_PROBE_INTERVAL = 0.1
+
+# Seconds of silence before a client is pinged, then disconnected
+HEARTBEAT_INTERVAL = 30.0
+IDLE_TIMEOUT = 90.0
+
+# Seconds a new connection has to send its login name
+LOGIN_TIMEOUT = 10.0
 
 
 # Some utilities
-def send(channel: socket.socket, *args) -> None:
-    """send pickled data over a network channel"""
-    # Pickle the passed arguments into a byte string
-    buffer = pickle.dumps(args)
+def send(
+    channel: socket.socket,
+    message: str,
+    msg_type=MessageType.TEXT,
+    codec=BINARY_CODEC,
+) -> None:
+    """Send a message over a network channel as a single frame"""
+    channel.sendall(codec.encode(message, msg_type))
 
-    # Calculates the length of the pickled data and convert it to network byte order
-    value = socket.htonl(len(buffer))
 
-    # Pack the converted length into a binary string
-    size = struct.pack("L", value)
+def recv_exactly(channel: socket.socket, size: int) -> bytes:
+    """Receive exactly size bytes, or less if the peer closed the channel"""
+    buf = bytearray()
+
+    while len(buf) < size:
+        # Receives additional bytes of data from the network channel
+        chunk = channel.recv(size - len(buf))
+
+        if not chunk:
+            break
 
-    # Send the packed size information over the network channel
-    channel.send(size)
+        buf += chunk
 
-    # Send the packed data over the network channel
-    channel.send(buffer)
+    return bytes(buf)
 
 
-def receive(channel: socket.socket) -> str | Any:
-    """Receive pickled data over a network channel"""
-    # Return size in bytes of the struct described by the format string
-    size = struct.calcsize("L")
+def read_frame(channel: socket.socket, codec, header=b"") -> tuple:
+    """Receive a (type, text) frame, None if the peer closed the channel.
 
+    'header' holds the first bytes of the frame if already received.
+    """
     # Receive a fixed number of bytes from the network channel
-    size = channel.recv(size)
+    header += recv_exactly(channel, codec.header.size - len(header))
+
+    if len(header) < codec.header.size:
+        return None
+
+    size, msg_type = codec.decode_header(header[: codec.header.size])
+
+    # Bytes already received beyond the header belong to the payload
+    payload = header[codec.header.size :]
+
+    payload += recv_exactly(channel, size - len(payload))
+
+    if len(payload) < size:
+        return None
+
+    return msg_type, codec.decode_payload(payload)
+
+
+def receive(channel: socket.socket, codec=BINARY_CODEC) -> str:
+    """Receive a message over a network channel"""
+    frame = read_frame(channel, codec)
 
+    return frame[1] if frame is not None else ""
+
+
+async def read_frame_async(
+    reader: asyncio.StreamReader, codec, header=b""
+) -> tuple:
+    """Receive a (type, payload) frame from an asyncio stream, None at the end.
+
+    'header' holds the first bytes of the frame if already received.
+    """
     try:
-        # Convert a 32-bit integer from network to host byte order
-        size = socket.ntohl(struct.unpack("L", size)[0])
+        # Wait for the fixed size header, then for the whole payload
+        if len(header) < codec.header.size:
+            header += await reader.readexactly(codec.header.size - len(header))
 
-    except struct.error:
-        return ""
+        size, msg_type = codec.decode_header(header[: codec.header.size])
 
-    buf = ""
+        # Same limit as FrameDecoder, the payload is never buffered
+        if size > MAX_PAYLOAD:
+            raise ProtocolError(f"Frame of {size} bytes is too large")
 
-    # Start a loop that continues until the length of the accumulated data
-    while len(buf) < size:
-        # Receives additional bytes of data from the network channel
-        buf = channel.recv(size - len(buf))
+        payload = header[codec.header.size :]
+
+        payload += await reader.readexactly(size - len(payload))
+
+    # The peer closed the connection in the middle of a message
+    except asyncio.IncompleteReadError:
+        return None
+
+    return msg_type, payload
 
-    # Unpickle the received data
-    return pickle.loads(buf)[0]
 
+async def receive_frame_async(
+    reader: asyncio.StreamReader, codec, header=b""
+) -> tuple:
+    """Receive a (type, text) frame from an asyncio stream, None at the end"""
+    frame = await read_frame_async(reader, codec, header)
+
+    if frame is None:
+        return None
+
+    return frame[0], codec.decode_payload(frame[1])
+
+
+async def receive_async(
+    reader: asyncio.StreamReader, codec=BINARY_CODEC
+) -> str:
+    """Receive a message from an asyncio stream"""
+    frame = await receive_frame_async(reader, codec)
+
+    return frame[1] if frame is not None else ""
+
+
+async def receive_login_async(
+    reader: asyncio.StreamReader, allow_pickle=False
+) -> tuple:
+    """Receive the first message of a client and detect its codec"""
+    try:
+        preamble = await reader.readexactly(SNIFF_SIZE)
 
-class ChatServer:
-    """An example chat server using select"""
+    except asyncio.IncompleteReadError:
+        return BINARY_CODEC, ""
 
-    def __init__(self, port, backlog=5):
+    codec = sniff_codec(preamble, allow_pickle)
+
+    frame = await receive_frame_async(reader, codec, header=preamble)
+
+    return codec, frame[1] if frame is not None else ""
+
+
+def raise_open_files_limit() -> int:
+    """Raise the soft limit of open file descriptors up to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+
+        except (ValueError, OSError):
+            pass
+
+    return soft
+
+
+class BaseChatServer(abc.ABC):
+    """Engine independent part of the chat server.
+
+    It keeps the sessions of the logged in clients, the rooms they joined
+    and the bus to the other worker processes. Engines implement deliver()
+    to send a frame to one client, queue_depth() to report its backlog and
+    close_session() to disconnect it.
+
+    Quiet clients are pinged every heartbeat_interval and disconnected
+    after idle_timeout seconds without any data, both driven by a timer
+    wheel that the engine advances.
+
+    The last messages of every room are kept and sent to the clients
+    joining it, see chat_history.py. With a log directory every message is
+    also written to a durable log, see chat_log.py.
+    """
+
+    def __init__(
+        self,
+        allow_pickle=False,
+        bus=None,
+        metrics_port=None,
+        stats_interval=0,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        idle_timeout=IDLE_TIMEOUT,
+        login_timeout=LOGIN_TIMEOUT,
+        history_frames=HISTORY_FRAMES,
+        history_bytes=HISTORY_BYTES,
+        history_dir=None,
+        history_rooms=HISTORY_ROOMS,
+        log_dir=None,
+        log_fsync=FSYNC_INTERVAL,
+    ):
         self.clients = 0  # Number of clients
-        self.client_map = (
-            {}
-        )  # Dict, mapping of client socket objects to information about those clients
-        self.outputs = []  # List of client sockets
+        self.connections_total = 0  # Number of logins since the start
+        self.allow_pickle = allow_pickle  # Accept legacy pickle clients
+        self.sessions = {}  # Dict, mapping of engine keys to client sessions
+        self.rooms = RoomIndex()  # Members of every room
+        self.bus = bus  # Bus to the other worker processes, if any
+        self.remote_clients = {}  # Dict, number of clients of other workers
+        self.metrics_port = metrics_port  # Local port of /metrics, if any
+        self.stats_interval = stats_interval  # Seconds between stats lines
+        self.reporters = []  # Running metrics endpoint and stats reporter
+        self.closed_traffic = dict.fromkeys(TRAFFIC_COUNTERS, 0)  # Gone clients
+        self.heartbeat_interval = heartbeat_interval  # Seconds, 0 for none
+        self.idle_timeout = idle_timeout  # Seconds, 0 to keep idle clients
+        self.login_timeout = login_timeout  # Seconds to send the login name
+        self.timers = TimerWheel()  # Idle timers of the sessions
+        self.clients_timed_out = 0  # Clients disconnected for being silent
+        self.history = None  # Last messages of every room, if kept
+        self.chat_log = None  # Durable log of the messages, if any
+
+        if history_frames:
+            # Every worker keeps its own copy of the history
+            if history_dir is not None and bus is not None:
+                history_dir = os.path.join(
+                    history_dir, f"worker-{bus.worker_id}"
+                )
+
+                os.makedirs(history_dir, exist_ok=True)
+
+            self.history = RoomHistory(
+                history_frames, history_bytes, history_dir, history_rooms
+            )
+
+        if log_dir is not None:
+            # Every worker logs the messages of its own clients
+            if bus is not None:
+                log_dir = os.path.join(log_dir, f"worker-{bus.worker_id}")
+
+            self.chat_log = ChatLog(log_dir, log_fsync)
+
+            self.chat_log.start()
+
+        self.histograms = {
+            "fanout_seconds": Histogram(),
+            "loop_seconds": Histogram(),
+        }
+
+    @abc.abstractmethod
+    def deliver(self, session: ChatSession, frame: memoryview) -> None:
+        """Send a frame to a client"""
+
+    @abc.abstractmethod
+    def queue_depth(self, session: ChatSession) -> int:
+        """Return the outbound bytes waiting to be sent to a client"""
+
+    @abc.abstractmethod
+    def close_session(self, session: ChatSession) -> None:
+        """Disconnect a client from a timer callback"""
+
+    def deliver_history(self, session: ChatSession, frames: list) -> None:
+        """Send the history of a room to a client"""
+        for frame in frames:
+            self.deliver(session, frame)
+
+    def send_text(
+        self, session: ChatSession, text: str, msg_type=MessageType.TEXT
+    ) -> None:
+        """Send a message to a single client"""
+        self.deliver(session, session.codec.encode(text, msg_type))
+
+    def broadcast(
+        self, msg: str, sender=None, room=DEFAULT_ROOM, keep=False
+    ) -> None:
+        """Send a message to the members of a room except the sender.
+
+        With 'keep' the message is also added to the history of the room.
+        """
+        started = time.perf_counter()
+
+        # Encode the message once per codec, recipients share the frame
+        frames = {}
+
+        if keep and self.history is not None:
+            frame = frames[BINARY_CODEC] = BINARY_CODEC.encode(msg)
+
+            self.history.append(room, frame)
+
+        for session in self.rooms.members(room):
+            if session is sender:
+                continue
+
+            frame = frames.get(session.codec)
+
+            if frame is None:
+                frame = frames[session.codec] = session.codec.encode(msg)
+
+            self.deliver(session, frame)
+
+        self.histograms["fanout_seconds"].observe(time.perf_counter() - started)
+
+    def total_clients(self) -> int:
+        """Return the number of clients of all the worker processes"""
+        return self.clients + sum(self.remote_clients.values())
+
+    def stats(self) -> dict:
+        """Return the counters and gauges of the server.
+
+        It may be called from the metrics threads while the loop runs.
+        """
+        traffic = dict(self.closed_traffic)
+
+        depths = []
+
+        # Copy the sessions first, the loop may add or remove some meanwhile
+        for session in list(self.sessions.values()):
+            for name in TRAFFIC_COUNTERS:
+                traffic[name] += getattr(session, name)
+
+            depths.append(self.queue_depth(session))
+
+        return {
+            "clients": self.clients,
+            "total_clients": self.total_clients(),
+            "connections": self.connections_total,
+            **traffic,
+            "queued_bytes": sum(depths),
+            "max_queue_bytes": max(depths, default=0),
+            "frames_dropped": self.frames_dropped,
+            "clients_evicted": self.clients_evicted,
+            "clients_timed_out": self.clients_timed_out,
+            "bus_dropped": self.bus.dropped if self.bus is not None else 0,
+            "log_records": self.chat_log.records if self.chat_log else 0,
+            "log_fsyncs": self.chat_log.fsyncs if self.chat_log else 0,
+        }
+
+    def start_metrics(self) -> None:
+        """Start the metrics endpoint and the stats line, if requested"""
+        if self.metrics_port is not None:
+            # Workers share the port of the chat, not the one of the metrics
+            port = self.metrics_port
+
+            if self.bus is not None:
+                port += self.bus.worker_id
+
+            endpoint = MetricsEndpoint(self, port)
+
+            endpoint.start()
+
+            self.reporters.append(endpoint)
+
+            print("Metrics on http://%s:%d/metrics" % endpoint.address)
+
+        if self.stats_interval > 0:
+            reporter = StatsReporter(self, self.stats_interval)
+
+            reporter.start()
+
+            self.reporters.append(reporter)
+
+    def stop_metrics(self) -> None:
+        """Stop the metrics endpoint and the stats line"""
+        while self.reporters:
+            self.reporters.pop().close()
+
+    def publish(self, kind: BusEvent, msg: str, room=DEFAULT_ROOM) -> None:
+        """Forward an event to the clients of the other worker processes"""
+        if self.bus is not None:
+            self.bus.publish(kind, self.clients, room, msg)
+
+    def read_bus(self) -> None:
+        """Deliver the events published by the other worker processes"""
+        for kind, worker_id, clients, room, msg in self.bus.receive():
+            self.remote_clients[worker_id] = clients
+
+            self.broadcast(msg, room=room, keep=kind == BusEvent.MESSAGE)
+
+    def replay_history(self, session: ChatSession, room: str) -> None:
+        """Send the last messages of a room to a client joining it"""
+        if self.history is None:
+            return
+
+        frames = self.history.replay(room)
+
+        if not frames:
+            return
+
+        # The history holds binary frames, legacy clients get new ones
+        if session.codec is not BINARY_CODEC:
+            frames = [
+                session.codec.encode(str(frame[HEADER.size :], "utf-8"))
+                for frame in frames
+            ]
+
+        self.deliver_history(session, frames)
+
+    def login(self, session: ChatSession) -> None:
+        """Welcome a client that has just logged in"""
+        # Compute client name and send back
+        self.clients += 1
+
+        self.connections_total += 1
+
+        self.send_text(
+            session, "CLIENT: " + str(session.address[0]), MessageType.CLIENT
+        )
+
+        # Send joining information to other clients
+        msg = "\n(Connected: New client (%d) from %s)" % (
+            self.total_clients(),
+            session.display_name,
+        )
+
+        self.broadcast(msg)
+
+        self.publish(BusEvent.JOIN, msg)
+
+        self.rooms.join(session, DEFAULT_ROOM)
+
+        self.replay_history(session, DEFAULT_ROOM)
+
+        self.watch(session)
+
+    def watch(self, session: ChatSession) -> None:
+        """Start watching a client for silence"""
+        if session.codec is PICKLE_CODEC:
+            # Legacy clients cannot answer pings, let TCP probe the peer
+            channel = session.channel
+
+            if not isinstance(channel, socket.socket):
+                channel = channel.get_extra_info("socket")
+
+            channel.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        elif self.idle_timeout:
+            session.timer = self.timers.schedule(
+                self.check_interval(), self.check_idle, session
+            )
+
+    def check_interval(self) -> float:
+        """Return the seconds of silence before a client is checked"""
+        # The earlier of the ping and the timeout
+        if self.heartbeat_interval:
+            return min(self.heartbeat_interval, self.idle_timeout)
+
+        return self.idle_timeout
+
+    def check_idle(self, session: ChatSession) -> None:
+        """Ping a quiet client, disconnect it once it is silent for too long"""
+        session.timer = None
+
+        idle = time.monotonic() - session.last_seen
+
+        if idle >= self.idle_timeout:
+            print("Chat server: %s timed out" % session.display_name)
+
+            self.clients_timed_out += 1
+
+            self.close_session(session)
+
+            return
+
+        if self.heartbeat_interval and idle >= self.heartbeat_interval:
+            self.send_text(session, "", MessageType.PING)
+
+            delay = min(self.heartbeat_interval, self.idle_timeout - idle)
+
+        else:
+            # The client was active meanwhile, check again later
+            delay = self.check_interval() - idle
+
+        session.timer = self.timers.schedule(delay, self.check_idle, session)
+
+    def logout(self, session: ChatSession, notify=True) -> None:
+        """Forget a client and tell the others it has left"""
+        self.clients -= 1
+
+        if session.timer is not None:
+            self.timers.cancel(session.timer)
+
+            session.timer = None
+
+        # Keep the traffic of the client in the server totals
+        for name in TRAFFIC_COUNTERS:
+            self.closed_traffic[name] += getattr(session, name)
+
+        self.rooms.leave_all(session)
+
+        if notify:
+            # Sending client leaving information to others
+            msg = "\n(Now hung up: Client from %s)" % session.display_name
+
+            self.broadcast(msg)
+
+            self.publish(BusEvent.LEAVE, msg)
+
+    def dispatch(self, session: ChatSession, msg_type, data: str) -> None:
+        """Handle a message received from a client"""
+        if msg_type == MessageType.JOIN:
+            self.join_room(session, data)
+
+        elif msg_type == MessageType.LEAVE:
+            self.leave_room(session, data)
+
+        elif msg_type == MessageType.MSG:
+            room, text = unpack_room_message(data)
+
+            self.post(session, room, text)
+
+        elif msg_type == MessageType.PING:
+            self.send_text(session, data, MessageType.PONG)
+
+        elif msg_type == MessageType.PONG:
+            # Heartbeat reply, the activity of the client is already recorded
+            pass
+
+        elif data:
+            self.post(session, DEFAULT_ROOM, data)
+
+    def post(self, session: ChatSession, room: str, text: str) -> None:
+        """Send a client message to the other members of a room"""
+        prefix = session.rooms.get(room)
+
+        if prefix is None:
+            self.send_text(session, "\n(Not a member of #%s)" % room)
+
+            return
+
+        msg = prefix + text
+
+        if self.chat_log is not None:
+            self.chat_log.append(room, session.display_name, text)
+
+        # Send data to all except ourselves
+        self.broadcast(msg, sender=session, room=room, keep=True)
+
+        self.publish(BusEvent.MESSAGE, msg, room)
+
+    def join_room(self, session: ChatSession, room: str) -> None:
+        """Subscribe a client to a room"""
+        if not is_valid_room(room):
+            self.send_text(session, "\n(Invalid room name: %r)" % room)
+
+            return
+
+        if self.rooms.join(session, room):
+            msg = "\n(%s joined #%s)" % (session.display_name, room)
+
+            self.broadcast(msg, sender=session, room=room)
+
+            self.publish(BusEvent.NOTICE, msg, room)
+
+            self.replay_history(session, room)
+
+        self.send_text(session, "\n(Joined #%s)" % room)
+
+    def leave_room(self, session: ChatSession, room: str) -> None:
+        """Unsubscribe a client from a room"""
+        if not self.rooms.leave(session, room):
+            self.send_text(session, "\n(Not a member of #%s)" % room)
+
+            return
+
+        msg = "\n(%s left #%s)" % (session.display_name, room)
+
+        self.broadcast(msg, room=room)
+
+        self.publish(BusEvent.NOTICE, msg, room)
+
+        self.send_text(session, "\n(Left #%s)" % room)
+
+
+class ChatServer(BaseChatServer):
+    """An example chat server using select.
+
+    select() is the default backend, loop_backend selects another one of
+    event_loops.py (poll, epoll, edge-triggered epoll, asyncio, uvloop).
+    """
+
+    def __init__(
+        self,
+        port,
+        backlog=socket.SOMAXCONN,
+        allow_pickle=False,
+        max_queue_bytes=MAX_QUEUE_BYTES,
+        max_queue_frames=MAX_QUEUE_FRAMES,
+        slow_consumer="disconnect",
+        reuse_port=False,
+        bus=None,
+        metrics_port=None,
+        stats_interval=0,
+        flush_delay=0.0,
+        flush_bytes=FLUSH_BYTES,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        idle_timeout=IDLE_TIMEOUT,
+        login_timeout=LOGIN_TIMEOUT,
+        history_frames=HISTORY_FRAMES,
+        history_bytes=HISTORY_BYTES,
+        history_dir=None,
+        history_rooms=HISTORY_ROOMS,
+        log_dir=None,
+        log_fsync=FSYNC_INTERVAL,
+        loop_backend="select",
+        tuning="default",
+    ):
+        super().__init__(
+            allow_pickle,
+            bus,
+            metrics_port,
+            stats_interval,
+            heartbeat_interval,
+            idle_timeout,
+            login_timeout,
+            history_frames,
+            history_bytes,
+            history_dir,
+            history_rooms,
+            log_dir,
+            log_fsync,
+        )
+
+        # Sessions are keyed by the descriptor of the client socket
+        self.handshakes = {}  # Dict, sessions waiting for their login name
+        self.logins_rejected = 0  # Connections that failed to log in
+        self.selector = make_selector(loop_backend)  # Event loop backend
+        self.edge_triggered = is_edge_triggered(self.selector)  # Read all
+        self.tuning = get_profile(tuning)  # Socket options of the clients
+        self.writing = set()  # Descriptors monitored for writability
+        self.running = False  # Cleared to stop the event loop
+        self.pending = set()  # Client descriptors with data waiting to be sent
+        self.scratch = memoryview(bytearray(READ_SIZE))  # Shared read buffer
+        self.max_queue_bytes = max_queue_bytes  # Queue high-water mark, bytes
+        self.max_queue_frames = max_queue_frames  # Queue high-water, frames
+        self.slow_consumer = slow_consumer  # "drop" frames or "disconnect"
+        self.slow_clients = set()  # Clients to evict after the current event
+        self.flush_delay = flush_delay  # Seconds a queue may wait for more
+        self.flush_bytes = flush_bytes  # Queued bytes sent without waiting
+        self.flushes = 0  # Vectored writes to client sockets
+        self.now = time.monotonic()  # Time of the current loop iteration
+        self.frames_dropped = 0  # Frames refused by full queues
+        self.clients_evicted = 0  # Clients disconnected for being too slow
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        # Let the worker processes bind the same port, the kernel spreads
+        # incoming connections between them
+        if reuse_port:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        # Accepted clients inherit the options of the listening socket
+        apply_listener(self.server, self.tuning)
+
         self.server.bind((SERVER_HOST, port))
         print(f"Server listening to port: {port} ...")
-        self.server.listen(backlog)
+        self.server.listen(self.tuning.listen_backlog(backlog))
+        print(describe(self.server, self.tuning))
+
+        # Connections are accepted until the queue is empty
+        self.server.setblocking(False)
 
         # Set a signal handler for a specific signal
         signal.signal(
@@ -82,135 +727,816 @@ class ChatServer:
         """Handle a shutdown signal received by the server"""
         print("Shutting down server...")
 
-        # Iterate client sockets that the server is currently communicating with
-        for output in self.outputs:
-            # Close each socket
-            output.close()
+        # The wakeup socket interrupts the wait of any backend
+        self.running = False
 
-        # Close the sever socket
-        self.server.close()
+    def deliver(self, session: ChatSession, frame: memoryview) -> None:
+        """Queue a frame for a client, it is sent once the socket is writable"""
+        if session.push(frame):
+            self.pending.add(session.fd)
+
+            return
+
+        # The client does not keep up with the traffic
+        self.frames_dropped += 1
+
+        if self.slow_consumer == "disconnect":
+            self.slow_clients.add(session.fd)
+
+    def evict_slow_clients(self) -> None:
+        """Disconnect clients whose queue reached the high-water mark"""
+        while self.slow_clients:
+            session = self.sessions.get(self.slow_clients.pop())
+
+            if session is not None:
+                print(
+                    "Chat server: %d evicted, %d bytes queued"
+                    % (session.fd, session.queue.nbytes)
+                )
+
+                self.clients_evicted += 1
+
+                self.disconnect(session)
+
+    def queue_depth(self, session: ChatSession) -> int:
+        """Return the outbound bytes waiting to be sent to a client"""
+        return session.queue.nbytes
+
+    def close_session(self, session: ChatSession) -> None:
+        """Disconnect a client from a timer callback"""
+        self.disconnect(session)
+
+    def deliver_history(self, session: ChatSession, frames: list) -> None:
+        """Queue the history of a room, it leaves in a single write"""
+        for frame in frames:
+            # The history is only a courtesy, never evict a client for it
+            if not session.push(frame):
+                break
+
+        self.pending.add(session.fd)
+
+    def stats(self) -> dict:
+        """Return the counters and gauges of the server"""
+        stats = super().stats()
+
+        stats["pending_clients"] = len(self.pending)
+
+        stats["flushes"] = self.flushes
+
+        stats["pending_logins"] = len(self.handshakes)
+
+        stats["logins_rejected"] = self.logins_rejected
+
+        return stats
+
+    def flush(self, session: ChatSession) -> None:
+        """Write queued frames to a writable client"""
+        self.flushes += 1
+
+        try:
+            session.flush()
+
+        except OSError:
+            self.disconnect(session)
+
+            return
+
+        if not session.queue:
+            self.pending.discard(session.fd)
+
+    def due_writers(self) -> tuple:
+        """Return the clients whose queue must be sent and the select timeout.
+
+        A queue waits up to flush_delay after its oldest frame, unless it
+        holds flush_bytes, so that a burst leaves in a single write.
+        """
+        if not self.flush_delay:
+            return self.pending, None
+
+        now = time.perf_counter()
 
-    def get_client_name(self, connected_client: socket.socket) -> str:
-        """Return the name of the client connected to the server"""
-        # Retrieve information about the client
-        info = self.client_map[connected_client]
+        due = []
+
+        timeout = None
+
+        for fd in self.pending:
+            wait = self.sessions[fd].queue.wait_time(
+                now, self.flush_delay, self.flush_bytes
+            )
+
+            if not wait:
+                due.append(fd)
+
+            elif timeout is None or wait < timeout:
+                timeout = wait
+
+        return due, timeout
+
+    def disconnect(self, session: ChatSession) -> None:
+        """Forget a client and tell the others it has left"""
+        print("Chat server: %d hung up" % session.fd)
+
+        del self.sessions[session.fd]
+
+        self.selector.unregister(session.fd)
+
+        self.writing.discard(session.fd)
+
+        self.pending.discard(session.fd)
+
+        self.slow_clients.discard(session.fd)
+
+        session.channel.close()
+
+        self.logout(session)
+
+    def accept(self) -> None:
+        """Accept all the waiting connections.
+
+        New clients log in from the event loop (see handshake()), so a slow
+        or silent connection never blocks the server.
+        """
+        while True:
+            try:
+                client, address = self.server.accept()
+
+            # No more connections waiting
+            except BlockingIOError:
+                break
+
+            # Out of descriptors or the connection was aborted meanwhile
+            except OSError as error:
+                print(f"Chat server: accept failed: {error}")
+
+                break
+
+            client.setblocking(False)
+
+            print(
+                "Chat server: got connection %d from %s"
+                % (client.fileno(), address)
+            )
+
+            # The decoder detects the codec from the first bytes
+            session = ChatSession(
+                client,
+                address,
+                queue=OutboundQueue(
+                    self.max_queue_bytes, self.max_queue_frames
+                ),
+                decoder=FrameDecoder(allow_pickle=self.allow_pickle),
+            )
+
+            self.handshakes[session.fd] = session
+
+            self.selector.register(session.fd, selectors.EVENT_READ)
+
+            if self.login_timeout:
+                session.timer = self.timers.schedule(
+                    self.login_timeout, self.expire_login, session
+                )
+
+    def handshake(self, session: ChatSession) -> None:
+        """Read from a connection waiting for its login name"""
+        try:
+            frames = session.read(self.scratch)
+
+            # Edge-triggered backends do not report the data left unread
+            while frames == [] and self.edge_triggered:
+                frames = session.read(self.scratch)
+
+            if frames is None:
+                raise ConnectionError("Connection closed before login")
+
+            # Wait for the rest of the login frame
+            if not frames:
+                return
+
+            msg_type, login = frames[0]
+
+            cname = login.split("NAME: ")[1]
+
+        except BlockingIOError:
+            return
+
+        except (ProtocolError, IndexError, OSError) as error:
+            self.reject(session, error)
+
+            return
+
+        del self.handshakes[session.fd]
+
+        if session.timer is not None:
+            self.timers.cancel(session.timer)
+
+            session.timer = None
+
+        session.codec = session.decoder.codec
+
+        session.activate(cname)
+
+        self.sessions[session.fd] = session
+
+        self.login(session)
+
+        # Messages sent right behind the login name
+        try:
+            for msg_type, data in frames[1:]:
+                self.dispatch(session, msg_type, data)
+
+        except (ProtocolError, OSError):
+            self.disconnect(session)
+
+            return
+
+        if self.edge_triggered:
+            self.read(session)
+
+    def expire_login(self, session: ChatSession) -> None:
+        """Drop a connection that did not log in in time"""
+        session.timer = None
+
+        self.reject(session, "login timed out")
+
+    def reject(self, session: ChatSession, error) -> None:
+        """Close a connection that failed to log in"""
+        print(f"Chat server: rejected {session.address}: {error}")
+
+        self.logins_rejected += 1
+
+        del self.handshakes[session.fd]
+
+        self.selector.unregister(session.fd)
+
+        self.pending.discard(session.fd)
+
+        if session.timer is not None:
+            self.timers.cancel(session.timer)
+
+        session.channel.close()
+
+    def read(self, session: ChatSession) -> None:
+        """Read from a readable client and broadcast its complete messages.
+
+        With an edge-triggered backend the socket is read until EAGAIN.
+        """
+        try:
+            while True:
+                frames = session.read(self.scratch)
 
-        # Unpack the information about the client
-        connected_host, connected_name = info[0][0], info[1]
+                session.last_seen = self.now
 
-        # Create a unique identifier for the client (name@host)
-        return "@".join((connected_name, connected_host))
+                if frames is None:
+                    break
+
+                for msg_type, data in frames:
+                    self.dispatch(session, msg_type, data)
+
+                if not self.edge_triggered:
+                    return
+
+        # Nothing to read after all
+        except BlockingIOError:
+            return
+
+        except (OSError, ProtocolError):
+            frames = None
+
+        if frames is None:
+            self.disconnect(session)
+
+    def watch_writers(self, writers) -> None:
+        """Monitor the writability of the clients with frames due only"""
+        for fd in self.writing.difference(writers):
+            self.selector.modify(fd, selectors.EVENT_READ)
+
+        for fd in set(writers).difference(self.writing):
+            self.selector.modify(
+                fd, selectors.EVENT_READ | selectors.EVENT_WRITE
+            )
+
+        self.writing = set(writers)
 
     def run(self):
         """Run the server"""
-        inputs = [self.server, sys.stdin]
+        server_fd = self.server.fileno()
 
-        self.outputs = []
+        stdin_fd = sys.stdin.fileno()
 
-        running = True
+        bus_fd = self.bus.fileno() if self.bus is not None else None
+
+        # Signals write to this socket so that every backend wakes up
+        wakeup, signal_socket = socket.socketpair()
+
+        wakeup.setblocking(False)
+
+        signal_socket.setblocking(False)
+
+        wakeup_fd = wakeup.fileno()
+
+        previous_wakeup_fd = signal.set_wakeup_fd(
+            signal_socket.fileno(), warn_on_full_buffer=False
+        )
+
+        for fd in (server_fd, wakeup_fd, bus_fd):
+            if fd is not None:
+                self.selector.register(fd, selectors.EVENT_READ)
+
+        try:
+            self.selector.register(stdin_fd, selectors.EVENT_READ)
+
+        # epoll cannot watch regular files such as /dev/null
+        except OSError:
+            print("Chat server: standard input is not watched")
+
+        self.running = True
+
+        loop_time = self.histograms["loop_seconds"]
+
+        self.start_metrics()
+
+        while self.running:
+            writers, timeout = self.due_writers()
+
+            self.watch_writers(writers)
+
+            # Wake up for the next tick of the timer wheel as well
+            next_tick = self.timers.timeout()
+
+            if next_tick is not None and (
+                timeout is None or next_tick < timeout
+            ):
+                timeout = next_tick
 
-        while running:
             try:
-                # Monitor a list of inputs for readability, outputs for writability and
-                # an empty list ([]) for exceptional conditions
-                readable, writeable, exceptional = select.select(
-                    inputs, self.outputs, []
-                )
+                # Monitor inputs for readability and clients with frames
+                # due for writability
+                events = self.selector.select(timeout)
 
             # Handle I/O related errors
             except OSError:
                 break
 
-            # Iterate a list of inputs
-            for sock in readable:
-                if sock == self.server:
-                    # handle the server socket
-                    client, address = self.server.accept()
+            started = time.perf_counter()
+
+            self.now = time.monotonic()
 
-                    print(
-                        "Chat server: got connection %d from %s"
-                        % (client.fileno(), address)
-                    )
+            # Iterate the readable inputs
+            for key, mask in events:
+                if not mask & selectors.EVENT_READ:
+                    continue
 
-                    # Read the login name
-                    cname = receive(client).split("NAME: ")[1]
+                fd = key.fd
 
-                    # Compute client name and send back
-                    self.clients += 1
+                if fd == server_fd:
+                    # handle the server socket
+                    self.accept()
 
-                    send(client, "CLIENT: " + str(address[0]))
+                elif fd == stdin_fd:
+                    # handle standard input
+                    self.running = False
 
-                    inputs.append(client)
+                elif fd == wakeup_fd:
+                    # handle signals, the handlers have already run
+                    while True:
+                        try:
+                            wakeup.recv(READ_SIZE)
 
-                    self.client_map[client] = (address, cname)
+                        except BlockingIOError:
+                            break
 
-                    # Send joining information to other clients
-                    msg = "\n(Connected: New client (%d) from %s)" % (
-                        self.clients,
-                        self.get_client_name(client),
-                    )
+                elif fd == bus_fd:
+                    # handle events of the other worker processes
+                    self.read_bus()
 
-                    for output in self.outputs:
-                        send(output, msg)
+                elif fd in self.sessions:
+                    # handle all other sockets
+                    self.read(self.sessions[fd])
 
-                    self.outputs.append(client)
+                elif fd in self.handshakes:
+                    # handle connections waiting for their login name
+                    self.handshake(self.handshakes[fd])
 
-                elif sock == sys.stdin:
-                    # handle standard input
-                    running = False
+            # Drain the queues of writable clients still connected
+            for key, mask in events:
+                if mask & selectors.EVENT_WRITE and key.fd in self.pending:
+                    self.flush(self.sessions[key.fd])
 
-                else:
-                    # handle all other sockets
-                    try:
-                        data = receive(sock)
-                        if data:
-                            # Send as new client's message...
-                            msg = (
-                                "\n#["
-                                + self.get_client_name(sock)
-                                + "]>>"
-                                + data
-                            )
-
-                            # Send data to all except ourselves
-                            for output in self.outputs:
-                                if output != sock:
-                                    send(output, msg)
+            # Ping or disconnect quiet clients
+            self.timers.advance()
 
-                        else:
-                            print("Chat server: %d hung up" % sock.fileno())
+            self.evict_slow_clients()
 
-                            self.clients -= 1
+            loop_time.observe(time.perf_counter() - started)
 
-                            sock.close()
+        signal.set_wakeup_fd(previous_wakeup_fd)
 
-                            inputs.remove(sock)
+        wakeup.close()
 
-                            self.outputs.remove(sock)
+        signal_socket.close()
 
-                            # Sending client leaving information to others
-                            msg = (
-                                "\n(Now hung up: Client from %s)"
-                                % self.get_client_name(sock)
-                            )
+        self.stop_metrics()
 
-                            for output in self.outputs:
-                                send(output, msg)
+        print(f"Chat server: {self.stats()}")
 
-                    except OSError:
-                        # Remove
-                        inputs.remove(sock)
+        for session in [*self.sessions.values(), *self.handshakes.values()]:
+            session.channel.close()
 
-                        self.outputs.remove(sock)
+        self.selector.close()
 
         self.server.close()
 
+        if self.history is not None:
+            self.history.close()
+
+        if self.chat_log is not None:
+            self.chat_log.close()
+
+
+class AsyncChatServer(BaseChatServer):
+    """A chat server built on asyncio streams.
+
+    The event loop waits on epoll (or the best selector of the platform),
+    so the number of clients is not limited by FD_SETSIZE and the cost of
+    an event does not depend on the number of idle connections. With the
+    uvloop backend it runs on libuv instead.
+    """
+
+    def __init__(
+        self,
+        port,
+        backlog=1024,
+        allow_pickle=False,
+        max_queue_bytes=MAX_QUEUE_BYTES,
+        slow_consumer="disconnect",
+        reuse_port=False,
+        bus=None,
+        metrics_port=None,
+        stats_interval=0,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        idle_timeout=IDLE_TIMEOUT,
+        login_timeout=LOGIN_TIMEOUT,
+        history_frames=HISTORY_FRAMES,
+        history_bytes=HISTORY_BYTES,
+        history_dir=None,
+        history_rooms=HISTORY_ROOMS,
+        log_dir=None,
+        log_fsync=FSYNC_INTERVAL,
+        loop_backend="asyncio",
+        tuning="default",
+    ):
+        super().__init__(
+            allow_pickle,
+            bus,
+            metrics_port,
+            stats_interval,
+            heartbeat_interval,
+            idle_timeout,
+            login_timeout,
+            history_frames,
+            history_bytes,
+            history_dir,
+            history_rooms,
+            log_dir,
+            log_fsync,
+        )
+
+        # Sessions are keyed by the stream writer of the client
+        self.port = port
+        self.backlog = backlog
+        self.reuse_port = reuse_port  # Share the port with other workers
+        self.loop_backend = loop_backend  # Backend of the event loop
+        self.tuning = get_profile(tuning)  # Socket options of the clients
+        self.connections = {}  # Dict, mapping of stream writers to their tasks
+        self.stopped = None  # Event set to shut the server down
+        self.max_queue_bytes = max_queue_bytes  # Transport buffer limit
+        self.slow_consumer = slow_consumer  # "drop" frames or "disconnect"
+        self.frames_dropped = 0  # Frames not written to full transports
+        self.clients_evicted = 0  # Clients disconnected for being too slow
+
+    def deliver(self, session: ChatSession, frame: memoryview) -> None:
+        """Write a frame to a client transport"""
+        writer = session.channel
 
-class ChatClient:
-    """A command line chat client using select"""
+        if writer.is_closing():
+            return
+
+        # Writes are buffered by the transport and never block,
+        # so bound the buffer of clients that do not read
+        buffered = writer.transport.get_write_buffer_size()
+
+        if buffered and buffered + len(frame) > self.max_queue_bytes:
+            self.frames_dropped += 1
+
+            if self.slow_consumer == "disconnect":
+                print("Chat server: %s evicted" % session.display_name)
+
+                self.clients_evicted += 1
+
+                # Discard the buffered data, the client task cleans up
+                writer.transport.abort()
+
+            return
+
+        writer.write(frame)
+
+        session.messages_out += 1
+
+        session.bytes_out += len(frame)
+
+    def close_session(self, session: ChatSession) -> None:
+        """Disconnect a client from a timer callback"""
+        # The client task sees the connection lost and cleans up
+        session.channel.transport.abort()
+
+    def deliver_history(self, session: ChatSession, frames: list) -> None:
+        """Write the history of a room to a client transport at once"""
+        writer = session.channel
+
+        if writer.is_closing():
+            return
+
+        writer.writelines(frames)
+
+        session.messages_out += len(frames)
+
+        session.bytes_out += sum(map(len, frames))
+
+    def queue_depth(self, session: ChatSession) -> int:
+        """Return the outbound bytes waiting to be sent to a client"""
+        transport = session.channel.transport
+
+        return (
+            0 if transport.is_closing() else transport.get_write_buffer_size()
+        )
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve a connection until the client leaves or the server stops"""
+        self.connections[writer] = asyncio.current_task()
+
+        try:
+            await self.serve_client(reader, writer)
+
+        finally:
+            del self.connections[writer]
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve a single client connection"""
+        address = writer.get_extra_info("peername")
+
+        print(
+            "Chat server: got connection %d from %s"
+            % (writer.get_extra_info("socket").fileno(), address)
+        )
+
+        try:
+            # Read the login name and detect the client codec, in time
+            codec, login = await asyncio.wait_for(
+                receive_login_async(reader, self.allow_pickle),
+                self.login_timeout or None,
+            )
+
+            cname = login.split("NAME: ")[1]
+
+        except (
+            ProtocolError,
+            IndexError,
+            OSError,
+            asyncio.TimeoutError,
+        ) as error:
+            print(f"Chat server: rejected {address}: {error}")
+
+            writer.close()
+
+            return
+
+        session = self.sessions[writer] = ChatSession(
+            writer, address, cname, codec
+        )
+
+        self.login(session)
+
+        try:
+            while True:
+                frame = await read_frame_async(reader, codec)
+
+                if frame is None:
+                    break
+
+                msg_type, payload = frame
+
+                session.last_seen = time.monotonic()
+
+                session.messages_in += 1
+
+                session.bytes_in += codec.header.size + len(payload)
+
+                self.dispatch(session, msg_type, codec.decode_payload(payload))
+
+        except (OSError, ProtocolError):
+            pass
+
+        finally:
+            print("Chat server: %s hung up" % session.display_name)
+
+            del self.sessions[writer]
+
+            writer.close()
+
+            # Nobody is told about clients closed at shutdown
+            self.logout(session, notify=not self.stopped.is_set())
+
+    async def probe_lag(self) -> None:
+        """Record how late the event loop runs a callback.
+
+        Callbacks only run between the events of the loop, so the delay
+        measures the time the loop spends on each iteration.
+        """
+        loop_time = self.histograms["loop_seconds"]
+
+        while True:
+            started = time.perf_counter()
+
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+
+            loop_time.observe(
+                max(0.0, time.perf_counter() - started - LAG_PROBE_INTERVAL)
+            )
+
+    async def tick_timers(self) -> None:
+        """Advance the timer wheel while it holds timers"""
+        while True:
+            timeout = self.timers.timeout()
+
+            await asyncio.sleep(
+                self.timers.tick if timeout is None else timeout
+            )
+
+            self.timers.advance()
+
+    async def serve(self) -> None:
+        """Accept clients until stdin becomes readable or SIGINT"""
+        loop = asyncio.get_running_loop()
+
+        self.stopped = asyncio.Event()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            if self.reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+            # Tuned before listen(), accepted clients inherit the options
+            apply_listener(sock, self.tuning)
+
+            sock.bind((SERVER_HOST, self.port))
+
+            server = await asyncio.start_server(
+                self.handle_client,
+                sock=sock,
+                backlog=self.tuning.listen_backlog(self.backlog),
+            )
+
+        except BaseException:
+            sock.close()
+
+            raise
+
+        print(describe(sock, self.tuning))
+
+        if self.bus is not None:
+            loop.add_reader(self.bus, self.read_bus)
+
+        print(f"Server listening to port: {self.port} ...")
+
+        # Stop on standard input or a shutdown signal, like the select server
+        loop.add_reader(sys.stdin, self.stopped.set)
+
+        loop.add_signal_handler(signal.SIGINT, self.signal_handler)
+
+        self.start_metrics()
+
+        probe = asyncio.create_task(self.probe_lag())
+
+        ticker = asyncio.create_task(self.tick_timers())
+
+        async with server:
+            await self.stopped.wait()
+
+        probe.cancel()
+
+        ticker.cancel()
+
+        self.stop_metrics()
+
+        loop.remove_reader(sys.stdin)
+
+        # Close the remaining connections and let their tasks finish
+        for writer in list(self.connections):
+            writer.close()
+
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
 
-    def __init__(self, name, port, host=SERVER_HOST):
+        if self.history is not None:
+            self.history.close()
+
+        if self.chat_log is not None:
+            self.chat_log.close()
+
+    def signal_handler(self):
+        """Handle a shutdown signal received by the server"""
+        print("Shutting down server...")
+
+        self.stopped.set()
+
+    def run(self):
+        """Run the server"""
+        limit = raise_open_files_limit()
+
+        print(f"Open files limit: {limit}")
+
+        with asyncio.Runner(
+            loop_factory=lambda: make_event_loop(self.loop_backend)
+        ) as runner:
+            runner.run(self.serve())
+
+
+def run_workers(workers: int, make_server) -> None:
+    """Run a chat server in several processes sharing the same port.
+
+    make_server(bus) returns the server of a worker, connected to the other
+    workers by bus.
+    """
+    directory = create_bus_directory()
+
+    # Bind every bus endpoint before forking so no early event is lost
+    buses = [WorkerBus(directory, i, workers) for i in range(workers)]
+
+    pids = []
+
+    for bus in buses:
+        pid = os.fork()
+
+        if pid == 0:
+            status = 1
+
+            try:
+                for other in buses:
+                    if other is not bus:
+                        other.close()
+
+                make_server(bus).run()
+
+                status = 0
+
+            except Exception:
+                traceback.print_exc()
+
+            finally:
+                sys.stdout.flush()
+
+                os._exit(status)
+
+        pids.append(pid)
+
+    for bus in buses:
+        bus.close()
+
+    print(f"Chat server: started {workers} workers {pids}")
+
+    # The workers handle Ctrl-C themselves, wait until all of them are done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    remove_bus_directory(directory)
+
+
+class ChatClient:
+    """A command line chat client using select.
+
+    Lines are sent to the default room, except the room commands:
+    '/join room', '/leave room' and '/msg room text'.
+    """
+
+    def __init__(
+        self,
+        name,
+        port,
+        host=SERVER_HOST,
+        codec=BINARY_CODEC,
+        rooms=(),
+        tuning="default",
+    ):
         self.name = name
+        self.codec = codec  # Wire format spoken with the server
         self.connected = False
         self.host = host
         self.port = port
@@ -223,6 +1549,8 @@ class ChatClient:
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+            apply_profile(self.sock, get_profile(tuning))
+
             self.sock.connect((host, self.port))
 
             print("Now connected to chat server@ port %d" % self.port)
@@ -230,27 +1558,59 @@ class ChatClient:
             self.connected = True
 
             # Send my name...
-            send(self.sock, "NAME: " + self.name)
+            send(self.sock, "NAME: " + self.name, MessageType.NAME, self.codec)
 
-            data = receive(self.sock)
+            data = receive(self.sock, self.codec)
 
             # Contains client address, set it
             addr = data.split("CLIENT: ")[1]
 
             self.prompt = "[" + "@".join((self.name, addr)) + "]> "
 
+            # Join the rooms requested at startup
+            for room in rooms:
+                self.command("/join " + room)
+
         except OSError:
             print("Failed to connect to chat server @ port %d" % self.port)
 
             sys.exit(1)
 
+    def command(self, line: str) -> None:
+        """Send a line typed by the user"""
+        command, _, argument = line.partition(" ")
+
+        if command == "/join":
+            send(self.sock, argument.strip(), MessageType.JOIN, self.codec)
+
+        elif command == "/leave":
+            send(self.sock, argument.strip(), MessageType.LEAVE, self.codec)
+
+        elif command == "/msg":
+            room, _, text = argument.partition(" ")
+
+            send(
+                self.sock,
+                pack_room_message(room, text),
+                MessageType.MSG,
+                self.codec,
+            )
+
+        else:
+            send(self.sock, line, codec=self.codec)
+
     def run(self):
         """Chat client main loop"""
+        show_prompt = True
+
         while self.connected:
             try:
-                sys.stdout.write(self.prompt)
+                if show_prompt:
+                    sys.stdout.write(self.prompt)
 
-                sys.stdout.flush()
+                    sys.stdout.flush()
+
+                show_prompt = True
 
                 # Wait for input from stdin and socket
                 readable, writeable, exceptional = select.select(
@@ -262,17 +1622,25 @@ class ChatClient:
                         data = sys.stdin.readline().strip()
 
                         if data:
-                            send(self.sock, data)
+                            self.command(data)
 
                     elif sock == self.sock:
-                        data = receive(self.sock)
+                        frame = read_frame(self.sock, self.codec)
 
-                        if not data:
+                        if frame is None:
                             print("Client shutting down.")
                             self.connected = False
 
                             break
 
+                        msg_type, data = frame
+
+                        # Answer the heartbeat of the server silently
+                        if msg_type == MessageType.PING:
+                            send(self.sock, data, MessageType.PONG, self.codec)
+
+                            show_prompt = False
+
                         else:
                             sys.stdout.write(data + "\n")
 
@@ -296,18 +1664,291 @@ if __name__ == "__main__":
         "--port", action="store", dest="port", type=int, required=True
     )
 
+    parser.add_argument(
+        "--engine",
+        action="store",
+        dest="engine",
+        choices=ENGINES,
+        default="select",
+        help="Server event loop: select() or asyncio streams (epoll)",
+    )
+
+    parser.add_argument(
+        "--loop",
+        action="store",
+        dest="loop",
+        choices=sorted(BACKENDS),
+        default=None,
+        help="Server: event loop backend, select() or asyncio by engine",
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile of the server or the client",
+    )
+
+    parser.add_argument(
+        "--codec",
+        action="store",
+        dest="codec",
+        choices=tuple(CODECS),
+        default=BINARY_CODEC.name,
+        help="Client wire format: binary frames or legacy pickle",
+    )
+
+    parser.add_argument(
+        "--rooms",
+        action="store",
+        dest="rooms",
+        default="",
+        help="Client: comma separated rooms to join at startup",
+    )
+
+    parser.add_argument(
+        "--max-queue-bytes",
+        action="store",
+        dest="max_queue_bytes",
+        type=int,
+        default=MAX_QUEUE_BYTES,
+        help="Server: outbound bytes queued per client before it is slow",
+    )
+
+    parser.add_argument(
+        "--max-queue-frames",
+        action="store",
+        dest="max_queue_frames",
+        type=int,
+        default=MAX_QUEUE_FRAMES,
+        help="Server: outbound messages queued per client (select engine)",
+    )
+
+    parser.add_argument(
+        "--slow-consumer",
+        action="store",
+        dest="slow_consumer",
+        choices=SLOW_CONSUMER_POLICIES,
+        default="disconnect",
+        help="Server: drop messages for slow clients or disconnect them",
+    )
+
+    parser.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Server: number of processes sharing the port (SO_REUSEPORT)",
+    )
+
+    parser.add_argument(
+        "--legacy-pickle",
+        action="store_true",
+        dest="legacy_pickle",
+        help="Server: also accept old clients speaking the pickle codec",
+    )
+
+    parser.add_argument(
+        "--flush-delay",
+        action="store",
+        dest="flush_delay",
+        type=float,
+        default=0.0,
+        help="Server: seconds a client queue may wait to gather more frames "
+        "(select engine)",
+    )
+
+    parser.add_argument(
+        "--flush-bytes",
+        action="store",
+        dest="flush_bytes",
+        type=int,
+        default=FLUSH_BYTES,
+        help="Server: queued bytes sent without waiting for the flush delay",
+    )
+
+    parser.add_argument(
+        "--heartbeat-interval",
+        action="store",
+        dest="heartbeat_interval",
+        type=float,
+        default=HEARTBEAT_INTERVAL,
+        help="Server: seconds of silence before a client is pinged, 0 for none",
+    )
+
+    parser.add_argument(
+        "--idle-timeout",
+        action="store",
+        dest="idle_timeout",
+        type=float,
+        default=IDLE_TIMEOUT,
+        help="Server: seconds of silence before a client is disconnected, "
+        "0 for never",
+    )
+
+    parser.add_argument(
+        "--login-timeout",
+        action="store",
+        dest="login_timeout",
+        type=float,
+        default=LOGIN_TIMEOUT,
+        help="Server: seconds a new connection has to log in",
+    )
+
+    parser.add_argument(
+        "--history-frames",
+        action="store",
+        dest="history_frames",
+        type=int,
+        default=HISTORY_FRAMES,
+        help="Server: messages kept per room for joining clients, 0 for none",
+    )
+
+    parser.add_argument(
+        "--history-bytes",
+        action="store",
+        dest="history_bytes",
+        type=int,
+        default=HISTORY_BYTES,
+        help="Server: bytes of messages kept per room",
+    )
+
+    parser.add_argument(
+        "--history-dir",
+        action="store",
+        dest="history_dir",
+        default=None,
+        help="Server: keep the history in mmap files of this directory",
+    )
+
+    parser.add_argument(
+        "--history-rooms",
+        action="store",
+        dest="history_rooms",
+        type=int,
+        default=HISTORY_ROOMS,
+        help="Server: rooms whose history is kept, least recently used out",
+    )
+
+    parser.add_argument(
+        "--log-dir",
+        action="store",
+        dest="log_dir",
+        default=None,
+        help="Server: write every message to a durable log in this directory",
+    )
+
+    parser.add_argument(
+        "--log-fsync",
+        action="store",
+        dest="log_fsync",
+        type=float,
+        default=FSYNC_INTERVAL,
+        help="Server: seconds between syncs of the log, 0 for every batch",
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        action="store",
+        dest="metrics_port",
+        type=int,
+        default=None,
+        help="Server: serve /metrics on this local port (+1 per worker)",
+    )
+
+    parser.add_argument(
+        "--stats-interval",
+        action="store",
+        dest="stats_interval",
+        type=float,
+        default=0,
+        help="Server: seconds between stats lines on stderr, 0 for none",
+    )
+
     given_args = parser.parse_args()
 
+    if (
+        given_args.engine == "asyncio"
+        and given_args.loop is not None
+        and given_args.loop not in ASYNCIO_BACKENDS
+    ):
+        parser.error(
+            f"the asyncio engine cannot run on the {given_args.loop} backend,"
+            f" use one of: {', '.join(sorted(ASYNCIO_BACKENDS))}"
+        )
+
     port = given_args.port
 
     name = given_args.name
 
-    if name == CHAT_SERVER_NAME:
-        server = ChatServer(port)
+    def make_server(bus=None):
+        """Create a server of the selected engine, bus is set for workers"""
+        if given_args.engine == "asyncio":
+            return AsyncChatServer(
+                port,
+                allow_pickle=given_args.legacy_pickle,
+                max_queue_bytes=given_args.max_queue_bytes,
+                slow_consumer=given_args.slow_consumer,
+                reuse_port=bus is not None,
+                bus=bus,
+                metrics_port=given_args.metrics_port,
+                stats_interval=given_args.stats_interval,
+                heartbeat_interval=given_args.heartbeat_interval,
+                idle_timeout=given_args.idle_timeout,
+                login_timeout=given_args.login_timeout,
+                history_frames=given_args.history_frames,
+                history_bytes=given_args.history_bytes,
+                history_dir=given_args.history_dir,
+                history_rooms=given_args.history_rooms,
+                log_dir=given_args.log_dir,
+                log_fsync=given_args.log_fsync,
+                loop_backend=given_args.loop or "asyncio",
+                tuning=given_args.tuning,
+            )
+
+        return ChatServer(
+            port,
+            allow_pickle=given_args.legacy_pickle,
+            max_queue_bytes=given_args.max_queue_bytes,
+            max_queue_frames=given_args.max_queue_frames,
+            flush_delay=given_args.flush_delay,
+            flush_bytes=given_args.flush_bytes,
+            slow_consumer=given_args.slow_consumer,
+            reuse_port=bus is not None,
+            bus=bus,
+            metrics_port=given_args.metrics_port,
+            stats_interval=given_args.stats_interval,
+            heartbeat_interval=given_args.heartbeat_interval,
+            idle_timeout=given_args.idle_timeout,
+            login_timeout=given_args.login_timeout,
+            history_frames=given_args.history_frames,
+            history_bytes=given_args.history_bytes,
+            history_dir=given_args.history_dir,
+            history_rooms=given_args.history_rooms,
+            log_dir=given_args.log_dir,
+            log_fsync=given_args.log_fsync,
+            loop_backend=given_args.loop or "select",
+            tuning=given_args.tuning,
+        )
+
+    if name == CHAT_SERVER_NAME and given_args.workers > 1:
+        run_workers(given_args.workers, make_server)
+
+    elif name == CHAT_SERVER_NAME:
+        server = make_server()
 
         server.run()
 
     else:
-        client = ChatClient(name=name, port=port)
+        client = ChatClient(
+            name=name,
+            port=port,
+            codec=CODECS[given_args.codec],
+            rooms=[room for room in given_args.rooms.split(",") if room],
+            tuning=given_args.tuning,
+        )
 
         client.run()
@@ -0,0 +1,111 @@
+"""
+Per-connection state of the chat server.
+
+A ChatSession keeps what the server needs for every message of a client,
+computed once: the display name (name@host), the prefix put in front of its
+messages in each of its rooms, its codec and buffers, and traffic counters.
+
+The select engine creates the session when it accepts the connection, in
+the AWAIT_NAME state, and the session becomes ACTIVE once the login name is
+received. The asyncio engine creates it with the name, already ACTIVE.
+"""
+import socket  # Provide socket operations and some related functions
+import time  # Connection timestamp
+from enum import IntEnum
+
+
+class SessionState(IntEnum):
+    """Stage of the connection of a client"""
+
+    AWAIT_NAME = 1  # Connected, the login name is not received yet
+    ACTIVE = 2  # Logged in
+
+
+class ChatSession:
+    """A client connection"""
+
+    __slots__ = (
+        "channel",
+        "fd",
+        "address",
+        "state",
+        "name",
+        "display_name",
+        "rooms",
+        "codec",
+        "queue",
+        "decoder",
+        "connected_at",
+        "messages_in",
+        "messages_out",
+        "bytes_in",
+        "bytes_out",
+        "last_seen",
+        "timer",
+    )
+
+    def __init__(
+        self, channel, address, name=None, codec=None, queue=None, decoder=None
+    ):
+        self.channel = channel  # Client socket or stream writer
+        self.fd = channel.fileno() if isinstance(channel, socket.socket) else -1
+        self.address = address  # Client (host, port)
+        self.state = SessionState.AWAIT_NAME
+        self.name = None  # Login name
+        self.display_name = None  # name@host
+        self.rooms = {}  # Dict, mapping of joined rooms to message prefixes
+        self.codec = codec  # Wire format of the client
+        self.queue = queue  # Outbound queue (select engine)
+        self.decoder = decoder  # Incremental frame decoder (select engine)
+        self.connected_at = time.monotonic()
+        self.messages_in = 0  # Messages received from the client
+        self.messages_out = 0  # Messages queued for the client
+        self.bytes_in = 0  # Bytes received from the client
+        self.bytes_out = 0  # Bytes sent to the client
+        self.last_seen = self.connected_at  # Last time the client sent data
+        self.timer = None  # Login or idle timer on the timer wheel
+
+        if name is not None:
+            self.activate(name)
+
+    def activate(self, name: str) -> None:
+        """Record the login name of the client"""
+        self.name = name
+        self.display_name = "@".join((name, self.address[0]))
+        self.state = SessionState.ACTIVE
+
+    def read(self, scratch: memoryview) -> list:
+        """Read once from the readable socket and return complete frames.
+
+        Return None when the client closed the connection, BlockingIOError
+        is raised if there was nothing to read.
+        """
+        size = self.channel.recv_into(scratch)
+
+        if not size:
+            return None
+
+        self.bytes_in += size
+
+        frames = self.decoder.feed(scratch[:size])
+
+        self.messages_in += len(frames)
+
+        return frames
+
+    def push(self, frame: memoryview) -> bool:
+        """Queue a frame, return False if the queue is full"""
+        if not self.queue.push(frame):
+            return False
+
+        self.messages_out += 1
+
+        return True
+
+    def flush(self) -> int:
+        """Send queued frames without blocking, return the bytes sent"""
+        sent = self.queue.flush(self.channel)
+
+        self.bytes_out += sent
+
+        return sent
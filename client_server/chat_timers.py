@@ -0,0 +1,117 @@
+"""
+Hashed timer wheel driving the timeouts of the chat server.
+
+The wheel is a ring of slots, one per tick. A timer due in n ticks goes to
+the slot n ticks ahead of the cursor and waits n // len(slots) extra turns
+of the wheel, so scheduling and cancelling a timer are O(1) whatever the
+number of timers, and each tick only looks at the timers of one slot.
+
+Timers have the resolution of a tick, which is enough for idle and login
+timeouts. Activity does not reschedule a timer: the callback checks the
+last activity of its session and schedules itself again if needed.
+"""
+import math  # Round delays up to whole ticks
+import time  # Monotonic clock
+
+# Default resolution of the wheel, in seconds
+TICK = 1.0
+
+# Default number of slots, timers further away wait for several turns
+WHEEL_SLOTS = 512
+
+
+class Timer:
+    """A callback scheduled on a timer wheel"""
+
+    __slots__ = ("slot", "rounds", "callback", "args")
+
+    def __init__(self, slot: int, rounds: int, callback, args: tuple):
+        self.slot = slot  # Index of the slot holding the timer, -1 if done
+        self.rounds = rounds  # Turns of the wheel left before it is due
+        self.callback = callback
+        self.args = args
+
+
+class TimerWheel:
+    """Timers of a single event loop"""
+
+    def __init__(self, tick=TICK, slots=WHEEL_SLOTS, clock=time.monotonic):
+        self.tick = tick  # Seconds per slot
+        self.slots = [set() for _ in range(slots)]  # Timers of every slot
+        self.clock = clock
+        self.cursor = 0  # Slot of the next tick
+        self.next_tick = clock() + tick  # Time of the next tick
+        self.count = 0  # Number of scheduled timers
+
+    def __len__(self) -> int:
+        return self.count
+
+    def schedule(self, delay: float, callback, *args) -> Timer:
+        """Run callback(*args) in about delay seconds, return the timer"""
+        if not self.count:
+            # Nothing ran while the wheel was empty, start ticking from now
+            self.next_tick = max(self.next_tick, self.clock() + self.tick)
+
+        # Ticks after the next one, so that the timer never fires early
+        ticks = max(
+            0, math.ceil((self.clock() + delay - self.next_tick) / self.tick)
+        )
+
+        slot = (self.cursor + ticks) % len(self.slots)
+
+        timer = Timer(slot, ticks // len(self.slots), callback, args)
+
+        self.slots[slot].add(timer)
+
+        self.count += 1
+
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        """Remove a timer that has not fired yet"""
+        if timer.slot >= 0:
+            self.slots[timer.slot].discard(timer)
+
+            timer.slot = -1
+
+            self.count -= 1
+
+    def timeout(self) -> float:
+        """Return the seconds until the next tick, None if nothing is due"""
+        if not self.count:
+            return None
+
+        return max(0.0, self.next_tick - self.clock())
+
+    def advance(self) -> int:
+        """Run the timers due by now, return how many fired"""
+        now = self.clock()
+
+        fired = 0
+
+        while self.count and self.next_tick <= now:
+            slot = self.slots[self.cursor]
+
+            due = [timer for timer in slot if not timer.rounds]
+
+            for timer in slot:
+                timer.rounds -= 1
+
+            for timer in due:
+                slot.discard(timer)
+
+                timer.slot = -1
+
+                self.count -= 1
+
+            self.cursor = (self.cursor + 1) % len(self.slots)
+
+            self.next_tick += self.tick
+
+            # Callbacks may schedule new timers
+            for timer in due:
+                timer.callback(*timer.args)
+
+            fired += len(due)
+
+        return fired
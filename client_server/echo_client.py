@@ -1,14 +1,19 @@
 """echo-client.py"""
 
+import argparse
 import socket
 
+from socket_tuning import PROFILES, apply_profile, get_profile
+
 HOST = "127.0.0.1"
 PORT = 65432
 
 
-def echo_client(host: str, port: int) -> None:
+def echo_client(host: str, port: int, tuning="default") -> None:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST, PORT))
+        apply_profile(s, get_profile(tuning))
+
+        s.connect((host, port))
 
         s.sendall(b"Hello, world")
 
@@ -17,4 +22,26 @@ def echo_client(host: str, port: int) -> None:
         print(f"Received {data!r}")
 
 
-echo_client(host=HOST, port=PORT)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Echo client")
+
+    parser.add_argument("--host", action="store", dest="host", default=HOST)
+
+    parser.add_argument(
+        "--port", action="store", dest="port", type=int, default=PORT
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile",
+    )
+
+    given_args = parser.parse_args()
+
+    echo_client(
+        host=given_args.host, port=given_args.port, tuning=given_args.tuning
+    )
@@ -1,16 +1,26 @@
 """echo-server"""
 
+import argparse
 import socket
 
+from socket_tuning import PROFILES, apply_listener, describe, get_profile
+
 HOST = "127.0.0.1"
 PORT = 65432
 
 
-def echo_server(host: str, port: int) -> None:
+def echo_server(host: str, port: int, tuning="default") -> None:
+    profile = get_profile(tuning)
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+        # The connection inherits the options of the listening socket
+        apply_listener(server_socket, profile)
+
         server_socket.bind((host, port))
 
-        server_socket.listen()
+        server_socket.listen(profile.listen_backlog())
+
+        print(describe(server_socket, profile))
 
         conn, addr = server_socket.accept()
 
@@ -26,4 +36,26 @@ def echo_server(host: str, port: int) -> None:
                 conn.sendall(data)
 
 
-echo_server(host=HOST, port=PORT)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Echo server")
+
+    parser.add_argument("--host", action="store", dest="host", default=HOST)
+
+    parser.add_argument(
+        "--port", action="store", dest="port", type=int, default=PORT
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile",
+    )
+
+    given_args = parser.parse_args()
+
+    echo_server(
+        host=given_args.host, port=given_args.port, tuning=given_args.tuning
+    )
@@ -0,0 +1,257 @@
+"""
+Event loop backends of the servers.
+
+Every backend is a selectors.BaseSelector, so a server registers its
+sockets and waits for events the same way whatever the backend:
+
+- select, poll, epoll: the selectors of the standard library;
+- epoll-et: epoll in edge-triggered mode, an event is only reported when
+  the readiness of a socket changes, so the server must read until EAGAIN
+  (the selector has edge_triggered set);
+- asyncio, uvloop: the reader and writer callbacks of an asyncio event
+  loop, uvloop when it is installed.
+
+make_event_loop() returns the asyncio event loop of a backend for the
+servers built on asyncio streams.
+"""
+import asyncio  # Event loops of the asyncio backends
+import select  # Edge-triggered epoll flag
+import selectors  # Selectors of the standard library
+from collections.abc import Mapping
+
+try:
+    import uvloop  # Event loop on libuv, optional
+
+except ImportError:
+    uvloop = None
+
+
+def fileobj_to_fd(fileobj) -> int:
+    """Return the descriptor of a file object or a descriptor"""
+    fd = fileobj if isinstance(fileobj, int) else fileobj.fileno()
+
+    if fd < 0:
+        raise ValueError(f"Invalid file descriptor: {fd}")
+
+    return fd
+
+
+if hasattr(selectors, "EpollSelector"):
+
+    class EdgeEpollSelector(selectors.EpollSelector):
+        """epoll selector reporting changes of readiness only"""
+
+        edge_triggered = True
+
+        # Every registration carries EPOLLET, events never report it back
+        _EVENT_READ = select.EPOLLIN | select.EPOLLET
+        _EVENT_WRITE = select.EPOLLOUT | select.EPOLLET
+
+        def rearm(self, fileobj) -> None:
+            """Report the current readiness of a registered socket again.
+
+            modify() leaves epoll alone when the events do not change.
+            """
+            key = self.get_key(fileobj)
+
+            events = 0
+
+            if key.events & selectors.EVENT_READ:
+                events |= self._EVENT_READ
+
+            if key.events & selectors.EVENT_WRITE:
+                events |= self._EVENT_WRITE
+
+            self._selector.modify(key.fd, events)
+
+
+class SelectorKeys(Mapping):
+    """Mapping of the file objects of an AsyncioSelector to their keys"""
+
+    def __init__(self, keys: dict):
+        self.keys = keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __getitem__(self, fileobj) -> selectors.SelectorKey:
+        return self.keys[fileobj_to_fd(fileobj)]
+
+    def __iter__(self):
+        return iter(self.keys)
+
+
+class AsyncioSelector(selectors.BaseSelector):
+    """Selector waiting for events with an asyncio event loop.
+
+    The sockets are watched with the add_reader() and add_writer()
+    callbacks of the loop, select() runs the loop until one of them fires
+    or the timeout expires.
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
+        self.keys = {}  # Dict, mapping of descriptors to their keys
+        self.ready = {}  # Dict, events of descriptors since the last select
+
+    def watch(self, key: selectors.SelectorKey) -> None:
+        if key.events & selectors.EVENT_READ:
+            self.loop.add_reader(
+                key.fd, self.on_event, key.fd, selectors.EVENT_READ
+            )
+
+        if key.events & selectors.EVENT_WRITE:
+            self.loop.add_writer(
+                key.fd, self.on_event, key.fd, selectors.EVENT_WRITE
+            )
+
+    def unwatch(self, key: selectors.SelectorKey) -> None:
+        if key.events & selectors.EVENT_READ:
+            self.loop.remove_reader(key.fd)
+
+        if key.events & selectors.EVENT_WRITE:
+            self.loop.remove_writer(key.fd)
+
+    def on_event(self, fd: int, mask: int) -> None:
+        """Record an event and stop the loop after the current iteration"""
+        self.ready[fd] = self.ready.get(fd, 0) | mask
+
+        self.loop.stop()
+
+    def register(self, fileobj, events: int, data=None):
+        if not events or events & ~(
+            selectors.EVENT_READ | selectors.EVENT_WRITE
+        ):
+            raise ValueError(f"Invalid events: {events!r}")
+
+        fd = fileobj_to_fd(fileobj)
+
+        if fd in self.keys:
+            raise KeyError(f"{fileobj!r} (FD {fd}) is already registered")
+
+        key = self.keys[fd] = selectors.SelectorKey(fileobj, fd, events, data)
+
+        self.watch(key)
+
+        return key
+
+    def unregister(self, fileobj):
+        fd = fileobj_to_fd(fileobj)
+
+        key = self.keys.pop(fd)
+
+        self.unwatch(key)
+
+        self.ready.pop(fd, None)
+
+        return key
+
+    def modify(self, fileobj, events: int, data=None):
+        key = self.keys[fileobj_to_fd(fileobj)]
+
+        if events == key.events:
+            key = self.keys[key.fd] = key._replace(data=data)
+
+            return key
+
+        self.unregister(fileobj)
+
+        return self.register(fileobj, events, data)
+
+    def select(self, timeout=None) -> list:
+        if not self.ready:
+            stop = None
+
+            if timeout is not None:
+                stop = self.loop.call_later(max(timeout, 0), self.loop.stop)
+
+            self.loop.run_forever()
+
+            if stop is not None:
+                stop.cancel()
+
+        ready, self.ready = self.ready, {}
+
+        return [
+            (self.keys[fd], mask & self.keys[fd].events)
+            for fd, mask in ready.items()
+            if fd in self.keys
+        ]
+
+    def get_map(self) -> Mapping:
+        return SelectorKeys(self.keys)
+
+    def close(self) -> None:
+        for key in self.keys.values():
+            self.unwatch(key)
+
+        self.keys.clear()
+
+        self.loop.close()
+
+
+# Selector factories of the backends available on this system
+BACKENDS = {
+    "default": selectors.DefaultSelector,
+    "select": selectors.SelectSelector,
+}
+
+if hasattr(selectors, "PollSelector"):
+    BACKENDS["poll"] = selectors.PollSelector
+
+if hasattr(selectors, "EpollSelector"):
+    BACKENDS["epoll"] = selectors.EpollSelector
+
+    BACKENDS["epoll-et"] = EdgeEpollSelector
+
+BACKENDS["asyncio"] = AsyncioSelector
+
+if uvloop is not None:
+    BACKENDS["uvloop"] = lambda: AsyncioSelector(uvloop.new_event_loop())
+
+# Backends an asyncio event loop can run on, see make_event_loop()
+ASYNCIO_BACKENDS = tuple(
+    name
+    for name, factory in BACKENDS.items()
+    if name in ("default", "asyncio", "uvloop")
+    or not (
+        getattr(factory, "edge_triggered", False) or factory is AsyncioSelector
+    )
+)
+
+
+def make_selector(backend="default") -> selectors.BaseSelector:
+    """Return a selector of an event loop backend"""
+    try:
+        factory = BACKENDS[backend]
+
+    except KeyError:
+        raise ValueError(
+            f"Unknown or unavailable event loop backend: {backend}"
+        ) from None
+
+    return factory()
+
+
+def is_edge_triggered(selector: selectors.BaseSelector) -> bool:
+    """Tell whether a selector reports changes of readiness only"""
+    return getattr(selector, "edge_triggered", False)
+
+
+def make_event_loop(backend="asyncio") -> asyncio.AbstractEventLoop:
+    """Return an asyncio event loop waiting for events with a backend"""
+    if backend == "uvloop" and uvloop is not None:
+        return uvloop.new_event_loop()
+
+    if backend in ("asyncio", "default"):
+        return asyncio.new_event_loop()
+
+    selector = make_selector(backend)
+
+    # asyncio reads and writes once per event
+    if is_edge_triggered(selector) or isinstance(selector, AsyncioSelector):
+        selector.close()
+
+        raise ValueError(f"asyncio cannot run on the {backend} backend")
+
+    return asyncio.SelectorEventLoop(selector)
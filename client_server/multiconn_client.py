@@ -1,149 +1,374 @@
 """
 Multi-connection client.
-Send defined amount of messages to server and receive echo.
+Send messages to server through a pool of connections and receive echo.
+
+Requests are framed with their length and an id:
+
+    +-------------+-----------------+-------------+
+    | length (!I) | request id (!Q) |   payload   |
+    +-------------+-----------------+-------------+
+
+and pipelined: a connection sends the next request without waiting for
+the reply of the previous ones. The server (multiconn_server.py echoes
+the frames back) replies with the id of the request, which resolves the
+future of the request, so replies may come in any order.
+
+    async with ClientPool(HOST, PORT, connections=4) as pool:
+        reply = await pool.request(b"payload")
 """
 
+import argparse
+import asyncio
+import itertools
 import socket
-import selectors
-import types
+import struct
+
+from event_loops import ASYNCIO_BACKENDS, make_event_loop
+from socket_tuning import PROFILES, apply_profile, get_profile
+
+# Set address for connection
+HOST = "127.0.0.1"
+PORT = 65432
+
+# Payload length and id of a request or a reply
+REQUEST_HEADER = struct.Struct("!IQ")
+
+# Maximum number of bytes to receive in a single call
+READ_SIZE = 64 * 1024
 
+# Requests of a connection waiting for their reply
+MAX_INFLIGHT = 1024
 
-def start_connections(host: str, port: int, connections: int) -> None:
-    """Start connections"""
-    # Set address to connect with
-    server_addr = (host, port)
+# Ways of choosing the connection of a request
+DISPATCH_POLICIES = ("round-robin", "least-inflight")
+
+
+class PipelinedConnection:
+    """A persistent connection sending requests without waiting for replies"""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_inflight=MAX_INFLIGHT,
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.inflight = {}  # Dict, mapping of request ids to reply futures
+        self.window = asyncio.Semaphore(max_inflight)  # Requests in flight
+        self.ids = itertools.count()  # Ids of the requests
+        self.error = None  # Why the connection is closed, if it is
+        self.receiver = asyncio.create_task(self.receive())
+
+    @classmethod
+    async def open(
+        cls, host: str, port: int, max_inflight=MAX_INFLIGHT, tuning="default"
+    ):
+        """Connect to a server"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+        try:
+            # Small requests leave at once instead of waiting for a reply
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            apply_profile(sock, get_profile(tuning))
+
+            sock.setblocking(False)
+
+            await asyncio.get_running_loop().sock_connect(sock, (host, port))
+
+        except BaseException:
+            sock.close()
 
-    # Iterate through connection number
-    for i in range(0, connections):
-        # Set id to current connection
-        connection_id = i + 1
+            raise
 
-        print(f"Starting connection {connection_id} to {server_addr}")
+        reader, writer = await asyncio.open_connection(sock=sock)
 
-        # Create socket
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        return cls(reader, writer, max_inflight)
 
-        # Set a socket to non-blocking mode (not block execution by send/recv ... operations)
-        client_socket.setblocking(False)
+    @property
+    def closed(self) -> bool:
+        return self.error is not None
 
-        # Initiate a connection to a remote address
-        client_socket.connect_ex(server_addr)
+    async def send(self, payload: bytes) -> asyncio.Future:
+        """Send a request, return the future of its reply.
 
-        # Set combination of events for a socket connection
-        connection_events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        Waits only while the window of requests in flight is full or the
+        socket does not keep up.
+        """
+        await self.window.acquire()
 
-        # Set data to send
-        data = types.SimpleNamespace(
-            connid=connection_id,
-            msg_total=sum(len(_) for _ in messages),
-            recv_total=0,
-            messages=messages.copy(),
-            outb=b"",
+        if self.error is not None:
+            self.window.release()
+
+            raise self.error
+
+        request_id = next(self.ids)
+
+        future = asyncio.get_running_loop().create_future()
+
+        self.inflight[request_id] = future
+
+        self.writer.writelines(
+            (REQUEST_HEADER.pack(len(payload), request_id), payload)
         )
 
-        selector.register(client_socket, connection_events, data=data)
+        # Wait for the transport only above its high-water mark
+        if self.writer.transport.get_write_buffer_size() > READ_SIZE:
+            await self.writer.drain()
 
+        return future
 
-def service_connection(key, mask: int) -> None:
-    """Serve the connection"""
-    sock = key.fileobj
-    data = key.data
+    async def request(self, payload: bytes) -> bytes:
+        """Send a request and return its reply"""
+        return await (await self.send(payload))
 
-    # Check if there is a read event for socket
-    if mask & selectors.EVENT_READ:
-        # Set maximum number of bytes to receive in a single call
-        max_bytes_in_call = 1024
+    async def receive(self) -> None:
+        """Resolve the futures of the replies as they arrive"""
+        buffer = bytearray()
 
-        # Receive defined amount of data
-        recv_data = sock.recv(max_bytes_in_call)
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
 
-        # Check if there is a data in call
-        if recv_data:
-            print(f"Received {recv_data!r} from connection {data.connid}")
+                if not data:
+                    raise ConnectionError("Connection closed by the server")
 
-            # Count requests
-            data.recv_total += len(recv_data)
+                buffer += data
 
-        # Check if there is no data or
-        # amount of data received is equal to the total expected message size
-        if not recv_data or data.recv_total == data.msg_total:
-            print(f"Closing connection {data.connid}")
+                offset = 0
 
-            # Unregister socket from selector
-            selector.unregister(sock)
+                # Several replies usually come in a single read
+                with memoryview(buffer) as view:
+                    while len(view) - offset >= REQUEST_HEADER.size:
+                        length, request_id = REQUEST_HEADER.unpack_from(
+                            view, offset
+                        )
 
-            # Close socket
-            sock.close()
+                        end = offset + REQUEST_HEADER.size + length
 
-    # Check if there is a write event for socket
-    if mask & selectors.EVENT_WRITE:
-        # Check if there is no messages yet
-        if not data.outb and data.messages:
-            # Remove first item of 'messages' list and assign its value to 'data.outb' field
-            data.outb = data.messages.pop(0)
+                        if end > len(view):
+                            break
 
-        # Check if there is some message to send
-        if data.outb:
-            print(f"Sending {data.outb!r} to connection {data.connid}")
+                        self.resolve(
+                            request_id, bytes(view[end - length : end])
+                        )
 
-            # Send message to server
-            sent = sock.send(data.outb)
+                        offset = end
 
-            # Add message sent to list of sent messages
-            data.outb = data.outb[sent:]
+                del buffer[:offset]
 
+        except (ConnectionError, OSError) as error:
+            self.fail(error)
 
-def start_multi_connection_client(
-    connection_host: str, connection_port: int, number_of_connections: int
-) -> None:
-    """Start the multi-connection client"""
-    start_connections(
-        host=connection_host,
-        port=connection_port,
-        connections=number_of_connections,
-    )
+        except asyncio.CancelledError:
+            self.fail(ConnectionError("Connection closed"))
 
-    # Start listening
-    try:
-        while True:
-            # Set list of tuples like (key, mask) by invoking select() system call
-            events = selector.select(timeout=1)
+            raise
 
-            # Check for event
-            if events:
-                for key, mask in events:
-                    # key - represent the registered file object along with associated metadata
-                    # mask - integer representing the events that have occurred on the file object
+    def resolve(self, request_id: int, reply: bytes) -> None:
+        future = self.inflight.pop(request_id, None)
 
-                    # Serve connection
-                    service_connection(key=key, mask=mask)
+        # Replies to unknown or cancelled requests are ignored
+        if future is None:
+            return
 
-            # If mappings dictionary is empty, there are no registered file objects
-            # with the selector.
-            if not selector.get_map():
-                break
+        self.window.release()
 
-    except KeyboardInterrupt:
-        print("Caught keyboard interrupt, exiting")
+        if not future.done():
+            future.set_result(reply)
 
-    # Close
-    finally:
-        selector.close()
+    def fail(self, error: Exception) -> None:
+        """Fail the requests in flight once the connection is lost"""
+        self.error = error
 
+        for future in self.inflight.values():
+            self.window.release()
 
-# Set address for connection
-HOST = "127.0.0.1"
-PORT = 65432
+            if not future.done():
+                future.set_exception(error)
+
+        self.inflight.clear()
+
+    async def close(self) -> None:
+        self.receiver.cancel()
+
+        await asyncio.gather(self.receiver, return_exceptions=True)
+
+        self.writer.close()
+
+        try:
+            await self.writer.wait_closed()
+
+        except OSError:
+            pass
+
+
+class ClientPool:
+    """Requests spread over a few persistent pipelined connections"""
+
+    def __init__(
+        self,
+        host=HOST,
+        port=PORT,
+        connections=4,
+        dispatch="round-robin",
+        max_inflight=MAX_INFLIGHT,
+        tuning="default",
+    ):
+        if dispatch not in DISPATCH_POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {dispatch}")
+
+        self.host = host
+        self.port = port
+        self.size = connections  # Number of connections
+        self.dispatch = dispatch  # Way of choosing a connection
+        self.max_inflight = max_inflight  # Requests in flight per connection
+        self.tuning = tuning  # Socket tuning profile of the connections
+        self.connections = []  # Open connections
+        self.turn = itertools.count()  # Round-robin position
+
+    async def __aenter__(self):
+        await self.start()
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self) -> None:
+        """Open the connections"""
+        self.connections = list(
+            await asyncio.gather(
+                *(
+                    PipelinedConnection.open(
+                        self.host, self.port, self.max_inflight, self.tuning
+                    )
+                    for _ in range(self.size)
+                )
+            )
+        )
+
+    def pick(self) -> PipelinedConnection:
+        """Return the connection of the next request"""
+        connections = [conn for conn in self.connections if not conn.closed]
+
+        if not connections:
+            raise ConnectionError("No connection left in the pool")
+
+        if self.dispatch == "least-inflight":
+            return min(connections, key=lambda conn: len(conn.inflight))
+
+        return connections[next(self.turn) % len(connections)]
+
+    async def send(self, payload: bytes) -> asyncio.Future:
+        """Send a request, return the future of its reply"""
+        return await self.pick().send(payload)
+
+    async def request(self, payload: bytes) -> bytes:
+        """Send a request and return its reply"""
+        return await (await self.send(payload))
+
+    def inflight(self) -> int:
+        """Return the number of requests waiting for their reply"""
+        return sum(len(conn.inflight) for conn in self.connections)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(conn.close() for conn in self.connections))
+
+        self.connections = []
+
+
+async def start_multi_connection_client(
+    connection_host: str,
+    connection_port: int,
+    number_of_connections: int,
+    dispatch: str,
+    tuning="default",
+) -> None:
+    """Send every message on the pool and print the echoes"""
+    print(
+        f"Starting {number_of_connections} connections to "
+        f"{(connection_host, connection_port)}"
+    )
+
+    async with ClientPool(
+        connection_host,
+        connection_port,
+        number_of_connections,
+        dispatch,
+        tuning=tuning,
+    ) as pool:
+        # Every request is sent before the first reply is awaited
+        futures = [await pool.send(message) for message in messages]
+
+        for message, future in zip(messages, futures):
+            print(f"Sending {message!r}, received {await future!r}")
 
-# Set selector for events during connection
-selector = selectors.DefaultSelector()
 
 # Set message list to be sent to server (as a sequence of bytes)
 messages = [b"Message 1 from client. ", b"Message 2 from client. "]
 
-# Run client
-start_multi_connection_client(
-    connection_host=HOST,
-    connection_port=PORT,
-    number_of_connections=len(messages),
-)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-connection echo client")
+
+    parser.add_argument("--host", action="store", dest="host", default=HOST)
+
+    parser.add_argument(
+        "--port", action="store", dest="port", type=int, default=PORT
+    )
+
+    parser.add_argument(
+        "--connections",
+        action="store",
+        dest="connections",
+        type=int,
+        default=len(messages),
+    )
+
+    parser.add_argument(
+        "--dispatch",
+        action="store",
+        dest="dispatch",
+        choices=DISPATCH_POLICIES,
+        default="round-robin",
+        help="Way of choosing the connection of a request",
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile",
+    )
+
+    parser.add_argument(
+        "--loop",
+        action="store",
+        dest="loop",
+        choices=sorted(ASYNCIO_BACKENDS),
+        default="asyncio",
+        help="Event loop backend",
+    )
+
+    given_args = parser.parse_args()
+
+    # Run client
+    try:
+        with asyncio.Runner(
+            loop_factory=lambda: make_event_loop(given_args.loop)
+        ) as runner:
+            runner.run(
+                start_multi_connection_client(
+                    connection_host=given_args.host,
+                    connection_port=given_args.port,
+                    number_of_connections=given_args.connections,
+                    dispatch=given_args.dispatch,
+                    tuning=given_args.tuning,
+                )
+            )
+
+    except KeyboardInterrupt:
+        print("Caught keyboard interrupt, exiting")
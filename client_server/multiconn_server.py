@@ -1,118 +1,345 @@
 """
 Multi-connection server.
-Get defined amount of messages from client and send echo.
+Get messages from clients and send them back (echo).
+
+Every connection has a preallocated buffer: data is received with
+recv_into() at the end of the buffer and sent from its start, so no byte
+is copied whatever the backlog. Once everything is sent the buffer is
+reused from the start; a full buffer stops reading from the client until
+its echo is sent.
 """
 
-import socket
+import argparse
 import selectors
-import types
+import socket
 
+from event_loops import BACKENDS, is_edge_triggered, make_selector
+from socket_tuning import PROFILES, apply_listener, describe, get_profile
 
-def accept_wrapper(socket_to_wrapp: socket.socket):
-    """Accept the connection from client"""
-    # Set the socket as ready to read
-    connection, address = socket_to_wrapp.accept()
+# Set address for connection
+HOST = "127.0.0.1"
+PORT = 65432
 
-    print(f"Accepted connection from {address}")
+# Maximum number of bytes to receive in a single call
+READ_SIZE = 64 * 1024
+
+# Bytes of a connection waiting to be echoed, reading stops beyond
+BUFFER_SIZE = 256 * 1024
+
+
+class Connection:
+    """A client connection and its echo buffer"""
+
+    __slots__ = ("sock", "address", "buffer", "view", "start", "end", "events")
+
+    def __init__(self, sock: socket.socket, address: tuple, buffer_size: int):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte waiting to be sent
+        self.end = 0  # End of the bytes received
+        self.events = selectors.EVENT_READ  # Events monitored
+
+
+class MultiConnServer:
+    """Echo server handling many connections in a single event loop"""
+
+    def __init__(
+        self,
+        host=HOST,
+        port=PORT,
+        read_size=READ_SIZE,
+        buffer_size=BUFFER_SIZE,
+        loop="default",
+        verbose=False,
+        backlog=socket.SOMAXCONN,
+        tuning="default",
+    ):
+        self.read_size = min(read_size, buffer_size)  # Bytes per recv
+        self.buffer_size = buffer_size  # Echo buffer of a connection
+        self.verbose = verbose  # Print connections and payloads
+        self.selector = make_selector(loop)  # Event loop backend
+        self.edge_triggered = is_edge_triggered(self.selector)  # Read all
+        self.tuning = get_profile(tuning)  # Socket options of the clients
+        self.running = False  # Cleared to stop serve_forever()
+        self.connections = 0  # Connections accepted
+        self.bytes_echoed = 0  # Bytes sent back
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        # Accepted connections inherit the options of the listening socket
+        apply_listener(self.server_socket, self.tuning)
 
-    # Put the socket in non-blocking mode
-    connection.setblocking(False)
+        # Associate a socket with a specific network address
+        self.server_socket.bind((host, port))
 
-    # Create object to store data
-    data = types.SimpleNamespace(addr=address, inb=b"", outb=b"")
+        self.server_socket.listen(self.tuning.listen_backlog(backlog))
 
-    # Set event as ready to be read and write
-    events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        # Configure the socket in non-blocking mode
+        self.server_socket.setblocking(False)
 
-    # Register the socket to be monitored
-    selector.register(fileobj=connection, events=events, data=data)
+        # Register the socket to be monitored, without connection data
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
 
+    @property
+    def address(self) -> tuple:
+        return self.server_socket.getsockname()
 
-def service_connection(key, mask):
-    """Serve the connection"""
-    sock = key.fileobj
-    data = key.data
+    def __enter__(self):
+        return self
 
-    if mask & selectors.EVENT_READ:
-        # Set maximum number of bytes to receive in a single call
-        max_bytes_in_call = 1024
+    def __exit__(self, *exc_info):
+        self.close()
 
-        # Receive defined amount of data
-        recv_data = sock.recv(max_bytes_in_call)  # Should be ready to read
+    def accept(self) -> None:
+        """Accept the connections from clients"""
+        while True:
+            try:
+                sock, address = self.server_socket.accept()
 
-        # Check if there is a data in call
-        if recv_data:
-            # Count outbound data
-            data.outb += recv_data
+            except BlockingIOError:
+                return
 
-        else:
-            print(f"Closing connection to {data.addr}")
+            # Out of descriptors or the connection was aborted meanwhile
+            except OSError as error:
+                print(f"Accept failed: {error}")
 
-            # Unregister the socket
-            selector.unregister(sock)
+                return
 
-            # Close the socket
-            sock.close()
+            if self.verbose:
+                print(f"Accepted connection from {address}")
 
-    if mask & selectors.EVENT_WRITE:
-        if data.outb:
-            print(f"Echoing {data.outb!r} to {data.addr}")
+            # Put the socket in non-blocking mode
+            sock.setblocking(False)
 
-            sent = sock.send(data.outb)  # Should be ready to write
-            data.outb = data.outb[sent:]
+            connection = Connection(sock, address, self.buffer_size)
 
+            self.selector.register(sock, connection.events, connection)
 
-def start_multi_connection_server(host: str, port: int) -> None:
-    """Start the multi connection server"""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        # Associate a socket with a specific network address
-        server_socket.bind((host, port))
+            self.connections += 1
 
-        server_socket.listen()
+            # Edge-triggered backends report waiting connections once
+            if not self.edge_triggered:
+                return
 
-        # Configure the socket in non-blocking mode
-        server_socket.setblocking(False)
+    def close_connection(self, connection: Connection) -> None:
+        if self.verbose:
+            print(f"Closing connection to {connection.address}")
 
-        # Register the socket to be monitored
-        selector.register(
-            fileobj=server_socket, events=selectors.EVENT_READ, data=None
-        )
+        self.selector.unregister(connection.sock)
 
-        # Start listening
-        try:
-            while True:
-                # Set list of tuples like (key, mask) by invoking select() system call
-                events = selector.select(
-                    timeout=None
-                )  # blocks until there are sockets ready for I/O
-
-                for key, mask in events:
-                    # Check if there is a data in event
-                    # If No (it’s from the listening socket, you need to accept the connection)
-                    if key.data is None:
-                        accept_wrapper(socket_to_wrapp=key.fileobj)
-
-                    # If Yes (it’s a client socket that’s already been accepted,
-                    # and you need to service it)
-                    else:
-                        # Serve connection
-                        service_connection(key=key, mask=mask)
+        connection.sock.close()
 
-        # Catch server interruption by Ctrl-C
-        except KeyboardInterrupt:
-            print("Caught keyboard interrupt, exiting")
+    def read(self, connection: Connection) -> bool:
+        """Receive into the free end of the buffer, False once closed"""
+        while connection.end < self.buffer_size:
+            end = connection.end
 
-        # Close
-        finally:
-            selector.close()
+            try:
+                size = connection.sock.recv_into(
+                    connection.view[end : end + self.read_size]
+                )
 
+            except BlockingIOError:
+                break
 
-# Set address for connection
-HOST = "127.0.0.1"
-PORT = 65432
+            except OSError:
+                size = 0
+
+            if not size:
+                self.close_connection(connection)
+
+                return False
+
+            if self.verbose:
+                payload = bytes(connection.view[end : end + size])
+
+                print(f"Echoing {payload!r} to {connection.address}")
+
+            connection.end += size
+
+            # Edge-triggered backends need the socket read until EAGAIN
+            if not self.edge_triggered:
+                break
+
+        return True
+
+    def write(self, connection: Connection) -> bool:
+        """Send the data waiting in the buffer, False once closed"""
+        while connection.start < connection.end:
+            try:
+                sent = connection.sock.send(
+                    connection.view[connection.start : connection.end]
+                )
+
+            except BlockingIOError:
+                break
+
+            except OSError:
+                self.close_connection(connection)
 
-# Set selector for events during connection
-selector = selectors.DefaultSelector()
+                return False
 
-# Run server
-start_multi_connection_server(host=HOST, port=PORT)
+            connection.start += sent
+
+            self.bytes_echoed += sent
+
+            # Partial send, the socket buffer is full
+            if connection.start < connection.end:
+                break
+
+        if connection.start == connection.end:
+            # Everything was sent, reuse the buffer from its start
+            connection.start = connection.end = 0
+
+        elif connection.end == self.buffer_size:
+            # Move the rest to the front to make room for reading
+            pending = connection.end - connection.start
+
+            connection.view[:pending] = connection.view[
+                connection.start : connection.end
+            ]
+
+            connection.start, connection.end = 0, pending
+
+        return True
+
+    def service_connection(self, connection: Connection, mask: int) -> None:
+        """Serve the connection"""
+        if mask & selectors.EVENT_READ and not self.read(connection):
+            return
+
+        # Reading stopped on a full buffer rather than on EAGAIN
+        full = connection.end == self.buffer_size
+
+        # Echo at once, the socket is most likely writable
+        if not self.write(connection):
+            return
+
+        # Wait for writability only with data left, stop reading when full
+        events = 0
+
+        if connection.end < self.buffer_size:
+            events |= selectors.EVENT_READ
+
+        if connection.start < connection.end:
+            events |= selectors.EVENT_WRITE
+
+        if events != connection.events:
+            connection.events = events
+
+            self.selector.modify(connection.sock, events, connection)
+
+        # The data left unread raises no new edge-triggered event
+        elif full and self.edge_triggered:
+            self.selector.rearm(connection.sock)
+
+    def serve_forever(self, poll_interval=0.5) -> None:
+        """Serve until shutdown() is called"""
+        self.running = True
+
+        while self.running:
+            # Set list of tuples like (key, mask) by invoking select() system call
+            for key, mask in self.selector.select(poll_interval):
+                # Check if there is a data in event
+                # If No (it’s from the listening socket, you need to accept the connection)
+                if key.data is None:
+                    self.accept()
+
+                # If Yes (it’s a client socket that’s already been accepted,
+                # and you need to service it)
+                else:
+                    self.service_connection(key.data, mask)
+
+    def shutdown(self) -> None:
+        """Stop serve_forever() within a poll interval"""
+        self.running = False
+
+    def close(self) -> None:
+        """Close the connections and the server socket"""
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                key.data.sock.close()
+
+        self.selector.close()
+
+        self.server_socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-connection echo server")
+
+    parser.add_argument("--host", action="store", dest="host", default=HOST)
+
+    parser.add_argument(
+        "--port", action="store", dest="port", type=int, default=PORT
+    )
+
+    parser.add_argument(
+        "--loop",
+        action="store",
+        dest="loop",
+        choices=sorted(BACKENDS),
+        default="default",
+        help="Event loop backend",
+    )
+
+    parser.add_argument(
+        "--tuning",
+        action="store",
+        dest="tuning",
+        choices=tuple(PROFILES),
+        default="default",
+        help="Socket tuning profile",
+    )
+
+    parser.add_argument(
+        "--read-size",
+        action="store",
+        dest="read_size",
+        type=int,
+        default=READ_SIZE,
+        help="Maximum bytes received in a single call",
+    )
+
+    parser.add_argument(
+        "--buffer-size",
+        action="store",
+        dest="buffer_size",
+        type=int,
+        default=BUFFER_SIZE,
+        help="Bytes of a connection waiting to be echoed",
+    )
+
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        dest="verbose",
+        help="Print connections and echoed payloads",
+    )
+
+    given_args = parser.parse_args()
+
+    # Run server
+    with MultiConnServer(
+        host=given_args.host,
+        port=given_args.port,
+        read_size=given_args.read_size,
+        buffer_size=given_args.buffer_size,
+        loop=given_args.loop,
+        verbose=given_args.verbose,
+        tuning=given_args.tuning,
+    ) as server:
+        print(f"Echo server listening on {server.address}")
+
+        print(describe(server.server_socket, server.tuning))
+
+        # Start listening
+        try:
+            server.serve_forever()
+
+        # Catch server interruption by Ctrl-C
+        except KeyboardInterrupt:
+            print("Caught keyboard interrupt, exiting")
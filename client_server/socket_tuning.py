@@ -0,0 +1,159 @@
+"""
+Socket tuning profiles of the servers and clients.
+
+A profile is a set of socket options, the options it leaves to None keep
+the system default:
+
+- default: no option changed;
+- low-latency: Nagle's algorithm off (TCP_NODELAY), small messages leave
+  at once;
+- bulk-throughput: large send and receive buffers, Nagle's algorithm on
+  to fill the segments;
+- many-idle: small buffers, keepalive probes to drop dead peers and
+  TCP_DEFER_ACCEPT, so a connection wakes the server only once it sends
+  data.
+
+Servers apply a profile to the listening socket before listen(): Linux
+copies its options to the sockets it accepts, so accepting a client costs
+no extra system call. Clients apply it before connect(), see
+apply_profile().
+
+TCP_QUICKACK is not part of the profiles: the kernel clears it at its next
+delayed ACK decision, it would have to be set again after every recv().
+
+The kernel may round or double the values set (Linux doubles the buffer
+sizes for its own bookkeeping), effective_options() reads them back.
+"""
+import socket
+
+# Bytes of the buffers of each profile
+BULK_BUFFER_SIZE = 4 * 1024 * 1024
+IDLE_BUFFER_SIZE = 32 * 1024
+
+# Options read back from a socket: name, level and option, when available
+OPTIONS = tuple(
+    (name, level, getattr(socket, option))
+    for name, level, option in (
+        ("send_buffer", socket.SOL_SOCKET, "SO_SNDBUF"),
+        ("receive_buffer", socket.SOL_SOCKET, "SO_RCVBUF"),
+        ("nodelay", socket.IPPROTO_TCP, "TCP_NODELAY"),
+        ("keepalive", socket.SOL_SOCKET, "SO_KEEPALIVE"),
+        ("keepalive_idle", socket.IPPROTO_TCP, "TCP_KEEPIDLE"),
+        ("keepalive_interval", socket.IPPROTO_TCP, "TCP_KEEPINTVL"),
+        ("keepalive_count", socket.IPPROTO_TCP, "TCP_KEEPCNT"),
+        ("defer_accept", socket.IPPROTO_TCP, "TCP_DEFER_ACCEPT"),
+    )
+    if hasattr(socket, option)
+)
+
+
+class TuningProfile:
+    """Socket options of a profile, None keeps the system default"""
+
+    def __init__(
+        self,
+        name: str,
+        backlog=None,
+        nodelay=None,
+        defer_accept=None,
+        keepalive=None,
+        keepalive_idle=None,
+        keepalive_interval=None,
+        keepalive_count=None,
+        send_buffer=None,
+        receive_buffer=None,
+    ):
+        self.name = name
+        self.backlog = backlog  # Connections waiting to be accepted
+        self.nodelay = nodelay  # Disable Nagle's algorithm
+        self.defer_accept = defer_accept  # Seconds to wait for client data
+        self.keepalive = keepalive  # Probe idle peers
+        self.keepalive_idle = keepalive_idle  # Idle seconds before probing
+        self.keepalive_interval = keepalive_interval  # Seconds between probes
+        self.keepalive_count = keepalive_count  # Probes lost to drop a peer
+        self.send_buffer = send_buffer  # SO_SNDBUF, bytes
+        self.receive_buffer = receive_buffer  # SO_RCVBUF, bytes
+
+    def listen_backlog(self, default=socket.SOMAXCONN) -> int:
+        """Return the backlog of listen(), default if the profile has none"""
+        return self.backlog if self.backlog is not None else default
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        TuningProfile("default"),
+        TuningProfile("low-latency", backlog=socket.SOMAXCONN, nodelay=True),
+        TuningProfile(
+            "bulk-throughput",
+            backlog=socket.SOMAXCONN,
+            nodelay=False,
+            send_buffer=BULK_BUFFER_SIZE,
+            receive_buffer=BULK_BUFFER_SIZE,
+        ),
+        TuningProfile(
+            "many-idle",
+            backlog=socket.SOMAXCONN,
+            defer_accept=10,
+            keepalive=True,
+            keepalive_idle=60,
+            keepalive_interval=10,
+            keepalive_count=5,
+            send_buffer=IDLE_BUFFER_SIZE,
+            receive_buffer=IDLE_BUFFER_SIZE,
+        ),
+    )
+}
+
+
+def get_profile(name="default") -> TuningProfile:
+    """Return a tuning profile by name"""
+    try:
+        return PROFILES[name]
+
+    except KeyError:
+        raise ValueError(f"Unknown tuning profile: {name}") from None
+
+
+def apply_profile(sock: socket.socket, profile: TuningProfile) -> None:
+    """Set the options of a profile on a socket.
+
+    Call it before connect(): the window scale is agreed during the TCP
+    handshake from the receive buffer size, a buffer enlarged later is
+    not fully used. Options the platform does not have are skipped,
+    TCP_DEFER_ACCEPT is only set on listening sockets (see
+    apply_listener()).
+    """
+    for name, level, option in OPTIONS:
+        value = getattr(profile, name)
+
+        if value is None or name == "defer_accept":
+            continue
+
+        sock.setsockopt(level, option, int(value))
+
+
+def apply_listener(sock: socket.socket, profile: TuningProfile) -> None:
+    """Set the options of a profile on a server socket before listen()"""
+    apply_profile(sock, profile)
+
+    if profile.defer_accept is not None and hasattr(socket, "TCP_DEFER_ACCEPT"):
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, profile.defer_accept
+        )
+
+
+def effective_options(sock: socket.socket) -> dict:
+    """Return the values of the tuning options read back from a socket"""
+    return {
+        name: sock.getsockopt(level, option) for name, level, option in OPTIONS
+    }
+
+
+def describe(sock: socket.socket, profile: TuningProfile) -> str:
+    """Return a log line of the profile and the effective socket options"""
+    options = ", ".join(
+        f"{name}={value}" for name, value in effective_options(sock).items()
+    )
+
+    return f"Socket tuning {profile.name}: {options}"
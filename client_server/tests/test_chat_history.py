@@ -0,0 +1,39 @@
+"""History of the chat rooms"""
+import os
+
+import pytest
+
+from chat_history import RoomHistory
+from chat_protocol import BINARY_CODEC
+
+
+def frame(text: str) -> memoryview:
+    return BINARY_CODEC.encode(text)
+
+
+@pytest.mark.parametrize("in_files", [False, True])
+def test_least_recently_used_rooms_are_forgotten(tmp_path, in_files):
+    history = RoomHistory(
+        directory=str(tmp_path) if in_files else None, max_rooms=3
+    )
+
+    for room in ("a", "b", "c"):
+        history.append(room, frame(room))
+
+    # Replaying a room counts as a use
+    history.replay("a")
+
+    history.append("d", frame("d"))
+
+    assert list(history.rooms) == ["c", "a", "d"]
+    assert history.replay("b") == []
+    assert [bytes(f) for f in history.replay("a")] == [bytes(frame("a"))]
+
+    if in_files:
+        assert sorted(os.listdir(tmp_path)) == [
+            "a.history",
+            "c.history",
+            "d.history",
+        ]
+
+    history.close()
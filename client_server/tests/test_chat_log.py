@@ -0,0 +1,85 @@
+"""Writing and following the chat log"""
+import os
+import time
+
+import pytest
+
+import chat_log
+from chat_log import ChatLog, LogFollower, list_segments, read_log, write_all
+
+
+@pytest.fixture
+def log(tmp_path):
+    # Written from the test, without the writer thread
+    log = ChatLog(str(tmp_path), segment_bytes=256)
+
+    yield log
+
+    os.close(log.fd)
+    os.close(log.index_fd)
+
+
+def message(text: str) -> tuple:
+    return time.time(), "lobby", "alice", text
+
+
+def texts(records) -> list:
+    return [record[3] for record in records]
+
+
+def test_follow_rollover(log):
+    follower = LogFollower(log.directory)
+
+    log.write([message("first %d" % i) for i in range(10)])
+
+    assert len(list_segments(log.directory)) > 1
+    assert texts(follower.poll()) == ["first %d" % i for i in range(10)]
+    assert follower.poll() == []
+
+
+def test_follow_records_written_before_a_roll(log, monkeypatch):
+    follower = LogFollower(log.directory)
+
+    follower.poll()
+
+    # The writer appends to the segment being read, then starts the next
+    # one, between the read of the follower and its look for new segments
+    def list_segments_after_roll(directory):
+        monkeypatch.undo()
+
+        log.write([message("last of the segment")])
+        log.write([message("x" * 200)])
+
+        return list_segments(directory)
+
+    monkeypatch.setattr(chat_log, "list_segments", list_segments_after_roll)
+
+    assert texts(follower.poll()) == ["last of the segment", "x" * 200]
+
+
+def test_write_all_short_writes(tmp_path, monkeypatch):
+    buffers = [b"header", b"payload" * 10, b"tail"]
+
+    write = os.write
+
+    # Every call writes at most 5 bytes
+    monkeypatch.setattr(os, "writev", lambda fd, chunk: write(fd, chunk[0][:5]))
+    monkeypatch.setattr(os, "write", lambda fd, data: write(fd, data[:5]))
+
+    path = tmp_path / "out"
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT)
+
+    try:
+        write_all(fd, buffers)
+
+    finally:
+        os.close(fd)
+
+    assert path.read_bytes() == b"".join(buffers)
+
+
+def test_read_log(log):
+    log.write([message("one"), message("two")])
+
+    assert texts(read_log(log.directory)) == ["one", "two"]
@@ -0,0 +1,146 @@
+"""Login handshake of the select engine of the chat server"""
+import select
+import signal
+import socket
+import time
+
+import pytest
+
+from chat_protocol import BINARY_CODEC, MessageType
+from chat_server import ChatServer
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    handler = signal.getsignal(signal.SIGINT)
+
+    def make_server(**kwargs) -> ChatServer:
+        server = ChatServer(0, **kwargs)
+
+        servers.append(server)
+
+        return server
+
+    yield make_server
+
+    for server in servers:
+        for session in [*server.sessions.values(), *server.handshakes.values()]:
+            session.channel.close()
+
+        server.selector.close()
+        server.server.close()
+
+    signal.signal(signal.SIGINT, handler)
+
+
+def connect(server: ChatServer, *frames) -> socket.socket:
+    """Connect a client sending frames, accepted by the server"""
+    client = socket.create_connection(server.server.getsockname())
+
+    select.select([server.server], [], [], 1.0)
+
+    server.accept()
+
+    client.sendall(
+        b"".join(BINARY_CODEC.encode(text, kind) for text, kind in frames)
+    )
+
+    # The login frames are waiting for the handshake
+    select.select(
+        [session.channel for session in server.handshakes.values()],
+        [],
+        [],
+        1.0,
+    )
+
+    return client
+
+
+def handshake(server: ChatServer) -> None:
+    for session in list(server.handshakes.values()):
+        server.handshake(session)
+
+
+def test_login(make_server):
+    server = make_server()
+
+    client = connect(server, ("NAME: alice", MessageType.NAME))
+
+    with client:
+        handshake(server)
+
+        assert server.clients == 1
+        assert not server.handshakes
+
+
+def test_login_without_login_timeout(make_server):
+    server = make_server(login_timeout=0)
+
+    client = connect(server, ("NAME: alice", MessageType.NAME))
+
+    with client:
+        handshake(server)
+
+        assert server.clients == 1
+
+
+def test_malformed_frame_behind_the_login(make_server):
+    server = make_server()
+
+    # A room message without a room separator, in the login segment
+    client = connect(
+        server,
+        ("NAME: mallory", MessageType.NAME),
+        ("no room name", MessageType.MSG),
+    )
+
+    with client:
+        handshake(server)
+
+        # Only that client is disconnected
+        assert server.clients == 0
+        assert not server.sessions
+
+        client.settimeout(1.0)
+
+        while client.recv(4096):
+            pass
+
+        other = connect(server, ("NAME: bob", MessageType.NAME))
+
+        with other:
+            handshake(server)
+
+            assert server.clients == 1
+
+
+def ticks_ahead(server: ChatServer, timer) -> int:
+    """Return the ticks of the timer wheel before a timer fires"""
+    slots = len(server.timers.slots)
+
+    return timer.rounds * slots + (timer.slot - server.timers.cursor) % slots
+
+
+def test_idle_check_before_a_longer_heartbeat(make_server):
+    server = make_server(heartbeat_interval=60, idle_timeout=3)
+
+    client = connect(server, ("NAME: alice", MessageType.NAME))
+
+    with client:
+        handshake(server)
+
+        (session,) = server.sessions.values()
+
+        # Checked by the idle timeout, not by the ping 60 seconds later
+        assert ticks_ahead(server, session.timer) <= 3
+
+        # The client was active meanwhile
+        server.timers.cancel(session.timer)
+
+        session.last_seen = time.monotonic()
+
+        server.check_idle(session)
+
+        assert ticks_ahead(server, session.timer) <= 3
@@ -0,0 +1,61 @@
+"""Echo server of the benchmarks"""
+import errno
+import socket
+import threading
+
+import pytest
+
+from multiconn_server import MultiConnServer
+
+
+class FailingListener:
+    """Listening socket whose accept() fails"""
+
+    def __init__(self, sock: socket.socket, error: int):
+        self.sock = sock
+        self.error = error
+
+    def accept(self):
+        raise OSError(self.error, "accept failed")
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+@pytest.fixture
+def server():
+    server = MultiConnServer(port=0)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+
+    yield server, thread
+
+    server.running = False
+
+    if thread.is_alive():
+        thread.join(2.0)
+
+    server.close()
+
+
+@pytest.mark.parametrize("error", [errno.ECONNABORTED, errno.EMFILE])
+def test_accept_errors_keep_the_server_up(server, error, capsys):
+    server, thread = server
+
+    listener = server.server_socket
+
+    server.server_socket = FailingListener(listener, error)
+
+    server.accept()
+
+    server.server_socket = listener
+
+    assert "Accept failed" in capsys.readouterr().out
+
+    # The server still echoes
+    thread.start()
+
+    with socket.create_connection(server.address, timeout=2.0) as client:
+        client.sendall(b"ping")
+
+        assert client.recv(4) == b"ping"
@@ -0,0 +1,339 @@
+"""
+Cached DNS resolver running getaddrinfo() in a thread pool.
+
+getaddrinfo() blocks, so lookups run in worker threads and return futures:
+an event loop awaits them (resolve_async) instead of stalling, and many
+names are resolved at once (resolve_all). Answers are kept in an LRU
+cache for 'ttl' seconds; names that do not exist are remembered for
+'negative_ttl' seconds, so they are not looked up again on every call.
+Concurrent lookups of the same name share a single getaddrinfo() call.
+
+getaddrinfo() does not return the TTL of the DNS records, every answer is
+kept for the same time.
+
+    resolver = Resolver()
+    addresses = resolver.resolve("www.python.org", 443)
+    results = resolver.resolve_all(["python.org", "pypi.org"])
+    addresses = await resolver.resolve_async("python.org", 443)
+
+A HostsFile answers from a file in the /etc/hosts format instead of DNS:
+
+    resolver = Resolver(getaddrinfo=HostsFile("hosts.txt"))
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+# Answers kept in the cache
+MAX_ENTRIES = 1024
+
+# Seconds an answer, or the absence of an answer, is kept
+TTL = 300.0
+NEGATIVE_TTL = 30.0
+
+# Lookups running at once
+WORKERS = 8
+
+# Errors meaning the name does not exist, other errors are not cached
+NEGATIVE_ERRORS = tuple(
+    getattr(socket, name)
+    for name in ("EAI_NONAME", "EAI_NODATA")
+    if hasattr(socket, name)
+)
+
+# Protocols of the socket types, as getaddrinfo() returns them
+PROTOCOLS = {
+    socket.SOCK_STREAM: socket.IPPROTO_TCP,
+    socket.SOCK_DGRAM: socket.IPPROTO_UDP,
+}
+
+
+class HostsFile:
+    """A getaddrinfo() answering from a file in the /etc/hosts format"""
+
+    def __init__(self, path="/etc/hosts"):
+        self.path = path
+        self.names = {}  # Dict, mapping of lower case names to addresses
+
+        with open(path) as hosts:
+            for line in hosts:
+                fields = line.split("#", 1)[0].split()
+
+                # Blank and comment lines, or an address without names
+                if len(fields) < 2:
+                    continue
+
+                address, *names = fields
+
+                family = socket.AF_INET6 if ":" in address else socket.AF_INET
+
+                for name in names:
+                    self.names.setdefault(name.lower(), []).append(
+                        (family, address)
+                    )
+
+    def __call__(
+        self, host, port, family=0, type=socket.SOCK_STREAM, proto=0, flags=0
+    ) -> list:
+        entries = [
+            (af, address)
+            for af, address in self.names.get(host.lower(), ())
+            if family in (0, af)
+        ]
+
+        if not entries:
+            raise socket.gaierror(
+                socket.EAI_NONAME, "Name or service not known"
+            )
+
+        types = (type,) if type else tuple(PROTOCOLS)
+
+        return [
+            (
+                af,
+                sock_type,
+                PROTOCOLS[sock_type],
+                "",
+                (address, port)
+                if af == socket.AF_INET
+                else (address, port, 0, 0),
+            )
+            for af, address in entries
+            for sock_type in types
+        ]
+
+
+class Resolver:
+    """getaddrinfo() in worker threads, with an LRU cache of the answers"""
+
+    def __init__(
+        self,
+        max_entries=MAX_ENTRIES,
+        ttl=TTL,
+        negative_ttl=NEGATIVE_TTL,
+        workers=WORKERS,
+        getaddrinfo=socket.getaddrinfo,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries  # Answers kept in the cache
+        self.ttl = ttl  # Seconds an answer is kept
+        self.negative_ttl = negative_ttl  # Seconds an unknown name is kept
+        self.getaddrinfo = getaddrinfo  # Blocking lookup function
+        self.clock = clock
+        self.cache = OrderedDict()  # Key to (expiry, addresses, error)
+        self.pending = {}  # Dict, mapping of keys to running lookups
+        self.lock = threading.Lock()
+        self.hits = 0  # Answers from the cache or from a running lookup
+        self.misses = 0  # Lookups started
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="resolver"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(
+        self, host: str, port=0, family=0, type=socket.SOCK_STREAM
+    ) -> Future:
+        """Return the future of the getaddrinfo() entries of a name"""
+        key = (host, port, family, type)
+
+        with self.lock:
+            entry = self.cache.get(key)
+
+            if entry is not None:
+                expiry, addresses, error = entry
+
+                if expiry > self.clock():
+                    self.cache.move_to_end(key)
+
+                    self.hits += 1
+
+                    future = Future()
+
+                    if error is not None:
+                        future.set_exception(
+                            socket.gaierror(error.errno, error.strerror)
+                        )
+
+                    else:
+                        future.set_result(addresses)
+
+                    return future
+
+                del self.cache[key]
+
+            future = self.pending.get(key)
+
+            if future is not None:
+                self.hits += 1
+
+                return future
+
+            self.misses += 1
+
+            future = self.pending[key] = self.executor.submit(
+                self.lookup, host, port, family, type
+            )
+
+        future.add_done_callback(partial(self.store, key))
+
+        return future
+
+    def lookup(self, host: str, port: int, family: int, type: int) -> list:
+        return list(self.getaddrinfo(host, port, family, type))
+
+    def store(self, key: tuple, future: Future) -> None:
+        """Cache the answer of a lookup"""
+        with self.lock:
+            self.pending.pop(key, None)
+
+            if future.cancelled():
+                return
+
+            error = future.exception()
+
+            if error is None:
+                self.cache[key] = (
+                    self.clock() + self.ttl,
+                    future.result(),
+                    None,
+                )
+
+            elif (
+                isinstance(error, socket.gaierror)
+                and error.errno in NEGATIVE_ERRORS
+            ):
+                self.cache[key] = (
+                    self.clock() + self.negative_ttl,
+                    None,
+                    error,
+                )
+
+            else:
+                # Temporary failures are tried again on the next call
+                return
+
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def resolve(
+        self, host: str, port=0, family=0, type=socket.SOCK_STREAM
+    ) -> list:
+        """Return the getaddrinfo() entries of a name, waiting for them"""
+        return self.submit(host, port, family, type).result()
+
+    async def resolve_async(
+        self, host: str, port=0, family=0, type=socket.SOCK_STREAM
+    ) -> list:
+        """Return the getaddrinfo() entries of a name without blocking"""
+        # Other callers may wait for the same lookup, do not cancel it
+        return await asyncio.shield(
+            asyncio.wrap_future(self.submit(host, port, family, type))
+        )
+
+    def resolve_all(
+        self, hosts, port=0, family=0, type=socket.SOCK_STREAM
+    ) -> dict:
+        """Resolve many names at once, return their entries or errors"""
+        futures = {
+            host: self.submit(host, port, family, type) for host in hosts
+        }
+
+        results = {}
+
+        for host, future in futures.items():
+            try:
+                results[host] = future.result()
+
+            except OSError as error:
+                results[host] = error
+
+        return results
+
+    async def resolve_all_async(
+        self, hosts, port=0, family=0, type=socket.SOCK_STREAM
+    ) -> dict:
+        """Resolve many names at once without blocking"""
+        hosts = list(dict.fromkeys(hosts))
+
+        results = await asyncio.gather(
+            *(self.resolve_async(host, port, family, type) for host in hosts),
+            return_exceptions=True,
+        )
+
+        return dict(zip(hosts, results))
+
+    def gethostbyname(self, host: str) -> str:
+        """Return the first IPv4 address of a name"""
+        return self.resolve(host, family=socket.AF_INET)[0][4][0]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.cache.clear()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def describe(result) -> str:
+    """Return the addresses of an answer, or its error"""
+    if isinstance(result, Exception):
+        return f"error: {result}"
+
+    return ", ".join(dict.fromkeys(entry[4][0] for entry in result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resolve many host names")
+    parser.add_argument("hosts", nargs="+", help="Host names")
+
+    parser.add_argument(
+        "--hosts-file",
+        action="store",
+        dest="hosts_file",
+        default=None,
+        help="Answer from a file in the /etc/hosts format instead of DNS",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        action="store",
+        dest="repeat",
+        type=int,
+        default=2,
+        help="Resolve the names that many times",
+    )
+
+    given_args = parser.parse_args()
+
+    lookup = (
+        HostsFile(given_args.hosts_file)
+        if given_args.hosts_file
+        else socket.getaddrinfo
+    )
+
+    with Resolver(getaddrinfo=lookup) as resolver:
+        for attempt in range(given_args.repeat):
+            start = time.perf_counter()
+
+            answers = resolver.resolve_all(given_args.hosts)
+
+            elapsed = time.perf_counter() - start
+
+            for host, answer in answers.items():
+                print(f"{host}: {describe(answer)}")
+
+            print(
+                f"Pass {attempt + 1}: {elapsed * 1000:.1f} ms, "
+                f"{resolver.hits} hits, {resolver.misses} misses"
+            )
@@ -1,16 +1,16 @@
-import socket
+from service_registry import ServiceRegistry
 
 
-def find_service_name():
+def find_service_name(registry: ServiceRegistry):
     protocol_name = "tcp"
 
-    for port in [80, 25]:
-        service_name = socket.getservbyport(port, protocol_name)
+    ports = [80, 25]
 
+    for port, service_name in zip(
+        ports, registry.names_of(ports, protocol_name)
+    ):
         print(f"Port: {port} => service name: {service_name}")
-        print(
-            f"Port: {port} => service name: {socket.getservbyport(53, 'udp')}"
-        )
+        print(f"Port: {port} => service name: {registry.name_of(53, 'udp')}")
 
 
-find_service_name()
+find_service_name(ServiceRegistry())
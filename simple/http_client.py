@@ -0,0 +1,490 @@
+"""
+HTTP/1.1 client reusing its connections.
+
+Connections are kept open after a response (keep-alive) in a pool per
+host, so fetching many pages from a server costs a single TCP (and TLS)
+handshake per connection. Responses are received with recv_into() into a
+preallocated buffer; a body of known length (Content-Length or chunk
+size) is received straight into its own buffer, or into one given by the
+caller.
+
+    pool = ConnectionPool()
+    response = pool.request("GET", "http://localhost:8080/index.html")
+    responses = pool.fetch_all(urls)
+"""
+import argparse
+import socket
+import ssl
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Size of the receive buffer of a connection, the largest response head
+BUFFER_SIZE = 64 * 1024
+
+# Idle connections kept per host
+MAX_IDLE = 4
+
+# Seconds to wait for a connection or for data
+TIMEOUT = 10.0
+
+# Methods safe to send again on a new connection
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+class HTTPError(OSError):
+    """Malformed or unexpected HTTP response"""
+
+
+class Response:
+    """Status, headers and body of an HTTP response"""
+
+    def __init__(self, version: str, status: int, reason: str, headers: dict):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # Dict, lower case names
+        self.body = b""  # Bytes-like body
+        self.will_close = False  # The server closes the connection
+
+    def text(self, encoding="utf-8") -> str:
+        return str(self.body, encoding, "replace")
+
+
+class HTTPConnection:
+    """A persistent connection to an HTTP server"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        scheme="http",
+        timeout=TIMEOUT,
+        buffer_size=BUFFER_SIZE,
+    ):
+        self.host = host
+        self.port = port
+        self.scheme = scheme
+        self.buffer = bytearray(buffer_size)  # Receive buffer
+        self.view = memoryview(self.buffer)
+        self.start = 0  # First byte received and not parsed
+        self.end = 0  # End of the bytes received
+        self.requests = 0  # Requests sent on the connection
+
+        self.sock = socket.create_connection((host, port), timeout)
+
+        # Requests leave at once, they are not followed by more data
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if scheme == "https":
+            self.sock = ssl.create_default_context().wrap_socket(
+                self.sock, server_hostname=host
+            )
+
+    @property
+    def key(self) -> tuple:
+        return self.scheme, self.host, self.port
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def fill(self) -> int:
+        """Receive more data at the end of the buffer, return its size"""
+        if self.end == len(self.buffer):
+            if not self.start:
+                raise HTTPError("Response head larger than the buffer")
+
+            # Move the unparsed bytes to the front
+            size = self.end - self.start
+
+            self.view[:size] = self.view[self.start : self.end]
+
+            self.start, self.end = 0, size
+
+        received = self.sock.recv_into(self.view[self.end :])
+
+        self.end += received
+
+        return received
+
+    def read_until(self, delimiter: bytes) -> memoryview:
+        """Return the bytes up to a delimiter, which is skipped"""
+        while True:
+            index = self.buffer.find(delimiter, self.start, self.end)
+
+            if index >= 0:
+                data = self.view[self.start : index]
+
+                self.start = index + len(delimiter)
+
+                return data
+
+            if not self.fill():
+                raise ConnectionResetError("Connection closed by the server")
+
+    def read_into(self, target: memoryview) -> None:
+        """Fill a buffer with the next bytes of the response"""
+        # Bytes already received first, the rest straight into the target
+        size = min(len(target), self.end - self.start)
+
+        target[:size] = self.view[self.start : self.start + size]
+
+        self.start += size
+
+        while size < len(target):
+            received = self.sock.recv_into(target[size:])
+
+            if not received:
+                raise ConnectionResetError("Connection closed in a body")
+
+            size += received
+
+    def read_to_close(self) -> bytearray:
+        """Return the rest of a response delimited by the end of connection"""
+        body = bytearray(self.view[self.start : self.end])
+
+        self.start = self.end = 0
+
+        while True:
+            received = self.sock.recv_into(self.view)
+
+            if not received:
+                return body
+
+            body += self.view[:received]
+
+    def send(self, method: str, target: str, headers=None, body=b"") -> None:
+        """Send a request"""
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}"]
+
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+
+        if body or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body)}")
+
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        # Head and body leave in a single segment when they fit
+        self.sock.sendall(head + body if len(body) < BUFFER_SIZE else head)
+
+        if len(body) >= BUFFER_SIZE:
+            self.sock.sendall(body)
+
+        self.requests += 1
+
+    def read_head(self) -> Response:
+        """Read the status line and the headers of a response"""
+        status_line, *header_lines = str(
+            self.read_until(b"\r\n\r\n"), "latin-1"
+        ).split("\r\n")
+
+        try:
+            version, status, *reason = status_line.split(" ", 2)
+
+            status = int(status)
+
+        except ValueError:
+            raise HTTPError(f"Bad status line: {status_line!r}") from None
+
+        headers = {}
+
+        for line in header_lines:
+            name, _, value = line.partition(":")
+
+            name = name.strip().lower()
+
+            # Repeated headers are joined, as in a list header
+            if name in headers:
+                headers[name] += ", " + value.strip()
+
+            else:
+                headers[name] = value.strip()
+
+        return Response(version, status, reason[0] if reason else "", headers)
+
+    def read_chunked(self, into=None):
+        """Read a chunked body, into a buffer if one is given"""
+        body = into if into is not None else bytearray()
+
+        size = 0
+
+        while True:
+            line = str(self.read_until(b"\r\n"), "latin-1")
+
+            try:
+                chunk = int(line.split(";", 1)[0], 16)
+
+            except ValueError:
+                raise HTTPError(f"Bad chunk size: {line!r}") from None
+
+            if not chunk:
+                break
+
+            if into is None:
+                body.extend(bytes(chunk))
+
+            elif size + chunk > len(into):
+                raise HTTPError("Body larger than the buffer given")
+
+            with memoryview(body) as view:
+                self.read_into(view[size : size + chunk])
+
+            size += chunk
+
+            self.read_until(b"\r\n")
+
+        # Skip the trailer
+        while len(self.read_until(b"\r\n")):
+            pass
+
+        return body if into is None else memoryview(into)[:size]
+
+    def request(
+        self, method: str, target: str, headers=None, body=b"", into=None
+    ) -> Response:
+        """Send a request and read its response.
+
+        'into' is a writable buffer to receive the body, a new one is
+        allocated otherwise.
+        """
+        self.send(method, target, headers, body)
+
+        response = self.read_head()
+
+        # Skip interim responses (100 Continue)
+        while 100 <= response.status < 200:
+            response = self.read_head()
+
+        headers = response.headers
+
+        connection = headers.get("connection", "").lower()
+
+        response.will_close = connection == "close" or (
+            response.version == "HTTP/1.0" and connection != "keep-alive"
+        )
+
+        if method == "HEAD" or response.status in (204, 304):
+            pass
+
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            response.body = self.read_chunked(into)
+
+        elif "content-length" in headers:
+            size = int(headers["content-length"])
+
+            if into is None:
+                into = bytearray(size)
+
+            elif size > len(into):
+                raise HTTPError("Body larger than the buffer given")
+
+            target = memoryview(into)[:size]
+
+            self.read_into(target)
+
+            response.body = target if size < len(into) else into
+
+        else:
+            # The end of the connection delimits the body
+            response.body = self.read_to_close()
+
+            response.will_close = True
+
+        # Nothing is left of this response, reuse the buffer from its start
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return response
+
+
+class ConnectionPool:
+    """Keep-alive connections per host, safe to share between threads"""
+
+    def __init__(
+        self, max_idle=MAX_IDLE, timeout=TIMEOUT, buffer_size=BUFFER_SIZE
+    ):
+        self.max_idle = max_idle  # Idle connections kept per host
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.idle = {}  # Dict, mapping of (scheme, host, port) to connections
+        self.lock = threading.Lock()
+        self.connections_opened = 0  # New connections since the start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def acquire(self, key: tuple) -> tuple:
+        """Return a connection to a host and whether it was reused"""
+        with self.lock:
+            connections = self.idle.get(key)
+
+            if connections:
+                return connections.pop(), True
+
+            self.connections_opened += 1
+
+        scheme, host, port = key
+
+        connection = HTTPConnection(
+            host, port, scheme, self.timeout, self.buffer_size
+        )
+
+        return connection, False
+
+    def release(self, connection: HTTPConnection) -> None:
+        """Keep a connection for the next requests to its host"""
+        with self.lock:
+            connections = self.idle.setdefault(connection.key, [])
+
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+
+                return
+
+        connection.close()
+
+    def request(
+        self, method: str, url: str, headers=None, body=b"", into=None
+    ) -> Response:
+        """Send a request to a URL on a pooled connection"""
+        parts = urlsplit(url)
+
+        if parts.scheme not in DEFAULT_PORTS:
+            raise ValueError(f"Unsupported URL: {url}")
+
+        key = (
+            parts.scheme,
+            parts.hostname,
+            parts.port or DEFAULT_PORTS[parts.scheme],
+        )
+
+        target = parts.path or "/"
+
+        if parts.query:
+            target += "?" + parts.query
+
+        while True:
+            connection, reused = self.acquire(key)
+
+            try:
+                response = connection.request(
+                    method, target, headers, body, into
+                )
+
+            # The server may close an idle connection at any time
+            except (ConnectionError, HTTPError) as error:
+                connection.close()
+
+                if (
+                    reused
+                    and method in IDEMPOTENT_METHODS
+                    and not isinstance(error, HTTPError)
+                ):
+                    continue
+
+                raise
+
+            except BaseException:
+                connection.close()
+
+                raise
+
+            if response.will_close:
+                connection.close()
+
+            else:
+                self.release(connection)
+
+            return response
+
+    def get(self, url: str, headers=None, into=None) -> Response:
+        return self.request("GET", url, headers, into=into)
+
+    def fetch_all(self, urls, workers=MAX_IDLE, headers=None) -> list:
+        """GET many URLs, return their responses or errors in order.
+
+        Each worker thread reuses the pooled connections, so the number of
+        connections to a host stays close to the number of workers.
+        """
+
+        def fetch(url: str):
+            try:
+                return self.get(url, headers)
+
+            except (OSError, ValueError) as error:
+                return error
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch, urls))
+
+    def close(self) -> None:
+        """Close the idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch URLs over HTTP/1.1")
+    parser.add_argument("urls", nargs="+", help="URLs to fetch")
+
+    parser.add_argument(
+        "--workers",
+        action="store",
+        dest="workers",
+        type=int,
+        default=MAX_IDLE,
+        help="Concurrent requests",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        action="store",
+        dest="repeat",
+        type=int,
+        default=1,
+        help="Fetch every URL that many times",
+    )
+
+    parser.add_argument(
+        "--body",
+        action="store_true",
+        dest="body",
+        help="Write the bodies to stdout",
+    )
+
+    given_args = parser.parse_args()
+
+    with ConnectionPool(max_idle=given_args.workers) as pool:
+        urls = given_args.urls * given_args.repeat
+
+        for url, response in zip(
+            urls, pool.fetch_all(urls, given_args.workers)
+        ):
+            if isinstance(response, Exception):
+                print(f"{url}: {response}", file=sys.stderr)
+
+            elif given_args.body:
+                sys.stdout.buffer.write(response.body)
+
+            else:
+                print(
+                    f"{url}: {response.status} {response.reason}, "
+                    f"{len(response.body)} bytes"
+                )
+
+        print(
+            f"{len(urls)} requests, "
+            f"{pool.connections_opened} connections opened",
+            file=sys.stderr,
+        )
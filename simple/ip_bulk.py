@@ -0,0 +1,297 @@
+"""
+Bulk conversion of IPv4 and IPv6 addresses and a CIDR index.
+
+Addresses are converted a whole list at a time: inet_pton() is mapped over
+the list and the packed addresses are joined into one buffer, read as an
+array of unsigned 32-bit integers (IPv4) or of 16-byte records (IPv6), so
+no Python code runs per address. With NumPy the buffers become NumPy
+arrays instead.
+
+CIDRIndex answers "which network owns this address" for a whole array:
+the networks are flattened into sorted disjoint intervals, each owned by
+its most specific network, and every address is located with a binary
+search (bisect, or numpy.searchsorted).
+
+    index = CIDRIndex(["10.0.0.0/8", "10.1.0.0/16", "2001:db8::/32"])
+    owners = index.lookup_ipv4(ipv4_to_ints(addresses))
+"""
+import argparse
+import array
+import bisect
+import ipaddress
+import socket
+import struct
+import sys
+from collections import Counter
+from functools import partial
+from itertools import starmap
+
+try:
+    import numpy  # Vectorized arrays, optional
+
+except ImportError:
+    numpy = None
+
+# Type code of the unsigned 32-bit arrays
+UINT32 = "I" if array.array("I").itemsize == 4 else "L"
+
+# Type code of the network indexes, -1 when no network owns an address
+INDEX = "q"
+
+inet_pton4 = partial(socket.inet_pton, socket.AF_INET)
+inet_pton6 = partial(socket.inet_pton, socket.AF_INET6)
+inet_ntop6 = partial(socket.inet_ntop, socket.AF_INET6)
+int_from_bytes = partial(int.from_bytes, byteorder="big")
+int_to_bytes16 = partial(int.to_bytes, length=16, byteorder="big")
+
+
+def require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for NumPy arrays")
+
+    return numpy
+
+
+def is_numpy_array(values) -> bool:
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
+def pack_ipv4(addresses) -> bytes:
+    """Return IPv4 addresses as consecutive 4-byte network order records"""
+    return b"".join(map(inet_pton4, addresses))
+
+
+def pack_ipv6(addresses) -> bytes:
+    """Return IPv6 addresses as consecutive 16-byte network order records"""
+    return b"".join(map(inet_pton6, addresses))
+
+
+def ipv4_to_ints(addresses, as_numpy=False):
+    """Return IPv4 addresses as an array of unsigned 32-bit integers"""
+    packed = pack_ipv4(addresses)
+
+    if as_numpy:
+        # Read as big-endian, converted to the native order at once
+        return require_numpy().frombuffer(packed, ">u4").astype(numpy.uint32)
+
+    values = array.array(UINT32, packed)
+
+    if sys.byteorder == "little":
+        values.byteswap()
+
+    return values
+
+
+def ints_to_ipv4(values) -> list:
+    """Return the text of an array of IPv4 integers"""
+    if is_numpy_array(values):
+        packed = values.astype(">u4").tobytes()
+
+    else:
+        network = array.array(UINT32, values)
+
+        if sys.byteorder == "little":
+            network.byteswap()
+
+        packed = network.tobytes()
+
+    return list(starmap(socket.inet_ntoa, struct.iter_unpack("4s", packed)))
+
+
+def ipv6_to_ints(addresses, as_numpy=False):
+    """Return IPv6 addresses as 128-bit integers.
+
+    A NumPy array holds them as 16-byte big-endian records ("S16"), which
+    sort like the integers.
+    """
+    packed = pack_ipv6(addresses)
+
+    if as_numpy:
+        return require_numpy().frombuffer(packed, "S16")
+
+    return list(starmap(int_from_bytes, struct.iter_unpack("16s", packed)))
+
+
+def ints_to_ipv6(values) -> list:
+    """Return the text of IPv6 integers"""
+    if is_numpy_array(values):
+        packed = values.astype("S16").tobytes()
+
+    else:
+        packed = b"".join(map(int_to_bytes16, values))
+
+    return list(starmap(inet_ntop6, struct.iter_unpack("16s", packed)))
+
+
+class CIDRIndex:
+    """Longest-prefix match of addresses against a set of networks"""
+
+    def __init__(self, networks):
+        self.networks = [
+            ipaddress.ip_network(network, strict=False) for network in networks
+        ]
+
+        # Sorted interval starts and the network owning each interval, the
+        # owners start with -1 for the addresses below the first interval
+        self.starts = {}
+        self.owners = {}
+
+        for version, size in ((4, 32), (6, 128)):
+            self.starts[version], self.owners[version] = self.flatten(
+                version, 2**size
+            )
+
+        self.numpy_tables = {}  # NumPy copies of the tables, once used
+
+    def flatten(self, version: int, limit: int) -> tuple:
+        """Return the disjoint intervals of the networks of an IP version"""
+        # Networks are nested or disjoint, outer networks come first
+        spans = sorted(
+            (
+                (int(net.network_address), int(net.broadcast_address), i)
+                for i, net in enumerate(self.networks)
+                if net.version == version
+            ),
+            key=lambda span: (span[0], -span[1]),
+        )
+
+        starts, owners = [], [-1]
+
+        def owned(start: int, owner: int) -> None:
+            """Give the addresses from start on to a network, -1 for none"""
+            if start >= limit:
+                return
+
+            if starts and starts[-1] == start:
+                owners[-1] = owner
+
+            elif owners[-1] != owner:
+                starts.append(start)
+
+                owners.append(owner)
+
+        enclosing = []  # Stack of the networks holding the current one
+
+        for first, last, owner in spans:
+            while enclosing and enclosing[-1][1] < first:
+                closed = enclosing.pop()
+
+                owned(closed[1] + 1, enclosing[-1][2] if enclosing else -1)
+
+            enclosing.append((first, last, owner))
+
+            owned(first, owner)
+
+        while enclosing:
+            closed = enclosing.pop()
+
+            owned(closed[1] + 1, enclosing[-1][2] if enclosing else -1)
+
+        return starts, owners
+
+    def numpy_table(self, version: int) -> tuple:
+        """Return the interval starts and owners as NumPy arrays"""
+        table = self.numpy_tables.get(version)
+
+        if table is None:
+            starts = self.starts[version]
+
+            if version == 4:
+                starts = numpy.array(starts, dtype=numpy.uint32)
+
+            else:
+                starts = numpy.array(
+                    [int_to_bytes16(start) for start in starts], dtype="S16"
+                )
+
+            table = self.numpy_tables[version] = (
+                starts,
+                numpy.array(self.owners[version], dtype=numpy.int64),
+            )
+
+        return table
+
+    def lookup_ints(self, version: int, values):
+        """Return the index of the network owning each address, -1 if none"""
+        if is_numpy_array(values):
+            starts, owners = self.numpy_table(version)
+
+            return owners[numpy.searchsorted(starts, values, side="right")]
+
+        owners = self.owners[version]
+
+        return array.array(
+            INDEX,
+            map(
+                owners.__getitem__,
+                map(partial(bisect.bisect_right, self.starts[version]), values),
+            ),
+        )
+
+    def lookup_ipv4(self, values):
+        """Return the owners of IPv4 integers, see ipv4_to_ints()"""
+        return self.lookup_ints(4, values)
+
+    def lookup_ipv6(self, values):
+        """Return the owners of IPv6 integers, see ipv6_to_ints()"""
+        return self.lookup_ints(6, values)
+
+    def lookup(self, addresses) -> list:
+        """Return the network owning each address in text form, or None"""
+        addresses = list(addresses)
+
+        owners = array.array(INDEX, [-1]) * len(addresses)
+
+        ipv6 = [i for i, address in enumerate(addresses) if ":" in address]
+
+        if not ipv6:
+            owners = self.lookup_ipv4(ipv4_to_ints(addresses))
+
+        else:
+            ipv6_set = set(ipv6)
+
+            ipv4 = [i for i in range(len(addresses)) if i not in ipv6_set]
+
+            for positions, version, convert in (
+                (ipv4, 4, ipv4_to_ints),
+                (ipv6, 6, ipv6_to_ints),
+            ):
+                found = self.lookup_ints(
+                    version, convert([addresses[i] for i in positions])
+                )
+
+                for position, owner in zip(positions, found):
+                    owners[position] = owner
+
+        return [self.networks[i] if i >= 0 else None for i in owners]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Count the addresses of a log per network"
+    )
+    parser.add_argument("networks", nargs="+", help="Networks in CIDR notation")
+
+    parser.add_argument(
+        "--file",
+        action="store",
+        dest="file",
+        default=None,
+        help="Log with an address at the start of each line, stdin if unset",
+    )
+
+    given_args = parser.parse_args()
+
+    index = CIDRIndex(given_args.networks)
+
+    log = open(given_args.file) if given_args.file else sys.stdin
+
+    with log:
+        addresses = [line.split(None, 1)[0] for line in log if line.strip()]
+
+    counts = Counter(index.lookup(addresses))
+
+    for network in index.networks:
+        print(f"{network}: {counts[network]}")
+
+    print(f"Other: {counts[None]}")
@@ -1,15 +1,18 @@
 import socket
 
+from dns_resolver import Resolver
 
-def print_machine_info() -> None:
+
+def print_machine_info(resolver: Resolver) -> None:
     """
     Retrieve a local machine's hostname and IP address
     """
     host_name = socket.gethostname()
-    ip_address = socket.gethostbyname(host_name)
+    ip_address = resolver.gethostbyname(host_name)
 
     print(f"Host name: {host_name}")
     print(f"IP address: {ip_address}")
 
 
-print_machine_info()
+with Resolver() as machine_resolver:
+    print_machine_info(machine_resolver)
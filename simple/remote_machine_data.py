@@ -1,20 +1,19 @@
-import socket
+from dns_resolver import Resolver
 
 remote_host = "www.python.org"
 # remote_host = 'SEGmbu'
 
 
-def get_remote_machine_info(host: str) -> None:
+def get_remote_machine_info(host: str, resolver: Resolver) -> None:
     """
     Retrieve a remote machine's hostname and IP address
     """
     try:
-        print(
-            f"IP address of {remote_host}: {socket.gethostbyname(remote_host)}"
-        )
+        print(f"IP address of {host}: {resolver.gethostbyname(host)}")
 
     except OSError as e:
         print(f"Error: {e}")
 
 
-get_remote_machine_info(remote_host)
+with Resolver() as remote_resolver:
+    get_remote_machine_info(remote_host, remote_resolver)
@@ -0,0 +1,173 @@
+"""
+Port and service name lookups from a table loaded once.
+
+socket.getservbyport() and getservbyname() read the services database
+through libc on every call. ServiceRegistry reads /etc/services on first
+use into two dicts, (port, protocol) to name and (name, protocol) to
+port, so a lookup is a dict access, and whole lists of ports or names
+(port scans, log lines) are looked up in one call. Entries missing from
+the file are asked to libc once, other databases may know them, and the
+answer is kept as well.
+
+    registry = ServiceRegistry()
+    registry.name_of(443)  # "https"
+    registry.names_of([22, 25, 53], "udp")
+    registry.port_of("domain", "udp")  # 53
+"""
+import argparse
+import socket
+import threading
+
+SERVICES_PATH = "/etc/services"
+
+
+class ServiceRegistry:
+    """Services database loaded on first use"""
+
+    def __init__(self, path=SERVICES_PATH):
+        self.path = path
+        self.by_port = None  # Dict, mapping of (port, protocol) to names
+        self.by_name = None  # Dict, mapping of (name, protocol) to ports
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """Read the services file, first entries win as in libc"""
+        with self.lock:
+            if self.by_port is not None:
+                return
+
+            by_port, by_name = {}, {}
+
+            try:
+                with open(self.path) as services:
+                    for line in services:
+                        fields = line.split("#", 1)[0].split()
+
+                        if len(fields) < 2:
+                            continue
+
+                        name, port_protocol, *aliases = fields
+
+                        port, _, protocol = port_protocol.partition("/")
+
+                        try:
+                            port = int(port)
+
+                        except ValueError:
+                            continue
+
+                        by_port.setdefault((port, protocol), name)
+
+                        for alias in (name, *aliases):
+                            by_name.setdefault((alias, protocol), port)
+
+            # Without the file every lookup is asked to libc
+            except OSError:
+                pass
+
+            self.by_name = by_name
+            self.by_port = by_port
+
+    def name_of(self, port: int, protocol="tcp", default=None):
+        """Return the service name of a port, default if unknown"""
+        if self.by_port is None:
+            self.load()
+
+        key = (port, protocol)
+
+        try:
+            name = self.by_port[key]
+
+        except KeyError:
+            try:
+                name = socket.getservbyport(port, protocol)
+
+            except (OSError, OverflowError):
+                name = None
+
+            self.by_port[key] = name
+
+        return default if name is None else name
+
+    def port_of(self, name: str, protocol="tcp", default=None):
+        """Return the port of a service name, default if unknown"""
+        if self.by_name is None:
+            self.load()
+
+        key = (name, protocol)
+
+        try:
+            port = self.by_name[key]
+
+        except KeyError:
+            try:
+                port = socket.getservbyname(name, protocol)
+
+            except OSError:
+                port = None
+
+            self.by_name[key] = port
+
+        return default if port is None else port
+
+    def names_of(self, ports, protocol="tcp", default=None) -> list:
+        """Return the service names of many ports"""
+        if self.by_port is None:
+            self.load()
+
+        by_port = self.by_port
+
+        # Known ports are dict lookups, only the others call name_of()
+        return [
+            by_port.get((port, protocol))
+            or self.name_of(port, protocol, default)
+            for port in ports
+        ]
+
+    def ports_of(self, names, protocol="tcp", default=None) -> list:
+        """Return the ports of many service names"""
+        if self.by_name is None:
+            self.load()
+
+        by_name = self.by_name
+
+        return [
+            by_name[name, protocol]
+            if by_name.get((name, protocol)) is not None
+            else self.port_of(name, protocol, default)
+            for name in names
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look up ports and services")
+    parser.add_argument(
+        "services",
+        nargs="+",
+        help="Ports or service names, with an optional /protocol (tcp)",
+    )
+
+    parser.add_argument(
+        "--file",
+        action="store",
+        dest="file",
+        default=SERVICES_PATH,
+        help="Services database",
+    )
+
+    given_args = parser.parse_args()
+
+    registry = ServiceRegistry(given_args.file)
+
+    for service in given_args.services:
+        value, _, protocol = service.partition("/")
+
+        protocol = protocol or "tcp"
+
+        if value.isdigit():
+            print(
+                f"{value}/{protocol}: {registry.name_of(int(value), protocol)}"
+            )
+
+        else:
+            print(f"{value}/{protocol}: {registry.port_of(value, protocol)}")
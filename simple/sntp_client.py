@@ -1,3 +1,7 @@
+"""
+Print the time of an SNTP server, see sntp_engine.py to query many servers
+at once and estimate the offset of the local clock.
+"""
 import socket
 import struct
 import time
@@ -6,6 +10,9 @@ import time
 def sntp_client(ntp_server: str, stp_port: int) -> None:
     client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
+    # A lost datagram is not sent again, do not wait forever for the reply
+    client.settimeout(TIMEOUT)
+
     data = "\x1b" + 47 * "\0"
 
     client.sendto(data.encode("utf-8"), (ntp_server, stp_port))
@@ -24,5 +31,6 @@ def sntp_client(ntp_server: str, stp_port: int) -> None:
 
 NTP_SERVER = "0.uk.pool.ntp.org"
 TIME1970 = 2208988800
+TIMEOUT = 5.0
 
 sntp_client(NTP_SERVER, 123)
@@ -0,0 +1,419 @@
+"""
+Query many SNTP/NTP servers at once and estimate the clock offset.
+
+Requests to every server leave from one non-blocking UDP socket (one per
+address family) without waiting for the replies. A server copies the
+transmit timestamp of a request into the originate timestamp of its
+reply, which identifies the request the reply answers.
+
+With the four timestamps of an exchange, T1 (request sent, local clock),
+T2 (request received, server clock), T3 (reply sent, server clock) and T4
+(reply received, local clock):
+
+    offset = ((T2 - T1) + (T3 - T4)) / 2
+    delay = (T4 - T1) - (T3 - T2)
+
+Every server is sent a few requests; the sample with the smallest delay
+is the least disturbed by queuing, its offset is kept. The offset of the
+local clock is the median of the offsets of the servers, so a server with
+a wrong clock does not move it.
+"""
+import argparse
+import select
+import socket
+import statistics
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+NTP_PORT = 123
+
+# Seconds from 1900 (NTP era 0) to 1970 (Unix epoch)
+TIME1970 = 2208988800
+
+# Flags, stratum, poll, precision, root delay, root dispersion, reference
+# id, then the reference, originate, receive and transmit timestamps
+NTP_PACKET = struct.Struct("!BBbbIII4Q")
+
+NTP_VERSION = 4
+CLIENT_MODE = 3
+SERVER_MODES = (4, 5)  # Server and broadcast
+LEAP_UNSYNCHRONIZED = 3
+
+# Requests per server, seconds between them and seconds to wait for replies
+SAMPLES = 4
+INTERVAL = 0.05
+TIMEOUT = 2.0
+
+DEFAULT_SERVERS = ("0.pool.ntp.org", "1.pool.ntp.org", "2.pool.ntp.org")
+
+
+def to_ntp(timestamp: float) -> int:
+    """Return the 64-bit NTP timestamp of a Unix time"""
+    return int((timestamp + TIME1970) * 2**32) & 0xFFFFFFFFFFFFFFFF
+
+
+def from_ntp(value: int) -> float:
+    """Return the Unix time of a 64-bit NTP timestamp"""
+    return value / 2**32 - TIME1970
+
+
+class Clock:
+    """Wall clock read through the performance counter.
+
+    It keeps the resolution of perf_counter() and does not step while
+    the samples are taken.
+    """
+
+    def __init__(self):
+        self.base = time.time() - time.perf_counter()
+
+    def __call__(self) -> float:
+        return self.base + time.perf_counter()
+
+
+class Sample:
+    """Offset and round-trip delay measured by one exchange"""
+
+    __slots__ = ("offset", "delay", "stratum")
+
+    def __init__(self, offset: float, delay: float, stratum: int):
+        self.offset = offset  # Seconds to add to the local clock
+        self.delay = delay  # Round-trip delay, seconds
+        self.stratum = stratum
+
+
+class ServerResult:
+    """Samples of one server"""
+
+    def __init__(self, server: str, port=NTP_PORT):
+        self.server = server
+        self.port = port
+        self.address = None  # Socket address, once resolved
+        self.samples = []  # Samples of the replies received
+        self.error = None  # Last error, if any
+
+    @property
+    def best(self) -> Sample:
+        """Return the sample of the smallest delay, None without any"""
+        return min(self.samples, key=lambda sample: sample.delay, default=None)
+
+
+def parse_server(server: str) -> tuple:
+    """Return the host and the port of 'host' or 'host:port'"""
+    host, sep, port = server.rpartition(":")
+
+    # A bare IPv6 address has colons too
+    if not sep or ":" in host and not host.startswith("["):
+        return server, NTP_PORT
+
+    try:
+        return host.strip("[]"), int(port)
+
+    except ValueError:
+        raise ValueError(f"Invalid port in {server!r}") from None
+
+
+def resolve(result: ServerResult) -> None:
+    """Find the address of a server, or record why it cannot be used"""
+    try:
+        host, result.port = parse_server(result.server)
+
+        family, _, _, _, address = socket.getaddrinfo(
+            host, result.port, type=socket.SOCK_DGRAM
+        )[0]
+
+        result.address = family, address
+
+    except (OSError, UnicodeError, ValueError) as error:
+        result.error = error
+
+
+def parse_reply(data: bytes) -> tuple:
+    """Return the stratum and the originate, receive and transmit timestamps.
+
+    ValueError is raised for a reply that cannot be used.
+    """
+    if len(data) < NTP_PACKET.size:
+        raise ValueError("Short reply")
+
+    (
+        flags,
+        stratum,
+        _,
+        _,
+        _,
+        _,
+        reference_id,
+        _,
+        originate,
+        received,
+        transmitted,
+    ) = NTP_PACKET.unpack_from(data)
+
+    if flags & 7 not in SERVER_MODES:
+        raise ValueError(f"Not a server reply (mode {flags & 7})")
+
+    if flags >> 6 == LEAP_UNSYNCHRONIZED:
+        raise ValueError("Server clock not synchronized")
+
+    # Kiss-o'-Death: the server asks to slow down or to go away
+    if not stratum:
+        raise ValueError(
+            "Kiss-o'-Death "
+            + struct.pack("!I", reference_id).decode("ascii", "replace")
+        )
+
+    if not transmitted:
+        raise ValueError("Reply without transmit timestamp")
+
+    return stratum, originate, received, transmitted
+
+
+def originate_of(buffer: bytearray, size: int):
+    """Return the originate timestamp of a reply, None if too short"""
+    if size < NTP_PACKET.size:
+        return None
+
+    return NTP_PACKET.unpack_from(buffer)[8]
+
+
+class SNTPEngine:
+    """Concurrent SNTP queries from non-blocking sockets"""
+
+    def __init__(
+        self, samples=SAMPLES, interval=INTERVAL, timeout=TIMEOUT, clock=None
+    ):
+        self.samples = samples  # Requests per server
+        self.interval = interval  # Seconds between two requests to a server
+        self.timeout = timeout  # Seconds to wait for the last replies
+        self.clock = clock if clock is not None else Clock()
+        self.outstanding = {}  # Dict, originate timestamp to (result, T1)
+        self.sockets = {}  # Dict, mapping of address families to sockets
+
+    def get_socket(self, family: int) -> socket.socket:
+        """Return the socket of an address family, created on first use"""
+        sock = self.sockets.get(family)
+
+        if sock is None:
+            sock = self.sockets[family] = socket.socket(
+                family, socket.SOCK_DGRAM
+            )
+
+            sock.setblocking(False)
+
+        return sock
+
+    def send(self, result: ServerResult) -> None:
+        """Send a request to a server"""
+        family, address = result.address
+
+        t1 = self.clock()
+
+        transmit = to_ntp(t1)
+
+        # The transmit timestamp identifies the request, keep it unique
+        while transmit in self.outstanding:
+            transmit += 1
+
+        request = NTP_PACKET.pack(
+            NTP_VERSION << 3 | CLIENT_MODE, 0, 0, 0, 0, 0, 0, 0, 0, 0, transmit
+        )
+
+        try:
+            self.get_socket(family).sendto(request, address)
+
+        except OSError as error:
+            result.error = error
+
+            return
+
+        self.outstanding[transmit] = result, from_ntp(transmit)
+
+    def receive(self, sock: socket.socket) -> None:
+        """Read the replies waiting on a socket"""
+        buffer = bytearray(NTP_PACKET.size * 2)
+
+        while True:
+            try:
+                size, address = sock.recvfrom_into(buffer)
+
+            except BlockingIOError:
+                return
+
+            # ICMP errors of earlier requests are reported on the socket
+            except OSError:
+                continue
+
+            t4 = self.clock()
+
+            try:
+                stratum, originate, received, transmitted = parse_reply(
+                    bytes(buffer[:size])
+                )
+
+            except ValueError as error:
+                self.reject(address, originate_of(buffer, size), error)
+
+                continue
+
+            entry = self.outstanding.get(originate)
+
+            # Replies must answer a request, from the server it was sent to
+            if entry is None or entry[0].address[1][:2] != address[:2]:
+                continue
+
+            del self.outstanding[originate]
+
+            result, t1 = entry
+
+            t2, t3 = from_ntp(received), from_ntp(transmitted)
+
+            result.samples.append(
+                Sample(
+                    ((t2 - t1) + (t3 - t4)) / 2,
+                    (t4 - t1) - (t3 - t2),
+                    stratum,
+                )
+            )
+
+    def reject(self, address: tuple, originate, error: Exception) -> None:
+        """Record the error of an unusable reply to a request"""
+        entry = self.outstanding.get(originate)
+
+        if entry is not None and entry[0].address[1][:2] == address[:2]:
+            del self.outstanding[originate]
+
+            entry[0].error = error
+
+    def query(self, servers) -> list:
+        """Query servers, return a ServerResult per server"""
+        results = [ServerResult(server) for server in servers]
+
+        # Resolve the names concurrently, lookups block
+        with ThreadPoolExecutor(max_workers=min(16, len(results) or 1)) as ex:
+            list(ex.map(resolve, results))
+
+        reachable = [result for result in results if result.address]
+
+        start = self.clock()
+
+        # Requests of all the servers go first, then the next round
+        schedule = [
+            (start + i * self.interval, result)
+            for i in range(self.samples)
+            for result in reachable
+        ]
+
+        deadline = schedule[-1][0] + self.timeout if schedule else start
+
+        sent = 0
+
+        try:
+            while True:
+                now = self.clock()
+
+                while sent < len(schedule) and schedule[sent][0] <= now:
+                    self.send(schedule[sent][1])
+
+                    sent += 1
+
+                if now >= deadline or (
+                    sent == len(schedule) and not self.outstanding
+                ):
+                    break
+
+                wait = deadline - now
+
+                if sent < len(schedule):
+                    wait = min(wait, schedule[sent][0] - now)
+
+                readable, _, _ = select.select(
+                    list(self.sockets.values()), [], [], max(wait, 0.0)
+                )
+
+                for sock in readable:
+                    self.receive(sock)
+
+        finally:
+            self.close()
+
+        for result in reachable:
+            if not result.samples and result.error is None:
+                result.error = TimeoutError("No reply")
+
+        return results
+
+    def close(self) -> None:
+        for sock in self.sockets.values():
+            sock.close()
+
+        self.sockets.clear()
+
+        self.outstanding.clear()
+
+
+def clock_offset(results) -> float:
+    """Return the median offset of the best samples, None without any"""
+    offsets = [result.best.offset for result in results if result.samples]
+
+    return statistics.median(offsets) if offsets else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate the clock offset from several NTP servers"
+    )
+    parser.add_argument(
+        "servers",
+        nargs="*",
+        default=DEFAULT_SERVERS,
+        help="Servers as host or host:port",
+    )
+
+    parser.add_argument(
+        "--samples",
+        action="store",
+        dest="samples",
+        type=int,
+        default=SAMPLES,
+        help="Requests per server",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        action="store",
+        dest="timeout",
+        type=float,
+        default=TIMEOUT,
+        help="Seconds to wait for the replies",
+    )
+
+    given_args = parser.parse_args()
+
+    engine = SNTPEngine(samples=given_args.samples, timeout=given_args.timeout)
+
+    results = engine.query(given_args.servers)
+
+    for result in results:
+        best = result.best
+
+        if best is None:
+            print(f"{result.server}: {result.error}")
+
+        else:
+            print(
+                f"{result.server} ({result.address[1][0]}): "
+                f"stratum {best.stratum}, "
+                f"offset {best.offset * 1000:+.3f} ms, "
+                f"delay {best.delay * 1000:.3f} ms, "
+                f"{len(result.samples)}/{given_args.samples} replies"
+            )
+
+    offset = clock_offset(results)
+
+    if offset is None:
+        print("No server replied")
+
+    else:
+        print(f"Clock offset: {offset * 1000:+.3f} ms")
@@ -1,5 +1,8 @@
 """
 Create a few try-except code blocks and put one potential error type in each block.
+
+The page is fetched on a fresh connection closed after the response, see
+http_client.py to fetch many pages over reused keep-alive connections.
 """
 import sys
 import socket
@@ -51,9 +54,15 @@ def connect_socket(
 
 
 # Sending data
-def send_data_to_socket(my_socket: socket.socket, filename: str) -> None:
+def send_data_to_socket(
+    my_socket: socket.socket, host_name: str, filename: str
+) -> None:
     try:
-        msg = f"GET {filename} HTTP/1.0\r\n\r\n"
+        msg = (
+            f"GET {filename} HTTP/1.1\r\n"
+            f"Host: {host_name}\r\n"
+            "Connection: close\r\n\r\n"
+        )
         my_socket.sendall(msg.encode("utf-8"))
 
     except OSError as error:
@@ -75,13 +84,14 @@ def receive_data_from_socket(my_socket: socket, chunk_size: int) -> None:
         if not len(buf):
             break
 
-        # write the received data
-        sys.stdout.write(buf.decode("utf-8"))
+        # write the received data, a chunk may end inside a UTF-8 character
+        sys.stdout.buffer.write(buf)
 
 
 chunk_size = 2048
 local_host = "localhost"
 local_port = 8080
+local_file = "/"
 
 created_socket = create_socket()
 
@@ -89,4 +99,6 @@ connect_socket(
     created_socket, local_host, local_port
 )  # :TODO: connection refused error
 
+send_data_to_socket(created_socket, local_host, local_file)
+
 receive_data_from_socket(created_socket, chunk_size)
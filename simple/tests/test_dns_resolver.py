@@ -0,0 +1,132 @@
+"""Resolver cache against a hosts file"""
+import socket
+
+import pytest
+
+from dns_resolver import HostsFile, Resolver
+
+HOSTS = """\
+# Test hosts
+127.0.0.1   localhost
+10.0.0.1    alpha.test alpha
+10.0.0.2    beta.test
+fd00::3     gamma.test
+"""
+
+
+class FakeClock:
+    """Clock moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingHostsFile(HostsFile):
+    """HostsFile counting the lookups it answers"""
+
+    def __init__(self, path):
+        super().__init__(path)
+
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+
+        return super().__call__(*args, **kwargs)
+
+
+@pytest.fixture
+def hosts(tmp_path):
+    path = tmp_path / "hosts"
+    path.write_text(HOSTS)
+
+    return CountingHostsFile(str(path))
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def resolver(hosts, clock):
+    with Resolver(
+        ttl=60, negative_ttl=5, getaddrinfo=hosts, clock=clock
+    ) as resolver:
+        yield resolver
+
+
+def test_hosts_file(hosts):
+    assert hosts("ALPHA", 80, type=socket.SOCK_STREAM) == [
+        (
+            socket.AF_INET,
+            socket.SOCK_STREAM,
+            socket.IPPROTO_TCP,
+            "",
+            ("10.0.0.1", 80),
+        )
+    ]
+
+    assert hosts("gamma.test", 53, type=socket.SOCK_DGRAM)[0][4] == (
+        "fd00::3",
+        53,
+        0,
+        0,
+    )
+
+    with pytest.raises(socket.gaierror):
+        hosts("gamma.test", 53, family=socket.AF_INET)
+
+
+def test_answer_expiry(resolver, hosts, clock):
+    assert resolver.gethostbyname("alpha.test") == "10.0.0.1"
+
+    clock.now += 59
+
+    assert resolver.gethostbyname("alpha.test") == "10.0.0.1"
+    assert (hosts.calls, resolver.hits, resolver.misses) == (1, 1, 1)
+
+    # The answer expired, the name is looked up again
+    clock.now += 2
+
+    assert resolver.gethostbyname("alpha.test") == "10.0.0.1"
+    assert (hosts.calls, resolver.hits, resolver.misses) == (2, 1, 2)
+
+
+def test_negative_answer_expiry(resolver, hosts, clock):
+    for _ in range(3):
+        with pytest.raises(socket.gaierror):
+            resolver.resolve("missing.test")
+
+    assert (hosts.calls, resolver.hits, resolver.misses) == (1, 2, 1)
+
+    # Unknown names are kept for negative_ttl only
+    clock.now += 6
+
+    with pytest.raises(socket.gaierror):
+        resolver.resolve("missing.test")
+
+    assert hosts.calls == 2
+
+
+def test_lru_eviction(hosts, clock):
+    with Resolver(max_entries=2, getaddrinfo=hosts, clock=clock) as resolver:
+        for host in ("alpha.test", "beta.test", "alpha.test", "localhost"):
+            resolver.resolve(host)
+
+        # beta.test was the least recently used, it was evicted
+        resolver.resolve("alpha.test")
+        resolver.resolve("beta.test")
+
+    assert hosts.calls == 4
+
+
+def test_resolve_all(resolver):
+    results = resolver.resolve_all(["alpha", "beta.test", "missing.test"])
+
+    assert results["alpha"][0][4] == ("10.0.0.1", 0)
+    assert results["beta.test"][0][4] == ("10.0.0.2", 0)
+    assert isinstance(results["missing.test"], socket.gaierror)
@@ -0,0 +1,93 @@
+"""HTTPConnection and ConnectionPool against a local http.server"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import ConnectionPool
+
+BODY = b"Hello, keep-alive"
+CHUNKS = (b"first chunk, ", b"second chunk, ", b"last chunk")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # A handler serves one connection
+        self.server.connections += 1
+
+        super().setup()
+
+    def do_GET(self):
+        self.send_response(200)
+
+        if self.path == "/chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            for chunk in CHUNKS:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+
+            self.wfile.write(b"0\r\n\r\n")
+
+        else:
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.connections = 0  # Connections accepted
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield httpd
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(server, path: str) -> str:
+    return "http://%s:%d%s" % (*server.server_address, path)
+
+
+def test_keep_alive_reuses_the_connection(server):
+    with ConnectionPool() as pool:
+        for _ in range(5):
+            response = pool.get(url(server, "/fixed"))
+
+            assert response.status == 200
+            assert bytes(response.body) == BODY
+
+        assert pool.connections_opened == 1
+
+    assert server.connections == 1
+
+
+def test_chunked_body(server):
+    with ConnectionPool() as pool:
+        response = pool.get(url(server, "/chunked"))
+
+        assert bytes(response.body) == b"".join(CHUNKS)
+
+        # The connection is still usable after the chunked body
+        assert bytes(pool.get(url(server, "/fixed")).body) == BODY
+
+        assert pool.connections_opened == 1
+
+
+def test_chunked_body_into_a_buffer(server):
+    buffer = bytearray(1024)
+
+    with ConnectionPool() as pool:
+        response = pool.get(url(server, "/chunked"), into=buffer)
+
+    assert bytes(response.body) == b"".join(CHUNKS)
+    assert buffer.startswith(b"".join(CHUNKS))
@@ -0,0 +1,137 @@
+"""SNTPEngine against a fake UDP responder"""
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from sntp_engine import NTP_PACKET, SNTPEngine, clock_offset, to_ntp
+
+# Seconds the fake server clock is ahead
+SERVER_OFFSET = 10.0
+
+
+class Responder(threading.Thread):
+    """NTP server on localhost: answers, sends Kiss-o'-Death or is silent"""
+
+    def __init__(self, mode: str):
+        super().__init__(daemon=True)
+
+        self.mode = mode  # "reply", "kiss" or "silent"
+        self.requests = 0  # Requests received
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.1)
+        self.running = True
+
+    @property
+    def server(self) -> str:
+        return "%s:%d" % self.sock.getsockname()
+
+    def run(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(1024)
+
+            except socket.timeout:
+                continue
+
+            self.requests += 1
+
+            if self.mode == "silent":
+                continue
+
+            now = to_ntp(time.time() + SERVER_OFFSET)
+
+            stratum, reference_id = (
+                (0, struct.unpack("!I", b"RATE")[0])
+                if self.mode == "kiss"
+                else (2, 0)
+            )
+
+            # The client transmit timestamp comes back as originate
+            reply = NTP_PACKET.pack(
+                4 << 3 | 4,
+                stratum,
+                0,
+                0,
+                0,
+                0,
+                reference_id,
+                0,
+                NTP_PACKET.unpack(data)[10],
+                now,
+                now,
+            )
+
+            self.sock.sendto(reply, address)
+
+    def stop(self):
+        self.running = False
+
+        self.join()
+
+        self.sock.close()
+
+
+@pytest.fixture
+def responder(request):
+    responder = Responder(request.param)
+    responder.start()
+
+    yield responder
+
+    responder.stop()
+
+
+@pytest.mark.parametrize("responder", ["reply"], indirect=True)
+def test_offset(responder):
+    results = SNTPEngine(samples=2, timeout=1.0).query([responder.server])
+
+    assert results[0].error is None
+    assert len(results[0].samples) == 2
+    assert clock_offset(results) == pytest.approx(SERVER_OFFSET, abs=0.5)
+
+
+@pytest.mark.parametrize("responder", ["silent"], indirect=True)
+def test_timeout(responder):
+    start = time.monotonic()
+
+    results = SNTPEngine(samples=2, timeout=0.3).query([responder.server])
+
+    assert isinstance(results[0].error, TimeoutError)
+    assert not results[0].samples
+    assert clock_offset(results) is None
+
+    # The engine gave up after the timeout, not before
+    assert 0.3 <= time.monotonic() - start < 2.0
+    assert responder.requests == 2
+
+
+@pytest.mark.parametrize("responder", ["kiss"], indirect=True)
+def test_kiss_of_death(responder):
+    results = SNTPEngine(samples=2, timeout=1.0).query([responder.server])
+
+    assert isinstance(results[0].error, ValueError)
+    assert str(results[0].error) == "Kiss-o'-Death RATE"
+    assert not results[0].samples
+    assert clock_offset(results) is None
+
+
+@pytest.mark.parametrize("responder", ["reply"], indirect=True)
+def test_one_server_down(responder):
+    silent = Responder("silent")
+    silent.start()
+
+    try:
+        results = SNTPEngine(samples=1, timeout=0.3).query(
+            [responder.server, silent.server]
+        )
+
+    finally:
+        silent.stop()
+
+    assert results[0].error is None
+    assert isinstance(results[1].error, TimeoutError)
+    assert clock_offset(results) == pytest.approx(SERVER_OFFSET, abs=0.5)